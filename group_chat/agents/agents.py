@@ -1,9 +1,22 @@
 import os
 import autogen
-import re
 
+from typing import NamedTuple
 from dotenv import load_dotenv
 
+from agents.async_replies import count_async_replies_once
+from agents.cascade import ModelCascade
+from agents.http_client import shared_http_client
+from agents.llm_cache import completion_cache_for
+from agents.parsing import (
+    Evaluation, ReviewScores, RevisedAnswer, cannot_answer, format_instructions, reply_scores, score_above,
+    structured_llm_config,
+)
+from agents.pool import AgentPool
+from agents.scheduler import schedule_agent
+from services.metrics import instrument_agent
+from services.tracing import trace_agent
+
 load_dotenv()
 
 # LLM model configuration
@@ -11,117 +24,169 @@ config_list = [
     {
         "model": "gpt-4o",
         "api_key": os.getenv("OPENAI_API_KEY"),
+        # One pooled client for every agent, so the connections to the backend are kept alive and reused
+        "http_client": shared_http_client(),
     }
 ]
 llm_config = {"config_list": config_list, "temperature": 0.0}
 
-# Reviewer Agent: evaluates the answer and suggests improvements (does not provide the final answer).
-reviewer = autogen.AssistantAgent(
-    name="Reviewer",
-    llm_config=llm_config,
-    max_consecutive_auto_reply=1,
-    system_message=(
-        "You are an AI assistant whose purpose is to review the quality of an answer provided for a question asked to the user regarding a product. "
-        "This question may have different intentions, the closest match to the question will be provided along with the question and the answer. "
-        "You will also receive a metadata containing some information and rules for the answer, that should be taken into account. "
-        "Another important information is the category, it describes the category of the product related to the question. "
-        "The questions and answers may be in Portuguese or Spanish, but your scores and suggestions must be in English. "
-        "You must evaluate two main aspects: whether the answer is semantically correct and whether the answer is contextually correct. "
-        "To consider an answer semantically correct, it must explicitly address the question asked and be grammatically correct. "
-        "To consider an answer contextually correct, it must have the correct information according to the context or metadata provided. "
-        "You must provide a score from 0 to 5 for each aspect, and the final score will be the sum of the two scores. "
-        "If the answer mentions that there isn't enough information to provide a correct answer, it must not be considered contextually correct. "
-        "So a question that has missing or incorrect information should not get a score 4 or 5 for the contextual score. "
-        "If the final score is 7 or less, you must present the points that are incorrect and suggest what should be done to improve the answer. "
-        "The semantic score should be available in the message, between the tags <semantic_score> and </semantic_score>. "
-        "The contextual score should be available in the message, between the tags <contextual_score> and </contextual_score>. "
-        "The final score should be available in the message, between the tags <total_score> and </total_score>. "
-        "The suggestions must be provided in the message, between the tags <suggestions> and </suggestions>. "
-        "If the final score is higher than 7, you don't need to provide any suggestions. "
-        "You must not provide a revised answer, only suggestions for improvement. "
+# Cheaper model for the requests whose prompt is over the token budget (PROMPT_BUDGET_POLICY=route)
+budget_model = os.getenv("BUDGET_MODEL")
+budget_llm_config = {"config_list": [{**config_list[0], "model": budget_model}], "temperature": 0.0} if budget_model else None
+
+# Roles whose turns go to the cheaper CASCADE_MODEL first, escalating to the main model on borderline or unreadable scores
+cascade = ModelCascade.from_env(default_roles=("Reviewer", "Evaluator"))
+
+
+class ReviewTeam(NamedTuple):
+    manager: autogen.GroupChatManager
+    user_proxy: autogen.UserProxyAgent
+
+
+def build_agents(llm_config: dict = llm_config) -> ReviewTeam:
+    """
+    Builds a new group chat, with its own agents, for a single conversation.
+    """
+    # Completions are deterministic (temperature 0), so every agent shares one cache per model configuration
+    completion_cache = completion_cache_for(llm_config)
+
+    # Reviewer Agent: evaluates the answer and suggests improvements (does not provide the final answer).
+    reviewer = autogen.AssistantAgent(
+        name="Reviewer",
+        llm_config=structured_llm_config(cascade.llm_config_for("Reviewer", llm_config), ReviewScores),
+        max_consecutive_auto_reply=1,
+        system_message=(
+            "You are an AI assistant whose purpose is to review the quality of an answer provided for a question asked to the user regarding a product. "
+            "This question may have different intentions, the closest match to the question will be provided along with the question and the answer. "
+            "You will also receive a metadata containing some information and rules for the answer, that should be taken into account. "
+            "Another important information is the category, it describes the category of the product related to the question. "
+            "The questions and answers may be in Portuguese or Spanish, but your scores and suggestions must be in English. "
+            "You must evaluate two main aspects: whether the answer is semantically correct and whether the answer is contextually correct. "
+            "To consider an answer semantically correct, it must explicitly address the question asked and be grammatically correct. "
+            "To consider an answer contextually correct, it must have the correct information according to the context or metadata provided. "
+            "You must provide a score from 0 to 5 for each aspect, and the final score will be the sum of the two scores. "
+            "If the answer mentions that there isn't enough information to provide a correct answer, it must not be considered contextually correct. "
+            "So a question that has missing or incorrect information should not get a score 4 or 5 for the contextual score. "
+            "If the final score is 7 or less, you must present the points that are incorrect and suggest what should be done to improve the answer. "
+            "The semantic score should be available in the message, between the tags <semantic_score> and </semantic_score>. "
+            "The contextual score should be available in the message, between the tags <contextual_score> and </contextual_score>. "
+            "The final score should be available in the message, between the tags <total_score> and </total_score>. "
+            "The suggestions must be provided in the message, between the tags <suggestions> and </suggestions>. "
+            "If the final score is higher than 7, you don't need to provide any suggestions. "
+            "You must not provide a revised answer, only suggestions for improvement. "
+            f"{format_instructions(ReviewScores)}"
+        )
     )
-)
 
-rewriter = autogen.AssistantAgent(
-    name="Rewriter",
-    llm_config=llm_config,
-    max_consecutive_auto_reply=1,
-    system_message=(
-        "You are an AI assistant whose purpose is to rewrite answers that have not been evaluated positively by the reviewer. "
-        "You will receive the original question, the original answer, and the suggestions for improvement made by the reviewer. "
-        "Other important information that you should use to rewrite the answer are the context, the category, the intent and the metadata. "
-        "The context is an object that contains the information about the product, the store and other useful information. "
-        "The category is a string that describes the category of the product related to the question. "
-        "The intent is a object that contains the possible intents of the question, calculated based on the question. "
-        "The metadata is a object that contains some information and rules for the answer, that should be taken into account. "
-        "The questions and answers may be in Portuguese or Spanish, but your revised answer must be in the original language of the question. "
-        "You must consider the suggestions made by the reviewer and rewrite the answer accordingly. "
-        "If the answer contains some type of greeting or signature, you must keep it in the revised answer. "
-        "If you don't have information in the context to answer the question, you need return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
-        "If there is a clear statement in the context or in the metadata that says that this type of question shouldn't be answered, "
-        "you must return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
-        "You must use only information that can be explicitly inferred from the context, and that makes sense for the question asked. "
-        "The revised answer should be provided in the message, between the tags <revised_answer> and </revised_answer>. "
-    ),
-)
+    rewriter = autogen.AssistantAgent(
+        name="Rewriter",
+        llm_config=structured_llm_config(cascade.llm_config_for("Rewriter", llm_config), RevisedAnswer),
+        max_consecutive_auto_reply=1,
+        system_message=(
+            "You are an AI assistant whose purpose is to rewrite answers that have not been evaluated positively by the reviewer. "
+            "You will receive the original question, the original answer, and the suggestions for improvement made by the reviewer. "
+            "Other important information that you should use to rewrite the answer are the context, the category, the intent and the metadata. "
+            "The context is an object that contains the information about the product, the store and other useful information. "
+            "The category is a string that describes the category of the product related to the question. "
+            "The intent is a object that contains the possible intents of the question, calculated based on the question. "
+            "The metadata is a object that contains some information and rules for the answer, that should be taken into account. "
+            "The questions and answers may be in Portuguese or Spanish, but your revised answer must be in the original language of the question. "
+            "You must consider the suggestions made by the reviewer and rewrite the answer accordingly. "
+            "If the answer contains some type of greeting or signature, you must keep it in the revised answer. "
+            "If you don't have information in the context to answer the question, you need return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
+            "If there is a clear statement in the context or in the metadata that says that this type of question shouldn't be answered, "
+            "you must return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
+            "You must use only information that can be explicitly inferred from the context, and that makes sense for the question asked. "
+            "The revised answer should be provided in the message, between the tags <revised_answer> and </revised_answer>. "
+            f"{format_instructions(RevisedAnswer)}"
+        ),
+    )
 
-evaluator = autogen.AssistantAgent(
-    name="Evaluator",
-    llm_config=llm_config,
-    max_consecutive_auto_reply=1,
-    system_message=(
-        "You are an AI assistant whose purpose is to evaluate an answer given for a question asked by a customer regarding a product. "
-        "If the answer given was not evaluated positively by the reviewer, a new answer was written by the rewriter. "
-        "Your goal is to evaluate if the rewritten answer is an improvement over the original answer. "
-        "If you consider that none of the answers directly address the question, you must return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
-        "Followed by the text, None of the answers are good enough to be accepted. "
-        "You must not accept an answer that mentions that there isn't information available to answer the user's question. "
-        "You must not accept an answer that mentions another product, unless it is mentioned in the context or metadata, containing a link to the product. "
-        "You must not accept an answer that says that any part of the question cannot be answered. "
-        "If any of these situations occur, you must return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
-        "Followed by the reason why the answer cannot be accepted. "
-        "If you consider that the rewritten answer is an improvement over the original answer, you must return the new answer. "
-        "If you consider that the rewritten answer is not an improvement over the original answer, you must return the original answer. "
-        "You should also provide a score from 0 to 10 for the chosen answer."
-        "The score should be provided in the message, between the tags <new_score> and </new_score>. "
-        "The answer should be provided in the message, between the tags <final_answer> and </final_answer>. "
-        "If the score is 5 or less, you must only return the text: THIS QUESTION CANNOT BE ANSWERED!!. "
-        "Followed by the text, 'The revised answer is not good enough to be accepted' and the score you gave it"
+    evaluator = autogen.AssistantAgent(
+        name="Evaluator",
+        llm_config=structured_llm_config(cascade.llm_config_for("Evaluator", llm_config), Evaluation),
+        max_consecutive_auto_reply=1,
+        system_message=(
+            "You are an AI assistant whose purpose is to evaluate an answer given for a question asked by a customer regarding a product. "
+            "If the answer given was not evaluated positively by the reviewer, a new answer was written by the rewriter. "
+            "Your goal is to evaluate if the rewritten answer is an improvement over the original answer. "
+            "If you consider that none of the answers directly address the question, you must return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
+            "Followed by the text, None of the answers are good enough to be accepted. "
+            "You must not accept an answer that mentions that there isn't information available to answer the user's question. "
+            "You must not accept an answer that mentions another product, unless it is mentioned in the context or metadata, containing a link to the product. "
+            "You must not accept an answer that says that any part of the question cannot be answered. "
+            "If any of these situations occur, you must return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
+            "Followed by the reason why the answer cannot be accepted. "
+            "If you consider that the rewritten answer is an improvement over the original answer, you must return the new answer. "
+            "If you consider that the rewritten answer is not an improvement over the original answer, you must return the original answer. "
+            "You should also provide a score from 0 to 10 for the chosen answer."
+            "The score should be provided in the message, between the tags <new_score> and </new_score>. "
+            "The answer should be provided in the message, between the tags <final_answer> and </final_answer>. "
+            "If the score is 5 or less, you must only return the text: THIS QUESTION CANNOT BE ANSWERED!!. "
+            "Followed by the text, 'The revised answer is not good enough to be accepted' and the score you gave it. "
+            f"{format_instructions(Evaluation)}"
+        )
     )
-)
 
-user_proxy = autogen.UserProxyAgent(
-    name="User",
-    llm_config=llm_config,
-    human_input_mode="NEVER",
-    system_message=(
-        "You must send an answer given for a question asked by a customer regarding a product for evaluation. "
-        "The object that you will send contains the question, the answer, the context, the category, the metadata, the language and the intent. "
-        "This question needs to be evaluated by the reviewer, and if necessary, revised by the rewriter. "
-        "The revised answer must be evaluated by the evaluator. "
-    ),
-    code_execution_config={
-        "use_docker": False,
-    }
-)
+    user_proxy = autogen.UserProxyAgent(
+        name="User",
+        llm_config=llm_config,
+        human_input_mode="NEVER",
+        system_message=(
+            "You must send an answer given for a question asked by a customer regarding a product for evaluation. "
+            "The object that you will send contains the question, the answer, the context, the category, the metadata, the language and the intent. "
+            "This question needs to be evaluated by the reviewer, and if necessary, revised by the rewriter. "
+            "The revised answer must be evaluated by the evaluator. "
+        ),
+        code_execution_config={
+            "use_docker": False,
+        }
+    )
 
-group_chat = autogen.GroupChat(
-    agents=[reviewer, rewriter, evaluator],
-    speaker_selection_method="round_robin",
-)
+    group_chat = autogen.GroupChat(
+        agents=[reviewer, rewriter, evaluator],
+        speaker_selection_method="round_robin",
+    )
 
-manager = autogen.GroupChatManager(
-    groupchat=group_chat,
-    is_termination_msg=lambda x: (
-        (x.get("content", "").find("THIS QUESTION CANNOT BE ANSWERED!!") >= 0) or
-        (lambda m: int(m.group(1)) > 7 if m else False)(re.search(r"<total_score>(\d+)</total_score>", x.get("content", "")))
-    ),
-    llm_config=llm_config,
-    system_message=(
-        "You are the manager of a group chat that contains three AI assistants: the reviewer, the rewriter, and the evaluator. "
-        "The reviewer evaluates the quality of an answer provided for a question asked by the user regarding a product. "
-        "The rewriter rewrites answers that have not been evaluated positively by the reviewer. "
-        "The evaluator evaluates if the rewritten answer is an improvement over the original answer. "
-        "You must manage the conversation between the assistants and make sure that the final answer is provided to the user. "
+    manager = autogen.GroupChatManager(
+        groupchat=group_chat,
+        is_termination_msg=lambda x: cannot_answer(x) or score_above(x, "total_score", 7),
+        llm_config=llm_config,
+        system_message=(
+            "You are the manager of a group chat that contains three AI assistants: the reviewer, the rewriter, and the evaluator. "
+            "The reviewer evaluates the quality of an answer provided for a question asked by the user regarding a product. "
+            "The rewriter rewrites answers that have not been evaluated positively by the reviewer. "
+            "The evaluator evaluates if the rewritten answer is an improvement over the original answer. "
+            "You must manage the conversation between the assistants and make sure that the final answer is provided to the user. "
+        )
     )
-)
+
+    for agent in (reviewer, rewriter, evaluator, user_proxy, manager):
+        agent.client_cache = completion_cache
+        cascade.attach(agent, reply_scores)
+        schedule_agent(agent)
+        instrument_agent(agent)
+        trace_agent(agent)
+        count_async_replies_once(agent)
+
+    return ReviewTeam(manager=manager, user_proxy=user_proxy)
+
+
+def team_agents(team: ReviewTeam) -> list:
+    return [*team.manager.groupchat.agents, team.manager, team.user_proxy]
+
+
+def reset_agents(team: ReviewTeam):
+    """
+    Clears the messages, reply counters and usage of a team so it can be reused.
+    """
+    team.manager.groupchat.reset()
+
+    for agent in team_agents(team):
+        agent.reset()
+
+
+agent_pool = AgentPool(build_agents, reset_agents, max_idle=int(os.getenv("AGENT_POOL_MAX_IDLE", "8")))
+budget_agent_pool = AgentPool(
+    lambda: build_agents(budget_llm_config), reset_agents, max_idle=int(os.getenv("AGENT_POOL_MAX_IDLE", "8"))
+) if budget_llm_config else None
@@ -0,0 +1,34 @@
+def wrap_client(agent, wrapper):
+    """
+    Applies wrapper to the OpenAIWrapper of an agent, now and every time autogen rebuilds it.
+    autogen builds a new client whenever the tools or functions offered to the LLM change, as a
+    swarm pattern does with the tools of its agents, and the new client would lose the wrappers
+    of the old one. The wrappers are applied again in the order they were added.
+    """
+    if getattr(agent, "client", None) is None:
+        return
+
+    wrapper(agent.client)
+
+    if getattr(agent, "client_wrappers", None) is None:
+        agent.client_wrappers = []
+
+        for name in ("update_tool_signature", "update_function_signature"):
+            _rewrap_after(agent, name)
+
+    agent.client_wrappers.append(wrapper)
+
+
+def _rewrap_after(agent, name: str):
+    update = getattr(agent, name)
+
+    def update_and_rewrap(*args, **kwargs):
+        result = update(*args, **kwargs)
+
+        if agent.client is not None:
+            for wrapper in agent.client_wrappers:
+                wrapper(agent.client)
+
+        return result
+
+    setattr(agent, name, update_and_rewrap)
@@ -0,0 +1,166 @@
+import os
+import re
+import json
+
+from functools import lru_cache
+
+from pydantic import BaseModel
+
+# Sentinel the agents write when the question can't be answered, in both response formats
+CANNOT_ANSWER = "THIS QUESTION CANNOT BE ANSWERED!!"
+
+FIELDS = (
+    "semantic_score", "contextual_score", "total_score", "suggestions",
+    "revised_answer", "new_score", "final_answer",
+)
+SCORE_FIELDS = ("semantic_score", "contextual_score", "total_score", "new_score")
+
+# One pass over the message finds every tag; the backreference pairs each tag with its own closing tag
+TAG_PATTERN = re.compile(rf"<({'|'.join(FIELDS)})>(.*?)</\1>", re.DOTALL)
+SCORE_PATTERN = re.compile(r"-?\d+(?:[.,]\d+)?")
+JSON_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+
+
+class ReviewScores(BaseModel):
+    semantic_score: int
+    contextual_score: int
+    total_score: int
+    suggestions: str | None
+
+
+class RevisedAnswer(BaseModel):
+    revised_answer: str
+
+
+class Evaluation(BaseModel):
+    new_score: int
+    final_answer: str
+
+
+def response_format() -> str:
+    """
+    Format of the replies of the agents, from RESPONSE_FORMAT: "tags" (default) or "json".
+    """
+    value = os.getenv("RESPONSE_FORMAT", "tags").lower()
+
+    if value not in ("tags", "json"):
+        raise ValueError(f"Unknown response format '{value}', expected 'tags' or 'json'")
+
+    return value
+
+
+def structured_llm_config(llm_config: dict, schema: type[BaseModel]) -> dict:
+    """
+    Returns the LLM configuration of an agent: with RESPONSE_FORMAT=json, the model must reply
+    with a JSON object of the schema (structured outputs) instead of the tags.
+    """
+    if response_format() != "json":
+        return llm_config
+
+    return {**llm_config, "response_format": schema}
+
+
+def format_instructions(schema: type[BaseModel]) -> str:
+    """
+    Sentence appended to the system message of an agent in the JSON response format.
+    """
+    if response_format() != "json":
+        return ""
+
+    fields = ", ".join(schema.model_fields)
+
+    return (
+        f"Reply only with a JSON object with the fields {fields}: put each value in the field named "
+        "like its tag instead of between the tags, and use null for a value you don't need to provide. "
+    )
+
+
+def coerce_score(value) -> int | None:
+    """
+    Reads a score written as 8, "8", " 8 ", "8/10", "8.0" or "**8**". Returns None when there is no number.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not isinstance(value, str):
+        return None
+
+    match = SCORE_PATTERN.search(value)
+
+    return int(float(match.group(0).replace(",", "."))) if match else None
+
+
+@lru_cache(maxsize=4096)
+def _parse(content: str) -> dict:
+    text = content.strip()
+    fenced = JSON_FENCE_PATTERN.match(text)
+    text = fenced.group(1) if fenced else text
+
+    if text.startswith("{"):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            data = None
+
+        if isinstance(data, dict):
+            return _clean({field: data.get(field) for field in FIELDS})
+
+    fields = {}
+
+    for match in TAG_PATTERN.finditer(content):
+        # The first occurrence of a tag wins, as with re.search
+        fields.setdefault(match.group(1), match.group(2))
+
+    return _clean(fields)
+
+
+def _clean(fields: dict) -> dict:
+    cleaned = {}
+
+    for field, value in fields.items():
+        value = coerce_score(value) if field in SCORE_FIELDS else value
+        value = value.strip() if isinstance(value, str) else value
+
+        if value is not None:
+            cleaned[field] = value
+
+    return cleaned
+
+
+def parse_reply(message) -> dict:
+    """
+    Reads the fields of an agent reply, a JSON object or a message with tags, in a single pass.
+    Scores are coerced to int, and scores that can't be read are left out.
+    The result is cached by content, since the termination checks and the extraction read the
+    same messages, so it must not be modified.
+    """
+    content = message.get("content") if isinstance(message, dict) else message
+
+    return _parse(content) if isinstance(content, str) and content else {}
+
+
+def cannot_answer(message) -> bool:
+    content = message.get("content") if isinstance(message, dict) else message
+
+    return isinstance(content, str) and CANNOT_ANSWER in content
+
+
+def score_above(message, field: str, limit: int = 7) -> bool:
+    score = parse_reply(message).get(field)
+
+    return score is not None and score > limit
+
+
+def reply_scores(message) -> list | None:
+    """
+    Scores of a reply on the 0-10 scale, for the model cascade: [] for a valid reply without
+    a score (a revised answer, or a question that can't be answered), None when it can't be read.
+    """
+    fields = parse_reply(message)
+    scores = [fields[field] for field in ("total_score", "new_score") if field in fields]
+
+    if scores or cannot_answer(message) or "revised_answer" in fields:
+        return scores
+
+    return None
@@ -1,22 +1,159 @@
 import os
-import csv
 import json
-import re
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 from models.revision import RevisionRequest
-from agents.agents import manager, user_proxy  # Import the necessary agents
+from services.result_cache import ResultCache
+from services.result_writer import ResultWriter
+from services.context_pruner import ContextPruner
+from services.tokens import TokenBudget
+from services.tracing import tracer
+from services.prefilter import Prefilter
+from services.single_flight import SingleFlight
+from services.metrics import (
+    metrics, record_usage, AGENT_TEAMS, CONTEXT_TOKENS_SAVED, CONVERSATION_ROUNDS, CONVERSATIONS_IN_FLIGHT,
+    LLM_CACHE_HIT_RATIO, LLM_CACHE_LOOKUPS, LLM_HTTP_CONNECTIONS, LLM_HTTP_REQUESTS, LLM_HTTP_REUSE_RATIO,
+    LLM_HTTP_TLS_HANDSHAKES, RESULT_CACHE_HIT_RATIO, RESULT_CACHE_LOOKUPS,
+)
+from agents.agents import agent_pool, budget_agent_pool, config_list, team_agents  # Each conversation gets its own agents
+from agents.usage import collect_usage, total_usage
+from agents.parsing import cannot_answer, parse_reply
+from agents.llm_cache import close_completion_caches, completion_cache_stats
+from agents.http_client import close_http_client, http_client_stats
 
 
 class RevisionService:
-    def __init__(self, results_file: str = "results.csv"):
-        self.results_file = results_file
+    def __init__(self, results_file: str | None = None, max_concurrency: int | None = None):
+        # Records are written in batches by a background thread, outside the request latency
+        self.result_writer = ResultWriter.from_env(results_file)
+        # Number of items of a batch that are processed at the same time
+        self.max_concurrency = max_concurrency or int(os.getenv("REVISION_MAX_CONCURRENCY", "4"))
+        self.context_pruner = ContextPruner.from_env()
+        # Prompts over the budget are trimmed, rejected or routed to the budget model before the conversation starts
+        self.token_budget = TokenBudget.from_env()
+        if self.token_budget.max_tokens and self.token_budget.policy == "route" and budget_agent_pool is None:
+            raise ValueError("PROMPT_BUDGET_POLICY=route needs the cheaper model in BUDGET_MODEL")
+        # Optional classifier that returns clearly good answers without running the agents
+        self.prefilter = Prefilter.from_env()
+        self.result_cache = ResultCache.from_env(namespace="group_chat")
+        # Identical requests in flight at the same time, keyed like the result cache, run only once
+        self.in_flight = SingleFlight.from_env()
+        metrics.on_collect(self.collect_metrics)
+        tracer.service_name = os.getenv("OTEL_SERVICE_NAME", "group_chat")
 
     def process_revision(self, request: RevisionRequest) -> str:
         """
-        Processes a single revision request.
+        Processes a single revision request, reusing the result of an identical earlier or in-flight request.
+        Returns the final answer and the scores.
+        """
+        key = self.result_cache.make_key(request)
+        found, response = self.result_cache.get(key)
+
+        if not found:
+            def run():
+                response = self.run_revision(request)
+                self.result_cache.set(key, response)
+                return response
+
+            # Identical requests that arrive while this one runs share its conversation
+            response = self.in_flight.do(key, run)
+
+        return response
+
+    async def aprocess_revision(self, request: RevisionRequest) -> str:
+        """
+        Processes a single revision request without blocking the event loop,
+        reusing the result of an identical earlier or in-flight request.
+        """
+        key = self.result_cache.make_key(request)
+        found, response = self.result_cache.get(key)
+
+        if not found:
+            async def run():
+                response = await self.arun_revision(request)
+                self.result_cache.set(key, response)
+                return response
+
+            # Identical requests that arrive while this one runs share its conversation
+            response = await self.in_flight.ado(key, run)
+
+        return response
+
+    def run_revision(self, request: RevisionRequest) -> str:
+        """
+        Runs the conversation for a single revision request.
+        Returns the final revised answer.
+        """
+        probability = self.prefilter.keep_probability(request)
+        if self.prefilter.skips(probability):
+            return self.keep_original(request)
+
+        message, stats = self.build_message(request)
+        stats["prefilter_probability"] = probability
+
+        with CONVERSATIONS_IN_FLIGHT.track_in_progress(), self.agent_pool_for(stats).acquire() as team:
+            with tracer.trace(request.id, team_agents(team)) as trace:
+                result = team.user_proxy.initiate_chat(recipient=team.manager, message=message, cache=team.manager.client_cache)
+
+            stats["trace_id"] = trace.trace_id if trace is not None else None
+            # The team is reset once it is released, so keep a reference to its messages and usage
+            messages = dict(team.manager.chat_messages)
+            stats["rounds"] = len(team.manager.groupchat.messages)
+            stats["usage"] = collect_usage(team_agents(team))
+
+        return self.finish_revision(request, result, messages, stats)
+
+    async def arun_revision(self, request: RevisionRequest) -> str:
+        """
+        Runs the conversation for a single revision request without blocking the event loop.
         Returns the final revised answer.
         """
+        probability = self.prefilter.keep_probability(request)
+        if self.prefilter.skips(probability):
+            return self.keep_original(request)
+
+        message, stats = self.build_message(request)
+        stats["prefilter_probability"] = probability
+
+        with CONVERSATIONS_IN_FLIGHT.track_in_progress(), self.agent_pool_for(stats).acquire() as team:
+            with tracer.trace(request.id, team_agents(team)) as trace:
+                result = await team.user_proxy.a_initiate_chat(recipient=team.manager, message=message, cache=team.manager.client_cache)
+
+            stats["trace_id"] = trace.trace_id if trace is not None else None
+            # The team is reset once it is released, so keep a reference to its messages and usage
+            messages = dict(team.manager.chat_messages)
+            stats["rounds"] = len(team.manager.groupchat.messages)
+            stats["usage"] = collect_usage(team_agents(team))
+
+        return self.finish_revision(request, result, messages, stats)
+
+    @staticmethod
+    def keep_original(request: RevisionRequest) -> dict:
+        """
+        Returns the original answer of a request the prefilter is confident about, without reviewing it.
+        No result record is saved, as there is no review.
+        """
+        return {
+            "final_answer": request.answer,
+            "previous_score": None,
+            "new_score": "-",
+        }
+
+    @staticmethod
+    def agent_pool_for(stats: dict):
+        """
+        Returns the pool of the budget model for the requests routed to it, the default pool otherwise.
+        """
+        return budget_agent_pool if stats["budget_action"] == "route" else agent_pool
+
+    def build_message(self, request: RevisionRequest):
+        """
+        Builds the message that starts the conversation for a request.
+        Returns the message and statistics about its prompt.
+        """
         # Extract the language and intent from the request
         language = "portuguese" if request.locale == "pt" else "spanish"
         intent = request.intent.get("name")
@@ -32,20 +169,27 @@ class RevisionService:
             "intent": intent,
         }
 
-        formatted_question = json.dumps(
-            question_data, indent=2, ensure_ascii=False)
-        message = f"Please send this answer to be reviewed\n{formatted_question}"
+        # Only the context fields relevant to the intent go into the prompt, as compact JSON within the token budget
+        model = config_list[0]["model"]
+        pruned_data = self.context_pruner.prepare(question_data)
+        formatted_question, stats = self.token_budget.fit(pruned_data, self.context_pruner.serialize, model)
+        stats["context_tokens_saved"] = self.context_pruner.tokens_saved(question_data, formatted_question, model)
 
-        result = user_proxy.initiate_chat(recipient=manager, message=message)
+        return f"Please send this answer to be reviewed\n{formatted_question}", stats
 
-        # Extract total cost, if available
-        total_cost = result.cost.get(
-            'usage_excluding_cached_inference', {}).get('total_cost')
-        cost_str = f"${total_cost}" if total_cost is not None else "Cost information not available"
+    def finish_revision(self, request: RevisionRequest, result, messages, stats: dict):
+        """
+        Extracts the results of a finished conversation and saves them.
+        Returns the final answer and the scores.
+        """
+        language = "portuguese" if request.locale == "pt" else "spanish"
 
         # Extract relevant information from the chat history
         final_answer, revised_answer, previous_score, new_score, suggestions = self.extract_chat_results(
-            manager.chat_messages, request.answer)
+            messages, request.answer)
+
+        # Tokens and cost of the LLM calls of all the agents, excluding cached completions
+        usage = total_usage(stats["usage"])
 
         if (new_score is not None) and (new_score <= 7):
             final_answer = "DO_NOT_ANSWER"
@@ -71,8 +215,22 @@ class RevisionService:
             "Language": language,
             "Intent": request.intent.get("name"),
             "Category": request.category,
+            "Context Tokens Saved": stats["context_tokens_saved"],
+            "Prompt Tokens Estimate": stats["prompt_tokens_estimate"],
+            "Budget Action": stats["budget_action"] or "-",
+            "Prompt Tokens": usage["prompt_tokens"],
+            "Completion Tokens": usage["completion_tokens"],
+            "Total Cost": round(usage["cost"], 6),
+            "Token Usage": json.dumps(stats["usage"]),
+            "Trace Id": stats["trace_id"] or "-",
+            "Prefilter Probability": round(stats["prefilter_probability"], 4) if stats["prefilter_probability"] is not None else "-",
         }
 
+        record_usage(stats["usage"])
+        CONTEXT_TOKENS_SAVED.inc(max(0, stats["context_tokens_saved"]))
+        self.prefilter.record_outcome(stats["prefilter_probability"], previous_score)
+        CONVERSATION_ROUNDS.observe(stats["rounds"])
+
         self.save_result(new_record)
 
         return {
@@ -81,18 +239,81 @@ class RevisionService:
             "new_score": new_score,
         }
 
-    def process_revisions(self, requests: List[RevisionRequest]) -> List[str]:
+    def process_revisions(self, requests: List[RevisionRequest], max_concurrency: int | None = None) -> List:
         """
-        Processes a list of revision requests.
-        Returns a list of final revised answers.
+        Processes a list of revision requests, running up to max_concurrency of them at the same time.
+        Returns the results in the same order as the requests. A request that fails is returned as
+        {"id": ..., "error": ...} instead of failing the whole batch.
         """
-        responses = []
-        for req in requests:
-            revised = self.process_revision(req)
-            responses.append(revised)
+        if not requests:
+            return []
+
+        limit = max(1, min(max_concurrency or self.max_concurrency, len(requests)))
+
+        with ThreadPoolExecutor(max_workers=limit, thread_name_prefix="revision") as executor:
+            futures = [executor.submit(self.process_revision, req) for req in requests]
+
+            responses = []
+            for req, future in zip(requests, futures):
+                try:
+                    responses.append(future.result())
+                except Exception as e:
+                    responses.append({"id": req.id, "error": str(e)})
 
         return responses
 
+    async def aprocess_revisions(self, requests: List[RevisionRequest], max_concurrency: int | None = None) -> List:
+        """
+        Async version of process_revisions, with the same ordering and error semantics.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrency))
+
+        async def run(req: RevisionRequest):
+            async with semaphore:
+                try:
+                    return await self.aprocess_revision(req)
+                except Exception as e:
+                    return {"id": req.id, "error": str(e)}
+
+        return list(await asyncio.gather(*(run(req) for req in requests)))
+
+    async def astream_revisions(self, requests: List[RevisionRequest], max_concurrency: int | None = None):
+        """
+        Processes a list of revision requests like aprocess_revisions, but yields each result as soon
+        as it is ready, tagged with the request id, and finishes with a summary record.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrency))
+        start = time.perf_counter()
+
+        async def run(req: RevisionRequest):
+            async with semaphore:
+                try:
+                    return self.tag_result(req, await self.aprocess_revision(req))
+                except Exception as e:
+                    return {"id": req.id, "error": str(e)}
+
+        tasks = [asyncio.create_task(run(req)) for req in requests]
+        failed = 0
+
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                record = await next_result
+                failed += "error" in record
+                yield record
+        finally:
+            # The client may disconnect in the middle of the stream
+            for task in tasks:
+                task.cancel()
+
+        yield {
+            "summary": {
+                "total": len(requests),
+                "succeeded": len(requests) - failed,
+                "failed": failed,
+                "elapsed_seconds": round(time.perf_counter() - start, 3),
+            }
+        }
+
     @staticmethod
     def extract_chat_results(messages, original_answer):
         """
@@ -120,48 +341,27 @@ class RevisionService:
             if index >= 3:
                 break
 
-            # Se 'msg' for um dicionário, extrai o conteúdo; caso contrário, usa 'msg' como string
-            content = msg.get("content", "") if isinstance(
-                msg, dict) else str(msg)
-
-            # Expressões regulares para extrair os conteúdos desejados
-            final_answer_match = re.search(
-                r"<final_answer>(.*?)</final_answer>", content, re.DOTALL)
-
-            revised_answer_match = re.search(
-                r"<revised_answer>(.*?)</revised_answer>", content, re.DOTALL)
+            # Se 'msg' não for um dicionário, usa 'msg' como string
+            message = msg if isinstance(msg, dict) else str(msg)
+            # Tags or a JSON object, read in a single pass; scores that can't be read are left out
+            fields = parse_reply(message)
 
-            previous_score_match = re.search(
-                r"<total_score>(.*?)</total_score>", content)
+            if "final_answer" in fields:
+                final_answer = fields["final_answer"]
 
-            new_score_match = re.search(
-                r"<new_score>(.*?)</new_score>", content)
+            if "revised_answer" in fields:
+                revised_answer = fields["revised_answer"]
 
-            suggestions_match = re.search(
-                r"<suggestions>(.*?)</suggestions>", content, re.DOTALL)
+            if "total_score" in fields:
+                previous_score = fields["total_score"]
 
-            if final_answer_match:
-                final_answer = final_answer_match.group(1).strip()
+            if "new_score" in fields:
+                new_score = fields["new_score"]
 
-            if revised_answer_match:
-                revised_answer = revised_answer_match.group(1).strip()
-
-            if previous_score_match:
-                try:
-                    previous_score = int(previous_score_match.group(1).strip())
-                except ValueError:
-                    previous_score = None
+            if "suggestions" in fields:
+                suggestions = fields["suggestions"]
 
-            if new_score_match:
-                try:
-                    new_score = int(new_score_match.group(1).strip())
-                except ValueError:
-                    new_score = None
-
-            if suggestions_match:
-                suggestions = suggestions_match.group(1).strip()
-
-            if content.find("THIS QUESTION CANNOT BE ANSWERED!!") >= 0:
+            if cannot_answer(message):
                 final_answer = "DO_NOT_ANSWER"
 
             if (previous_score is not None and new_score is not None) or (previous_score is not None and previous_score > 7):
@@ -171,24 +371,53 @@ class RevisionService:
 
         return final_answer, revised_answer, previous_score, new_score, suggestions
 
-    def save_result(self, record):
+    @staticmethod
+    def tag_result(request: RevisionRequest, response) -> dict:
         """
-        Reads existing records (if any) and adds a new record,
-        saving everything to the CSV file.
+        Tags the result of a request with its id, for results that are delivered out of order.
         """
-        # Check if the file exists and if it is empty
-        file_exists = os.path.exists(self.results_file)
-        is_empty = not file_exists or os.stat(self.results_file).st_size == 0
-
-        # Open the file in append mode
-        with open(self.results_file, "a", newline="", encoding="utf-8") as f:
-            # Use the keys of the record as CSV field names
-            fieldnames = list(record.keys())
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+        return {"id": request.id, **response}
 
-            # If the file does not exist or is empty, write the header row
-            if is_empty:
-                writer.writeheader()
+    def collect_metrics(self):
+        """
+        Copies the stats of the caches, agent pools and LLM HTTP client into the metrics, when they are scraped.
+        """
+        cache_stats = self.result_cache.stats()
+        RESULT_CACHE_LOOKUPS.set(cache_stats["memory_hits"], outcome="memory_hit")
+        RESULT_CACHE_LOOKUPS.set(cache_stats["disk_hits"], outcome="disk_hit")
+        RESULT_CACHE_LOOKUPS.set(cache_stats["misses"], outcome="miss")
+        RESULT_CACHE_HIT_RATIO.set(cache_stats["hit_rate"])
+
+        for namespace, stats in completion_cache_stats().items():
+            LLM_CACHE_LOOKUPS.set(stats["hits"], namespace=namespace, outcome="hit")
+            LLM_CACHE_LOOKUPS.set(stats["misses"], namespace=namespace, outcome="miss")
+            LLM_CACHE_HIT_RATIO.set(stats["hit_rate"], namespace=namespace)
+
+        http_stats = http_client_stats()
+        if http_stats:
+            LLM_HTTP_REQUESTS.set(http_stats["new_connections"], connection="new")
+            LLM_HTTP_REQUESTS.set(http_stats["reused_connections"], connection="reused")
+            LLM_HTTP_CONNECTIONS.set(http_stats["open_connections"])
+            LLM_HTTP_TLS_HANDSHAKES.set(http_stats["tls_handshakes"])
+            LLM_HTTP_REUSE_RATIO.set(http_stats["reuse_ratio"])
+
+        for name, pool in (("default", agent_pool), ("budget", budget_agent_pool)):
+            if pool is not None:
+                pool_stats = pool.stats()
+                AGENT_TEAMS.set(pool_stats["in_use"], pool=name, state="in_use")
+                AGENT_TEAMS.set(pool_stats["idle"], pool=name, state="idle")
+
+    def close(self):
+        """
+        Releases the resources held by the service when the application shuts down.
+        """
+        self.result_writer.close()
+        self.result_cache.close()
+        close_completion_caches()
+        close_http_client()
 
-            # Write the new record to the CSV file
-            writer.writerow(record)
+    def save_result(self, record):
+        """
+        Queues a record to be appended to the results file by the background writer.
+        """
+        self.result_writer.write(record)
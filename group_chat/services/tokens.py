@@ -0,0 +1,110 @@
+import os
+import json
+import threading
+
+import tiktoken
+
+_encodings = {}
+_lock = threading.Lock()
+
+
+def get_encoding(model: str):
+    """
+    Returns the tiktoken encoding of a model, o200k_base for models tiktoken doesn't know
+    (local models included), or None when the encoding files can't be loaded.
+    """
+    with _lock:
+        if model not in _encodings:
+            try:
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                # tiktoken downloads its files on first use, which fails without network access
+                _encodings[model] = None
+
+        return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Counts the tokens of a text, estimating 4 characters per token without an encoding.
+    """
+    encoding = get_encoding(model)
+
+    if encoding is None:
+        return (len(text) + 3) // 4
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class PromptBudgetExceeded(ValueError):
+    """
+    Raised when the prompt of a request is over the token budget and can't be trimmed to fit it.
+    """
+
+
+class TokenBudget:
+    """
+    Estimates the prompt tokens of a request before the conversation starts and applies a policy
+    when they are over max_tokens:
+      - "trim" drops the largest context fields until the prompt fits;
+      - "reject" raises PromptBudgetExceeded;
+      - "route" keeps the prompt and marks the request for the cheaper budget model.
+    A max_tokens of 0 disables the budget.
+    """
+
+    POLICIES = ("trim", "reject", "route")
+
+    def __init__(self, max_tokens: int = 0, policy: str = "trim"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown budget policy '{policy}', expected one of {self.POLICIES}")
+
+        self.max_tokens = max_tokens
+        self.policy = policy
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a budget configured by PROMPT_TOKEN_BUDGET and PROMPT_BUDGET_POLICY.
+        """
+        return cls(
+            max_tokens=int(os.getenv("PROMPT_TOKEN_BUDGET", "0")),
+            policy=os.getenv("PROMPT_BUDGET_POLICY", "trim"),
+        )
+
+    def fit(self, question_data: dict, serialize, model: str = "gpt-4o"):
+        """
+        Serializes the question data within the budget.
+        Returns the serialized data and a report with the token estimate and the action taken.
+        """
+        formatted = serialize(question_data)
+        tokens = count_tokens(formatted, model)
+        report = {"prompt_tokens_estimate": tokens, "budget_action": None}
+
+        if not self.max_tokens or tokens <= self.max_tokens:
+            return formatted, report
+
+        if self.policy == "reject":
+            raise PromptBudgetExceeded(f"The prompt has about {tokens} tokens, the budget is {self.max_tokens}")
+
+        if self.policy == "route":
+            report["budget_action"] = "route"
+            return formatted, report
+
+        context = dict(question_data["context"])
+
+        while context and tokens > self.max_tokens:
+            largest = max(context, key=lambda field: len(json.dumps(context[field], ensure_ascii=False, default=str)))
+            del context[largest]
+
+            formatted = serialize({**question_data, "context": context})
+            tokens = count_tokens(formatted, model)
+
+        if tokens > self.max_tokens:
+            raise PromptBudgetExceeded(f"The prompt has about {tokens} tokens without any context, the budget is {self.max_tokens}")
+
+        report.update({"prompt_tokens_estimate": tokens, "budget_action": "trim"})
+
+        return formatted, report
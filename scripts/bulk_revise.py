@@ -0,0 +1,169 @@
+"""
+Runs a large JSONL file of RevisionRequest records through one of the services, without the HTTP API.
+
+The input is read line by line and at most --window items are held in memory; up to --concurrency
+of them run at the same time. Every result is appended to the output JSONL as soon as it is
+ready, tagged with its id, and the id is then appended to the checkpoint file. Running the same
+command again skips the ids in the checkpoint, so a crash or Ctrl-C resumes where it stopped.
+Failed items are written with an "error" but not checkpointed, so the next run retries them.
+
+Usage (from the repository root):
+    python scripts/bulk_revise.py catalogue.jsonl --strategy group_chat --concurrency 8
+    python scripts/bulk_revise.py catalogue.jsonl --strategy swarm --review-mode parallel --output swarm.jsonl
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STRATEGIES = ["user_reviewer", "group_chat", "swarm"]
+
+
+def read_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def read_requests(path: str, request_model, completed: set):
+    """
+    Yields (line number, request or error) for the records that aren't checkpointed yet.
+    """
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                request = request_model(**json.loads(line))
+            except Exception as e:
+                yield number, e
+                continue
+
+            if str(request.id) not in completed:
+                yield number, request
+
+
+class Progress:
+    def __init__(self, skipped: int):
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._last = 0.0
+
+    def report(self, force: bool = False):
+        now = time.perf_counter()
+
+        if not force and now - self._last < 5:
+            return
+
+        self._last = now
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        print(
+            f"done {self.done}, failed {self.failed}, skipped {self.skipped} (checkpointed), "
+            f"{rate:.2f} items/s, {elapsed:.0f}s elapsed",
+            file=sys.stderr, flush=True,
+        )
+
+
+async def run(args, service, request_model):
+    # Same executor as the services' lifespan hook, which runs the blocking LLM calls
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=int(os.getenv("LLM_IO_THREADS", "64")), thread_name_prefix="llm-io"))
+
+    completed = read_checkpoint(args.checkpoint)
+    progress = Progress(skipped=len(completed))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    pending = set()
+
+    with open(args.output, "a", encoding="utf-8") as output, open(args.checkpoint, "a", encoding="utf-8") as checkpoint:
+
+        def write(record: dict, done_id=None):
+            output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+
+            # The id is checkpointed only once its result is on disk
+            if done_id is not None:
+                checkpoint.write(f"{done_id}\n")
+                checkpoint.flush()
+
+        async def revise(request):
+            async with semaphore:
+                try:
+                    response = await service.aprocess_revision(request)
+                except Exception as e:
+                    progress.failed += 1
+                    write({"id": request.id, "error": str(e)})
+                else:
+                    progress.done += 1
+                    write(service.tag_result(request, response), done_id=request.id)
+
+            progress.report()
+
+        for number, item in read_requests(args.input, request_model, completed):
+            if isinstance(item, Exception):
+                progress.failed += 1
+                write({"line": number, "error": f"Invalid request: {item}"})
+                continue
+
+            # Keep at most `window` items in memory
+            if len(pending) >= args.window:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            pending.add(asyncio.create_task(revise(item)))
+
+        if pending:
+            await asyncio.wait(pending)
+
+    progress.report(force=True)
+
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file with one RevisionRequest per line.")
+    parser.add_argument("--strategy", choices=STRATEGIES, required=True, help="Service that reviews the answers.")
+    parser.add_argument("--review-mode", choices=["sequential", "parallel", "combined"], help="Review mode of swarm.")
+    parser.add_argument("--output", help="Results JSONL (default: <input>.<strategy>.results.jsonl).")
+    parser.add_argument("--checkpoint", help="Completed ids (default: <output>.checkpoint).")
+    parser.add_argument("--results-file", help="Where the service writes its result records (default: RESULTS_FILE or results.csv).")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("REVISION_MAX_CONCURRENCY", "4")))
+    parser.add_argument("--window", type=int, help="Items held in memory at the same time (default: 4 x concurrency).")
+    args = parser.parse_args()
+
+    args.input = os.path.abspath(args.input)
+    args.output = os.path.abspath(args.output or f"{os.path.splitext(args.input)[0]}.{args.strategy}.results.jsonl")
+    args.checkpoint = os.path.abspath(args.checkpoint or f"{args.output}.checkpoint")
+    args.window = max(args.window or 4 * args.concurrency, args.concurrency)
+
+    # The services import their packages relative to their own directory
+    sys.path.insert(0, os.path.join(ROOT, args.strategy))
+    from models.revision import RevisionRequest
+    from services.revision_service import RevisionService
+
+    options = {"review_mode": args.review_mode} if args.strategy == "swarm" else {}
+    service = RevisionService(results_file=args.results_file, max_concurrency=args.concurrency, **options)
+
+    try:
+        progress = asyncio.run(run(args, service, RevisionRequest))
+    except KeyboardInterrupt:
+        print(f"Interrupted, run the same command again to resume from {args.checkpoint}", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        # Flushes the result records still queued by the background writer
+        service.close()
+
+    sys.exit(1 if progress.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
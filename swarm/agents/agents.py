@@ -1,26 +1,61 @@
 import os
 import re
 
+from typing import NamedTuple
+
 from autogen import AssistantAgent, UserProxyAgent
 from dotenv import load_dotenv
-from autogen.agentchat.group import AgentTarget, ContextVariables, ReplyResult, TerminateTarget
+from autogen.agentchat.group import AgentNameTarget, ContextVariables, ReplyResult, TerminateTarget
+
+from agents.parallel_reviewer import ParallelReviewer
+from agents.cascade import ModelCascade
+from agents.http_client import shared_http_client
+from agents.llm_cache import completion_cache_for
+from agents.pool import AgentPool
+from agents.scheduler import schedule_agent
+from agents.revision_budget import RevisionBudget
+from services.metrics import instrument_agent
+from services.tracing import trace_agent, traced_tool
 
 load_dotenv()
 
 config_list = [
     {
         "model": "qwen3:8b",
-        "base_url": "http://localhost:11434/v1",
+        "base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1"),
         "api_key": "ollama",
+        # One pooled client for every agent, so the connections to the backend are kept alive and reused
+        "http_client": shared_http_client(),
     }
 ]
 llm_config = {"config_list": config_list, "temperature": 0.0}
 
+# Cheaper model for the requests whose prompt is over the token budget (PROMPT_BUDGET_POLICY=route)
+budget_model = os.getenv("BUDGET_MODEL")
+budget_llm_config = {"config_list": [{**config_list[0], "model": budget_model}], "temperature": 0.0} if budget_model else None
+
+# Roles whose turns go to the cheaper CASCADE_MODEL first, escalating to the main model on borderline or unreadable scores
+cascade = ModelCascade.from_env(default_roles=("Semantic_Reviewer", "Contextual_Reviewer", "Combined_Reviewer"))
+
+# Limits of the REWRITE loop of each conversation
+revision_budget = RevisionBudget.from_env()
 
+
+@traced_tool
 def register_semantic_score(semantic_score: int, justification: str, context_variables: ContextVariables) -> ReplyResult:
     """
     Register the semantic score and justification in the context variables.
     """
+    _store_semantic_score(semantic_score, justification, context_variables)
+
+    return ReplyResult(
+        context_variables=context_variables,
+        target=AgentNameTarget("Contextual_Reviewer"),
+        message="The semantic score and justification have been registered, handing over to the Contextual Reviewer for his review.",
+    )
+
+
+def _store_semantic_score(semantic_score: int, justification: str, context_variables: ContextVariables):
     if (context_variables.get("revised_answer") is None):
         context_variables["semantic_score"] = semantic_score
         context_variables["justification_semantic"] = justification
@@ -28,13 +63,8 @@ def register_semantic_score(semantic_score: int, justification: str, context_var
         context_variables["revised_answer_semantic_score"] = semantic_score
         context_variables["revised_answer_justification_semantic"] = justification
 
-    return ReplyResult(
-        context_variables=context_variables,
-        target=AgentTarget(contextual_reviewer),
-        message="The semantic score and justification have been registered, handing over to the Contextual Reviewer for his review.",
-    )
-
 
+@traced_tool
 def register_contextual_score(contextual_score: int, justification: str, context_variables: ContextVariables) -> ReplyResult:
     """
     Register the contextual score and justification in the context variables.
@@ -68,17 +98,35 @@ def register_contextual_score(contextual_score: int, justification: str, context
     elif new_score is not None:
         return ReplyResult(
             context_variables=context_variables,
-            target=AgentTarget(decider),
+            target=AgentNameTarget("Decider"),
             message="The new score has been registered, handing over to the Decider to make a decision about the revised answer.",
         )
     else:
         return ReplyResult(
             context_variables=context_variables,
-            target=AgentTarget(suggester),
+            target=AgentNameTarget("Suggester"),
             message="The contextual score and justification have been registered, handing over to the Suggester to suggest improvements.",
         )
 
 
+@traced_tool
+def register_review_scores(
+    semantic_score: int,
+    justification_semantic: str,
+    contextual_score: int,
+    justification_contextual: str,
+    context_variables: ContextVariables,
+) -> ReplyResult:
+    """
+    Register the semantic and contextual scores and justifications in the context variables,
+    when both reviews are made at the same time or by a single reviewer.
+    """
+    _store_semantic_score(semantic_score, justification_semantic, context_variables)
+
+    return register_contextual_score(contextual_score, justification_contextual, context_variables)
+
+
+@traced_tool
 def register_suggestions(suggestions: str, context_variables: ContextVariables) -> ReplyResult:
     """
     Register the suggestions in the context variables.
@@ -87,11 +135,12 @@ def register_suggestions(suggestions: str, context_variables: ContextVariables)
 
     return ReplyResult(
         context_variables=context_variables,
-        target=AgentTarget(rewriter),
+        target=AgentNameTarget("Rewriter"),
         message="The suggestions have been registered, handing over to the Rewriter to write a new answer.",
     )
 
 
+@traced_tool
 def register_revised_answer(revised_answer: str, context_variables: ContextVariables) -> ReplyResult:
     """
     Register the revised answer in the context variables.
@@ -108,13 +157,18 @@ def register_revised_answer(revised_answer: str, context_variables: ContextVaria
             message="It's not possible to write a new answer, terminating the process.",
         )
 
+    stop_reason = revision_budget.stop_reviewing(context_variables, revised_answer)
+    if stop_reason is not None:
+        return _stop_revising(context_variables, stop_reason)
+
     return ReplyResult(
         context_variables=context_variables,
-        target=AgentTarget(semantic_reviewer),
-        message="The revised answer has been registered, handing over to the Semantic Reviewer to review it.",
+        target=AgentNameTarget(context_variables.get("review_agent") or "Semantic_Reviewer"),
+        message="The revised answer has been registered, handing over to the reviewers to review it.",
     )
 
 
+@traced_tool
 def register_decision(decision: str, justification: str, context_variables: ContextVariables) -> ReplyResult:
     """
     Register the decision in the context variables.
@@ -131,6 +185,10 @@ def register_decision(decision: str, justification: str, context_variables: Cont
             message="The decision is 'ANSWER_REVISED', terminating the process.",
         )
     elif decision == "REWRITE":
+        stop_reason = revision_budget.stop_rewriting(context_variables)
+        if stop_reason is not None:
+            return _stop_revising(context_variables, stop_reason)
+
         context_variables["original_answer"] = context_variables["revised_answer"]
         context_variables["original_answer_semantic_score"] = context_variables["revised_answer_semantic_score"]
         context_variables["original_answer_justification_semantic"] = context_variables["revised_answer_justification_semantic"]
@@ -146,7 +204,7 @@ def register_decision(decision: str, justification: str, context_variables: Cont
 
         return ReplyResult(
             context_variables=context_variables,
-            target=AgentTarget(rewriter),
+            target=AgentNameTarget("Rewriter"),
             message="The decision is 'REWRITE', handing over to the Rewriter to write a new answer.",
         )
 
@@ -159,140 +217,273 @@ def register_decision(decision: str, justification: str, context_variables: Cont
     )
 
 
-semantic_reviewer = AssistantAgent(
-    name="Semantic_Reviewer",
-    llm_config=llm_config,
-    system_message=(
-        "You are the Semantic Reviewer. Your task is to critically evaluate the semantic accuracy of an answer provided to a user's question about a product.\n\n"
-        "You will be provided with the following information:\n"
-        "- **Question**: The user's inquiry regarding the product.\n"
-        "- **Original Answer**: The initial response given to the user's question.\n"
-        "- **Revised Answer**: The improved response provided by the Rewriter, if available.\n"
-        "- **Category**: The category to which the product belongs.\n"
-        "- **Intent**: The identified intent behind the user's question.\n\n"
-        "Evaluation Instructions:\n"
-        "- If the Revised Answer and the Original Answer are not none, evaluate the Revised Answer and register the score and the justification for it.\n"
-        "- If the Revised Answer is none, evaluate the Original Answer and register the score and the justification for it.\n\n"
-        "Evaluation Criteria:\n"
-        "- The answer must directly and explicitly address all aspects of the user's question.\n"
-        "- It must be grammatically correct, free of spelling errors, and use appropriate language without mixing languages.\n"
-        "- The answer should be concise and avoid unnecessary information.\n"
-        "- Greetings and signatures shouldn't be taken into account in the evaluation, unless they are duplicated.\n"
-        "- Be particularly critical of answers that are vague, incomplete, or contain linguistic errors.\n\n"
-        "Provide a semantic score from 0 to 5, where 5 indicates a perfect semantic match.\n"
-        "You must always call the function register_semantic_score with your semantic_score and a brief justification in English, do nothing else.\n\n"
-    ),
-    functions=[register_semantic_score],
-)
-
-contextual_reviewer = AssistantAgent(
-    name="Contextual_Reviewer",
-    llm_config=llm_config,
-    system_message=(
-        "You are the Contextual Reviewer. Your task is to critically assess whether an answer provided to a user's question about a product aligns with the given context and metadata.\n\n"
-        "You will be provided with the following information:\n"
-        "- **Question**: The user's inquiry regarding the product.\n"
-        "- **Original Answer**: The initial response given to the user's question.\n"
-        "- **Revised Answer**: The improved response provided by the Rewriter, if available.\n"
-        "- **Category**: The category to which the product belongs.\n"
-        "- **Intent**: The identified intent behind the user's question.\n"
-        "- **Metadata**: Additional information and rules pertinent to the product or store policies.\n"
-        "- **Context**: Crucial details about the product, store, or other relevant information.\n\n"
-        "Evaluation Instructions:\n"
-        "- If the Revised Answer and the Original Answer are not none, evaluate the Revised Answer and register the score and the justification for it.\n"
-        "- If the Revised Answer is none, evaluate the Original Answer and register the score and the justification for it.\n\n"
-        "Evaluation Criteria:\n"
-        "- The answer must be consistent with the information provided in the context and metadata.\n"
-        "- It should not include information that cannot be inferred from the provided context.\n"
-        "- The answer should focus on information relevant to the user's question.\n"
-        "- Be particularly critical of answers that include assumptions, omit critical context, or misrepresent the provided information.\n\n"
-        "Provide a contextual score from 0 to 5, where 5 indicates perfect contextual alignment.\n"
-        "You must always call the function register_contextual_score with your contextual_score and a brief justification in English, do nothing else.\n\n"
-    ),
-    functions=[register_contextual_score],
-)
-
-suggester = AssistantAgent(
-    name="Suggester",
-    llm_config=llm_config,
-    system_message=(
-        "You are the Suggester. Your purpose is to suggest improvements for an answer provided to a user's question about a product.\n\n"
-        "You will be provided with:\n"
-        "- **Question**: The user's inquiry regarding the product.\n"
-        "- **Original Answer**: The response given to the user's question.\n"
-        "- **Semantic Score**: A score from 0 to 5 indicating the semantic accuracy of the answer.\n"
-        "- **Contextual Score**: A score from 0 to 5 indicating the contextual accuracy of the answer.\n"
-        "- **Justifications**: Brief explanations for the semantic and contextual scores.\n\n"
-        "Based on the scores and justifications provided by the reviewers, you must provide suggestions for improvement.\n"
-        "- Focus on addressing specific issues highlighted in the justifications.\n"
-        "- Ensure that your suggestions are actionable and aimed at enhancing the answer's quality.\n\n"
-        "Do not provide a revised answer, only suggestions for improvement.\n"
-        "The suggestions must be in English, while the question and answer may be in Portuguese or Spanish.\n"
-        "You must always call the function register_suggestions with your suggestions as a parameter, do nothing else.\n"
-    ),
-    functions=[register_suggestions],
-)
-
-rewriter = AssistantAgent(
-    name="Rewriter",
-    llm_config=llm_config,
-    system_message=(
-        "You are the Rewriter. Your task is to rewrite answers that have not been evaluated positively by the reviewers, ensuring they meet both semantic and contextual standards.\n\n"
-        "You will be provided with the following information:\n"
-        "- **Question**: The user's inquiry regarding the product.\n"
-        "- **Original Answer**: The initial response given to the user's question.\n"
-        "- **Suggestions**: Recommendations for improvement provided by the Suggester.\n"
-        "- **Context**: Crucial details about the product, store, or other relevant information.\n"
-        "- **Category**: The category to which the product belongs.\n"
-        "- **Intent**: The identified intent behind the user's question.\n"
-        "- **Metadata**: Additional information and rules pertinent to the product or store policies.\n\n"
-        "Evaluation Criteria:\n"
-        "- The revised answer must directly and explicitly address all aspects of the user's question.\n"
-        "- It must be consistent with the information provided in the context and metadata.\n"
-        "- The answer should be grammatically correct, free of spelling errors, and use appropriate language without mixing languages.\n"
-        "- Retain any greetings or signatures present in the original answer, only removing duplicates, if any.\n"
-        "- If there isn't enough information to provide a revised answer, return 'CANNOT REWRITE'.\n\n"
-        "Provide the revised answer in the original language of the question.\n"
-        "You must always call the function register_revised_answer with your revised answer as a parameter, do nothing else.\n\n"
-    ),
-    functions=[register_revised_answer],
-)
-
-decider = AssistantAgent(
-    name="Decider",
-    llm_config=llm_config,
-    system_message=(
-        "You are the Decider. Your task is to determine whether the revised answer provided to a user's question about a product is acceptable, requires further improvement, or if the question should not be answered at all.\n\n"
-        "You will be provided with the following information:\n"
-        "- **Question**: The user's inquiry regarding the product.\n"
-        "- **Original Answer**: The initial response given to the user's question.\n"
-        "- **Revised Answer**: The improved response provided by the Rewriter.\n"
-        "- **Context**: Crucial details about the product, store, or other relevant information.\n"
-        "- **Category**: The category to which the product belongs.\n"
-        "- **Intent**: The identified intent behind the user's question.\n"
-        "- **Metadata**: Additional information and rules pertinent to the product or store policies.\n"
-        "- **Semantic and Contextual Scores**: Scores and justifications provided by the reviewers.\n"
-        "- **Suggestions**: Recommendations for improvement provided by the Suggester.\n\n"
-        "Evaluation Criteria:\n"
-        "- Determine if the revised answer fully addresses the user's question with semantic and contextual accuracy.\n"
-        "- Do not accept answers that mention another product unless it is mentioned in the context or metadata, containing a link to it.\n"
-        "- Do not accept answers that state any part of the question cannot be answered due to insufficient information.\n"
-        "- Be particularly critical of answers that are vague, incomplete, or contain incorrect information.\n"
-        "- If the number of revisions is 2 or more and the revised answer is still not good enough, the decision must be 'DO_NOT_ANSWER'.\n\n"
-        "Possible Decisions:\n"
-        "- **ANSWER_REVISED**: The revised answer is acceptable and fully addresses the question.\n"
-        "- **REWRITE**: The revised answer is not good enough, but can be improved based on the given information.\n"
-        "- **DO_NOT_ANSWER**: The revised answer is not good enough and cannot be improved based on the given information.\n\n"
-        "You must always call the function register_decision with your decision and a brief justification in English, do nothing else.\n\n"
-    ),
-    functions=[register_decision],
-)
-
-user_proxy = UserProxyAgent(
-    name="User",
-    llm_config=llm_config,
-    human_input_mode="NEVER",
-    code_execution_config={
-        "use_docker": False,
-    }
-)
+def reply_scores(message: dict) -> list | None:
+    """
+    Scores registered by a reviewer reply, on the 0-10 scale of the decision rules, for the model cascade.
+    A single aspect (0-5) counts double. Returns [] for the other tools and None when the reply doesn't
+    call a tool or its scores can't be read.
+    """
+    called = {tool_call.get("function", {}).get("name") for tool_call in message.get("tool_calls") or []}
+
+    if "register_review_scores" in called:
+        review = ParallelReviewer.tool_arguments(message, "register_review_scores")
+        scores = [review.get("semantic_score"), review.get("contextual_score")]
+        return [sum(scores)] if all(isinstance(score, int) for score in scores) else None
+
+    for function_name, field in (("register_semantic_score", "semantic_score"), ("register_contextual_score", "contextual_score")):
+        if function_name in called:
+            score = ParallelReviewer.tool_arguments(message, function_name).get(field)
+            return [2 * score] if isinstance(score, int) else None
+
+    return [] if called else None
+
+
+def _stop_revising(context_variables: ContextVariables, stop_reason: str) -> ReplyResult:
+    """
+    Ends a REWRITE loop that ran out of its revision budget; the answer is not answered.
+    """
+    context_variables["final_answer"] = "DO_NOT_ANSWER"
+    context_variables["stop_reason"] = stop_reason
+
+    return ReplyResult(
+        context_variables=context_variables,
+        target=TerminateTarget(),
+        message=f"The revision budget is exhausted ({stop_reason}), terminating the process.",
+    )
+
+
+class SwarmTeam(NamedTuple):
+    semantic_reviewer: AssistantAgent
+    contextual_reviewer: AssistantAgent
+    suggester: AssistantAgent
+    rewriter: AssistantAgent
+    decider: AssistantAgent
+    combined_reviewer: AssistantAgent
+    parallel_reviewer: ParallelReviewer
+    user_proxy: UserProxyAgent
+
+
+def build_agents(llm_config: dict = llm_config) -> SwarmTeam:
+    """
+    Builds a new set of swarm agents for a single conversation.
+    The handoffs between them are resolved by name, so each set is independent.
+    """
+    # Completions are deterministic (temperature 0), so every agent shares one cache per model configuration
+    completion_cache = completion_cache_for(llm_config)
+
+    semantic_reviewer = AssistantAgent(
+        name="Semantic_Reviewer",
+        llm_config=cascade.llm_config_for("Semantic_Reviewer", llm_config),
+        system_message=(
+            "You are the Semantic Reviewer. Your task is to critically evaluate the semantic accuracy of an answer provided to a user's question about a product.\n\n"
+            "You will be provided with the following information:\n"
+            "- **Question**: The user's inquiry regarding the product.\n"
+            "- **Original Answer**: The initial response given to the user's question.\n"
+            "- **Revised Answer**: The improved response provided by the Rewriter, if available.\n"
+            "- **Category**: The category to which the product belongs.\n"
+            "- **Intent**: The identified intent behind the user's question.\n\n"
+            "Evaluation Instructions:\n"
+            "- If the Revised Answer and the Original Answer are not none, evaluate the Revised Answer and register the score and the justification for it.\n"
+            "- If the Revised Answer is none, evaluate the Original Answer and register the score and the justification for it.\n\n"
+            "Evaluation Criteria:\n"
+            "- The answer must directly and explicitly address all aspects of the user's question.\n"
+            "- It must be grammatically correct, free of spelling errors, and use appropriate language without mixing languages.\n"
+            "- The answer should be concise and avoid unnecessary information.\n"
+            "- Greetings and signatures shouldn't be taken into account in the evaluation, unless they are duplicated.\n"
+            "- Be particularly critical of answers that are vague, incomplete, or contain linguistic errors.\n\n"
+            "Provide a semantic score from 0 to 5, where 5 indicates a perfect semantic match.\n"
+            "You must always call the function register_semantic_score with your semantic_score and a brief justification in English, do nothing else.\n\n"
+        ),
+        functions=[register_semantic_score],
+    )
+
+    contextual_reviewer = AssistantAgent(
+        name="Contextual_Reviewer",
+        llm_config=cascade.llm_config_for("Contextual_Reviewer", llm_config),
+        system_message=(
+            "You are the Contextual Reviewer. Your task is to critically assess whether an answer provided to a user's question about a product aligns with the given context and metadata.\n\n"
+            "You will be provided with the following information:\n"
+            "- **Question**: The user's inquiry regarding the product.\n"
+            "- **Original Answer**: The initial response given to the user's question.\n"
+            "- **Revised Answer**: The improved response provided by the Rewriter, if available.\n"
+            "- **Category**: The category to which the product belongs.\n"
+            "- **Intent**: The identified intent behind the user's question.\n"
+            "- **Metadata**: Additional information and rules pertinent to the product or store policies.\n"
+            "- **Context**: Crucial details about the product, store, or other relevant information.\n\n"
+            "Evaluation Instructions:\n"
+            "- If the Revised Answer and the Original Answer are not none, evaluate the Revised Answer and register the score and the justification for it.\n"
+            "- If the Revised Answer is none, evaluate the Original Answer and register the score and the justification for it.\n\n"
+            "Evaluation Criteria:\n"
+            "- The answer must be consistent with the information provided in the context and metadata.\n"
+            "- It should not include information that cannot be inferred from the provided context.\n"
+            "- The answer should focus on information relevant to the user's question.\n"
+            "- Be particularly critical of answers that include assumptions, omit critical context, or misrepresent the provided information.\n\n"
+            "Provide a contextual score from 0 to 5, where 5 indicates perfect contextual alignment.\n"
+            "You must always call the function register_contextual_score with your contextual_score and a brief justification in English, do nothing else.\n\n"
+        ),
+        functions=[register_contextual_score],
+    )
+
+    suggester = AssistantAgent(
+        name="Suggester",
+        llm_config=cascade.llm_config_for("Suggester", llm_config),
+        system_message=(
+            "You are the Suggester. Your purpose is to suggest improvements for an answer provided to a user's question about a product.\n\n"
+            "You will be provided with:\n"
+            "- **Question**: The user's inquiry regarding the product.\n"
+            "- **Original Answer**: The response given to the user's question.\n"
+            "- **Semantic Score**: A score from 0 to 5 indicating the semantic accuracy of the answer.\n"
+            "- **Contextual Score**: A score from 0 to 5 indicating the contextual accuracy of the answer.\n"
+            "- **Justifications**: Brief explanations for the semantic and contextual scores.\n\n"
+            "Based on the scores and justifications provided by the reviewers, you must provide suggestions for improvement.\n"
+            "- Focus on addressing specific issues highlighted in the justifications.\n"
+            "- Ensure that your suggestions are actionable and aimed at enhancing the answer's quality.\n\n"
+            "Do not provide a revised answer, only suggestions for improvement.\n"
+            "The suggestions must be in English, while the question and answer may be in Portuguese or Spanish.\n"
+            "You must always call the function register_suggestions with your suggestions as a parameter, do nothing else.\n"
+        ),
+        functions=[register_suggestions],
+    )
+
+    rewriter = AssistantAgent(
+        name="Rewriter",
+        llm_config=cascade.llm_config_for("Rewriter", llm_config),
+        system_message=(
+            "You are the Rewriter. Your task is to rewrite answers that have not been evaluated positively by the reviewers, ensuring they meet both semantic and contextual standards.\n\n"
+            "You will be provided with the following information:\n"
+            "- **Question**: The user's inquiry regarding the product.\n"
+            "- **Original Answer**: The initial response given to the user's question.\n"
+            "- **Suggestions**: Recommendations for improvement provided by the Suggester.\n"
+            "- **Context**: Crucial details about the product, store, or other relevant information.\n"
+            "- **Category**: The category to which the product belongs.\n"
+            "- **Intent**: The identified intent behind the user's question.\n"
+            "- **Metadata**: Additional information and rules pertinent to the product or store policies.\n\n"
+            "Evaluation Criteria:\n"
+            "- The revised answer must directly and explicitly address all aspects of the user's question.\n"
+            "- It must be consistent with the information provided in the context and metadata.\n"
+            "- The answer should be grammatically correct, free of spelling errors, and use appropriate language without mixing languages.\n"
+            "- Retain any greetings or signatures present in the original answer, only removing duplicates, if any.\n"
+            "- If there isn't enough information to provide a revised answer, return 'CANNOT REWRITE'.\n\n"
+            "Provide the revised answer in the original language of the question.\n"
+            "You must always call the function register_revised_answer with your revised answer as a parameter, do nothing else.\n\n"
+        ),
+        functions=[register_revised_answer],
+    )
+
+    decider = AssistantAgent(
+        name="Decider",
+        llm_config=cascade.llm_config_for("Decider", llm_config),
+        system_message=(
+            "You are the Decider. Your task is to determine whether the revised answer provided to a user's question about a product is acceptable, requires further improvement, or if the question should not be answered at all.\n\n"
+            "You will be provided with the following information:\n"
+            "- **Question**: The user's inquiry regarding the product.\n"
+            "- **Original Answer**: The initial response given to the user's question.\n"
+            "- **Revised Answer**: The improved response provided by the Rewriter.\n"
+            "- **Context**: Crucial details about the product, store, or other relevant information.\n"
+            "- **Category**: The category to which the product belongs.\n"
+            "- **Intent**: The identified intent behind the user's question.\n"
+            "- **Metadata**: Additional information and rules pertinent to the product or store policies.\n"
+            "- **Semantic and Contextual Scores**: Scores and justifications provided by the reviewers.\n"
+            "- **Suggestions**: Recommendations for improvement provided by the Suggester.\n\n"
+            "Evaluation Criteria:\n"
+            "- Determine if the revised answer fully addresses the user's question with semantic and contextual accuracy.\n"
+            "- Do not accept answers that mention another product unless it is mentioned in the context or metadata, containing a link to it.\n"
+            "- Do not accept answers that state any part of the question cannot be answered due to insufficient information.\n"
+            "- Be particularly critical of answers that are vague, incomplete, or contain incorrect information.\n"
+            "- If the number of revisions is 2 or more and the revised answer is still not good enough, the decision must be 'DO_NOT_ANSWER'.\n\n"
+            "Possible Decisions:\n"
+            "- **ANSWER_REVISED**: The revised answer is acceptable and fully addresses the question.\n"
+            "- **REWRITE**: The revised answer is not good enough, but can be improved based on the given information.\n"
+            "- **DO_NOT_ANSWER**: The revised answer is not good enough and cannot be improved based on the given information.\n\n"
+            "You must always call the function register_decision with your decision and a brief justification in English, do nothing else.\n\n"
+        ),
+        functions=[register_decision],
+    )
+
+    # Used instead of the two reviewers above when a single call returns both reviews
+    combined_reviewer = AssistantAgent(
+        name="Combined_Reviewer",
+        llm_config=cascade.llm_config_for("Combined_Reviewer", llm_config),
+        system_message=(
+            "You are the Reviewer. Your task is to critically evaluate both the semantic accuracy of an answer provided to a user's question about a product and its alignment with the given context and metadata.\n\n"
+            "You will be provided with the following information:\n"
+            "- **Question**: The user's inquiry regarding the product.\n"
+            "- **Original Answer**: The initial response given to the user's question.\n"
+            "- **Revised Answer**: The improved response provided by the Rewriter, if available.\n"
+            "- **Category**: The category to which the product belongs.\n"
+            "- **Intent**: The identified intent behind the user's question.\n"
+            "- **Metadata**: Additional information and rules pertinent to the product or store policies.\n"
+            "- **Context**: Crucial details about the product, store, or other relevant information.\n\n"
+            "Evaluation Instructions:\n"
+            "- If the Revised Answer and the Original Answer are not none, evaluate the Revised Answer and register the scores and the justifications for them.\n"
+            "- If the Revised Answer is none, evaluate the Original Answer and register the scores and the justifications for them.\n\n"
+            "Semantic Criteria:\n"
+            "- The answer must directly and explicitly address all aspects of the user's question.\n"
+            "- It must be grammatically correct, free of spelling errors, and use appropriate language without mixing languages.\n"
+            "- The answer should be concise and avoid unnecessary information.\n"
+            "- Greetings and signatures shouldn't be taken into account in the evaluation, unless they are duplicated.\n"
+            "- Be particularly critical of answers that are vague, incomplete, or contain linguistic errors.\n\n"
+            "Contextual Criteria:\n"
+            "- The answer must be consistent with the information provided in the context and metadata.\n"
+            "- It should not include information that cannot be inferred from the provided context.\n"
+            "- The answer should focus on information relevant to the user's question.\n"
+            "- Be particularly critical of answers that include assumptions, omit critical context, or misrepresent the provided information.\n\n"
+            "Provide a semantic score from 0 to 5, where 5 indicates a perfect semantic match, and a contextual score from 0 to 5, where 5 indicates perfect contextual alignment.\n"
+            "You must always call the function register_review_scores once with your semantic_score, justification_semantic, contextual_score and justification_contextual, "
+            "with brief justifications in English, do nothing else.\n\n"
+        ),
+        functions=[register_review_scores],
+    )
+
+    # Used instead of the two reviewers above when they run at the same time
+    parallel_reviewer = ParallelReviewer(
+        semantic_reviewer=semantic_reviewer,
+        contextual_reviewer=contextual_reviewer,
+        llm_config=llm_config,
+        functions=[register_review_scores],
+    )
+
+    user_proxy = UserProxyAgent(
+        name="User",
+        llm_config=llm_config,
+        human_input_mode="NEVER",
+        code_execution_config={
+            "use_docker": False,
+        }
+    )
+
+    for agent in (semantic_reviewer, contextual_reviewer, suggester, rewriter, decider, combined_reviewer, parallel_reviewer, user_proxy):
+        agent.client_cache = completion_cache
+        cascade.attach(agent, reply_scores)
+        schedule_agent(agent)
+        instrument_agent(agent)
+        trace_agent(agent)
+
+    return SwarmTeam(
+        semantic_reviewer=semantic_reviewer,
+        contextual_reviewer=contextual_reviewer,
+        suggester=suggester,
+        rewriter=rewriter,
+        decider=decider,
+        combined_reviewer=combined_reviewer,
+        parallel_reviewer=parallel_reviewer,
+        user_proxy=user_proxy,
+    )
+
+
+def team_agents(team: SwarmTeam) -> list:
+    return list(team)
+
+
+def reset_agents(team: SwarmTeam):
+    """
+    Clears the chat history, reply counters and usage of a team so it can be reused.
+    """
+    for agent in team_agents(team):
+        agent.reset()
+
+
+agent_pool = AgentPool(build_agents, reset_agents, max_idle=int(os.getenv("AGENT_POOL_MAX_IDLE", "8")))
+budget_agent_pool = AgentPool(
+    lambda: build_agents(budget_llm_config), reset_agents, max_idle=int(os.getenv("AGENT_POOL_MAX_IDLE", "8"))
+) if budget_llm_config else None
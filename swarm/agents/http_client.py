@@ -0,0 +1,117 @@
+import os
+import logging
+import threading
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class PooledHTTPClient(httpx.Client):
+    """
+    HTTP client shared by the LLM clients of every agent of the process, so the connections
+    (and their TCP and TLS handshakes) to the LLM backend are reused across conversations.
+    autogen deep-copies the llm_config of each agent, so copies return the same client.
+    Every request is traced by httpcore, which counts the requests and the new connections.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(event_hooks={"request": [self._trace_request]}, **kwargs)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __copy__(self):
+        return self
+
+    def _trace_request(self, request: httpx.Request):
+        request.extensions["trace"] = self._trace
+
+        with self._lock:
+            self.requests += 1
+
+    def _trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    def stats(self) -> dict:
+        pool = getattr(self._transport, "_pool", None)
+
+        with self._lock:
+            reused = max(0, self.requests - self.connections)
+
+            return {
+                "requests": self.requests,
+                "new_connections": self.connections,
+                "reused_connections": reused,
+                "tls_handshakes": self.tls_handshakes,
+                "reuse_ratio": reused / self.requests if self.requests else 0.0,
+                "open_connections": len(getattr(pool, "connections", [])),
+            }
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds the client configured by the LLM_HTTP_* environment variables.
+        HTTP/2 (LLM_HTTP2=on) needs the h2 package; without it the client falls back to HTTP/1.1.
+        """
+        max_connections = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", str(max_connections))),
+            keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60")),
+        )
+        timeout = httpx.Timeout(
+            float(os.getenv("LLM_HTTP_TIMEOUT", "600")),
+            connect=float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5")),
+            pool=float(os.getenv("LLM_HTTP_POOL_TIMEOUT", "30")),
+        )
+        http2 = os.getenv("LLM_HTTP2", "off").lower() in ("1", "on", "true")
+
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("LLM_HTTP2 is on but the h2 package isn't installed, using HTTP/1.1")
+                http2 = False
+
+        return cls(limits=limits, timeout=timeout, http2=http2, follow_redirects=True)
+
+
+_client: PooledHTTPClient | None = None
+_client_lock = threading.Lock()
+
+
+def shared_http_client() -> PooledHTTPClient:
+    """
+    Returns the pooled HTTP client of the process, built on first use.
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            _client = PooledHTTPClient.from_env()
+
+        return _client
+
+
+def http_client_stats() -> dict:
+    with _client_lock:
+        return _client.stats() if _client is not None else {}
+
+
+def close_http_client():
+    global _client
+
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
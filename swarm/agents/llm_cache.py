@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import threading
+
+
+class CompletionCache:
+    """
+    Disk cache of LLM completions that autogen's OpenAIWrapper can use as `cache`
+    (it implements the get/set/close/context manager protocol of autogen's AbstractCache).
+    Each namespace has its own directory, size limit and least-recently-used eviction.
+    """
+
+    def __init__(self, directory: str, size_limit: int = 2 ** 31, ttl: float | None = None):
+        import diskcache
+
+        self.directory = directory
+        self.ttl = ttl
+        self._cache = diskcache.Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = self._cache.get(key, default=None)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return default if value is None else value
+
+    def set(self, key, value):
+        self._cache.set(key, value, expire=self.ttl)
+
+    def close(self):
+        self._cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The cache is shared by every agent, so it stays open after each completion
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size_bytes": self._cache.volume(),
+            }
+
+
+_caches: dict[str, CompletionCache] = {}
+_caches_lock = threading.Lock()
+
+
+def cache_namespace(llm_config: dict) -> str:
+    """
+    Names the cache of an LLM configuration after its models, with a hash of the settings
+    that change the completions (models, endpoints and temperature).
+    """
+    config_list = llm_config.get("config_list", [])
+    settings = {
+        "models": [(config.get("model"), config.get("base_url")) for config in config_list],
+        "temperature": llm_config.get("temperature"),
+    }
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    models = "+".join(str(config.get("model")) for config in config_list)
+
+    return f"{models}-{digest}".replace("/", "_").replace(":", "_")
+
+
+def completion_cache_for(llm_config: dict) -> CompletionCache | None:
+    """
+    Returns the process-wide completion cache of an LLM configuration, or None when
+    the cache is disabled, as it is unless LLM_CACHE=disk.
+    """
+    if os.getenv("LLM_CACHE", "off").lower() == "off":
+        return None
+
+    namespace = cache_namespace(llm_config)
+
+    with _caches_lock:
+        if namespace not in _caches:
+            ttl = os.getenv("LLM_CACHE_TTL")
+            _caches[namespace] = CompletionCache(
+                os.path.join(os.getenv("LLM_CACHE_DIR", ".cache/llm"), namespace),
+                size_limit=int(os.getenv("LLM_CACHE_SIZE_LIMIT", str(2 ** 31))),
+                ttl=float(ttl) if ttl else None,
+            )
+
+        return _caches[namespace]
+
+
+def close_completion_caches():
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.close()
+
+        _caches.clear()
+
+
+def completion_cache_stats() -> dict:
+    """
+    Returns the stats of every completion cache opened by the process, by namespace.
+    """
+    with _caches_lock:
+        return {namespace: cache.stats() for namespace, cache in _caches.items()}
@@ -0,0 +1,93 @@
+import json
+import asyncio
+import hashlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+from autogen import Agent, AssistantAgent
+
+
+class ParallelReviewer(AssistantAgent):
+    """
+    Runs the Semantic Reviewer and the Contextual Reviewer at the same time and joins their
+    scores into a single register_review_scores call, so a review pass costs one LLM latency
+    instead of two. The agent itself never calls the LLM.
+    """
+
+    def __init__(self, semantic_reviewer: AssistantAgent, contextual_reviewer: AssistantAgent, **kwargs):
+        super().__init__(
+            name="Parallel_Reviewer",
+            system_message="You run the semantic and the contextual reviews of an answer at the same time.",
+            **kwargs,
+        )
+        self.semantic_reviewer = semantic_reviewer
+        self.contextual_reviewer = contextual_reviewer
+
+        # The async reply is registered last so it comes first in async chats, sync chats skip it
+        self.register_reply([Agent, None], ParallelReviewer.review)
+        self.register_reply([Agent, None], ParallelReviewer.a_review, ignore_async_in_sync_chat=True)
+
+    def review(self, messages=None, sender=None, config=None):
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="parallel-review") as executor:
+            semantic = executor.submit(self.semantic_reviewer.generate_reply, messages=messages, sender=sender)
+            contextual = executor.submit(self.contextual_reviewer.generate_reply, messages=messages, sender=sender)
+
+            return True, self.join_reviews(semantic.result(), contextual.result())
+
+    async def a_review(self, messages=None, sender=None, config=None):
+        semantic, contextual = await asyncio.gather(
+            self.semantic_reviewer.a_generate_reply(messages=messages, sender=sender),
+            self.contextual_reviewer.a_generate_reply(messages=messages, sender=sender),
+        )
+
+        return True, self.join_reviews(semantic, contextual)
+
+    @classmethod
+    def join_reviews(cls, semantic_reply, contextual_reply) -> dict:
+        """
+        Builds the register_review_scores tool call from the tool calls of both reviewers.
+        A reviewer that didn't register its score gets 0, which sends the answer to be rewritten.
+        """
+        semantic = cls.tool_arguments(semantic_reply, "register_semantic_score")
+        contextual = cls.tool_arguments(contextual_reply, "register_contextual_score")
+
+        arguments = {
+            "semantic_score": semantic.get("semantic_score", 0),
+            "justification_semantic": semantic.get("justification", "The Semantic Reviewer did not register a score."),
+            "contextual_score": contextual.get("contextual_score", 0),
+            "justification_contextual": contextual.get("justification", "The Contextual Reviewer did not register a score."),
+        }
+
+        serialized = json.dumps(arguments, ensure_ascii=False)
+
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    # Derived from the arguments so the later prompts, and their cached completions, are repeatable
+                    "id": f"call_{hashlib.sha256(serialized.encode('utf-8')).hexdigest()[:24]}",
+                    "type": "function",
+                    "function": {"name": "register_review_scores", "arguments": serialized},
+                }
+            ],
+        }
+
+    @staticmethod
+    def tool_arguments(reply, function_name: str) -> dict:
+        """
+        Returns the arguments of the first call to function_name in a reply, or an empty dict.
+        """
+        if not isinstance(reply, dict):
+            return {}
+
+        for tool_call in reply.get("tool_calls") or []:
+            function = tool_call.get("function", {})
+
+            if function.get("name") == function_name:
+                try:
+                    return json.loads(function.get("arguments") or "{}")
+                except json.JSONDecodeError:
+                    return {}
+
+        return {}
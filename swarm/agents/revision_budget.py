@@ -0,0 +1,83 @@
+import os
+import time
+import difflib
+
+
+class RevisionBudget:
+    """
+    Bounds the REWRITE loop of a swarm conversation, which is otherwise only bounded by max_rounds.
+    The loop stops, and the answer becomes DO_NOT_ANSWER, when:
+      - "max_revisions": the answer was already rewritten max_revisions times;
+      - "no_improvement": the last rewrite raised the score by less than min_improvement;
+      - "deadline": the conversation has been running for more than deadline seconds;
+      - "identical_rewrite": a rewrite is nearly identical (similarity ratio) to the previous one.
+    A limit set to 0 is disabled.
+    """
+
+    def __init__(self, max_revisions: int = 2, min_improvement: int = 1, deadline: float = 0.0, similarity: float = 0.95):
+        self.max_revisions = max_revisions
+        self.min_improvement = min_improvement
+        self.deadline = deadline
+        self.similarity = similarity
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds the budget configured by SWARM_MAX_REVISIONS, SWARM_MIN_SCORE_IMPROVEMENT,
+        SWARM_REVISION_DEADLINE and SWARM_REWRITE_SIMILARITY.
+        """
+        return cls(
+            max_revisions=int(os.getenv("SWARM_MAX_REVISIONS", "2")),
+            min_improvement=int(os.getenv("SWARM_MIN_SCORE_IMPROVEMENT", "1")),
+            deadline=float(os.getenv("SWARM_REVISION_DEADLINE", "0")),
+            similarity=float(os.getenv("SWARM_REWRITE_SIMILARITY", "0.95")),
+        )
+
+    def deadline_at(self) -> float | None:
+        """
+        Returns the monotonic time at which a conversation starting now runs out of time.
+        """
+        return time.monotonic() + self.deadline if self.deadline else None
+
+    @staticmethod
+    def past_deadline(context_variables) -> bool:
+        deadline = context_variables.get("revision_deadline")
+
+        return deadline is not None and time.monotonic() > deadline
+
+    def stop_rewriting(self, context_variables) -> str | None:
+        """
+        Called before a REWRITE decision loops back to the Rewriter.
+        Returns the reason to stop the loop, or None to rewrite again.
+        """
+        if self.max_revisions and context_variables.get("number_of_revisions", 0) >= self.max_revisions:
+            return "max_revisions"
+
+        original_score = context_variables.get("original_score")
+        new_score = context_variables.get("new_score")
+
+        if self.min_improvement and original_score is not None and new_score is not None:
+            if new_score - original_score < self.min_improvement:
+                return "no_improvement"
+
+        if self.past_deadline(context_variables):
+            return "deadline"
+
+        return None
+
+    def stop_reviewing(self, context_variables, revised_answer: str) -> str | None:
+        """
+        Called when a revised answer is registered, before it goes to the reviewers.
+        Returns the reason to stop the loop, or None to review it.
+        """
+        # The first rewrite is compared with nothing: the original answer is expected to be close to it
+        previous = context_variables.get("original_answer") if context_variables.get("number_of_revisions", 0) > 1 else None
+
+        if self.similarity and previous:
+            if difflib.SequenceMatcher(None, previous, revised_answer).ratio() >= self.similarity:
+                return "identical_rewrite"
+
+        if self.past_deadline(context_variables):
+            return "deadline"
+
+        return None
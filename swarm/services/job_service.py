@@ -0,0 +1,185 @@
+import os
+import math
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import List
+
+from models.revision import RevisionRequest
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a batch doesn't fit in the job queue. retry_after estimates, in seconds,
+    when there will be room for it.
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, requests: List[RevisionRequest]):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.ids = [req.id for req in requests]
+        self.results = [None] * len(requests)
+        self.completed = 0
+        self.failed = 0
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def total(self) -> int:
+        return len(self.ids)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "cancelled")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "pending": self.total - self.completed - self.failed,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobService:
+    """
+    Runs batches of revision requests in the background.
+    The items of every job go through a bounded queue consumed by a fixed pool of workers;
+    a batch that doesn't fit in the queue is rejected with QueueFullError. Jobs are kept in
+    memory, the oldest finished ones are dropped when there are more than `retention`.
+    """
+
+    def __init__(self, revision_service, workers: int | None = None, max_queue: int | None = None, retention: int | None = None):
+        self.revision_service = revision_service
+        self.workers = workers or int(os.getenv("JOB_WORKERS", str(revision_service.max_concurrency)))
+        self.max_queue = max_queue or int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+        self.retention = retention or int(os.getenv("JOB_RETENTION", "1000"))
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self._queue: asyncio.Queue | None = None
+        self._tasks: List[asyncio.Task] = []
+        # Moving average of the time an item takes, used to estimate Retry-After
+        self._item_seconds = 10.0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, requests: List[RevisionRequest]) -> Job:
+        """
+        Queues all the items of a batch, or none of them if the queue doesn't have room.
+        An empty batch is completed right away.
+        """
+        if len(requests) > self.max_queue:
+            raise ValueError(f"A job can have at most {self.max_queue} items")
+
+        free = self.max_queue - self._queue.qsize()
+
+        if len(requests) > free:
+            waiting = len(requests) - free
+            retry_after = math.ceil(waiting * self._item_seconds / self.workers)
+            raise QueueFullError(f"The job queue is full, {free} items can be queued right now", max(1, retry_after))
+
+        job = Job(requests)
+        self.jobs[job.id] = job
+
+        # No worker will ever finish an empty job
+        if not requests:
+            job.status = "completed"
+            job.finished_at = time.time()
+
+        for index, req in enumerate(requests):
+            self._queue.put_nowait((job, index, req))
+
+        self._forget_old_jobs()
+
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def results(self, job: Job, offset: int = 0, limit: int = 100) -> List[dict]:
+        """
+        Returns a page of the results of a job, in the order of its items.
+        Items that haven't finished yet are reported with their status.
+        """
+        page = []
+
+        for index in range(offset, min(offset + limit, job.total)):
+            result = job.results[index]
+
+            if result is None:
+                status = "cancelled" if job.status == "cancelled" else "pending"
+                result = {"id": job.ids[index], "status": status}
+
+            page.append(result)
+
+        return page
+
+    def cancel(self, job: Job) -> Job:
+        """
+        Cancels a job. Its queued items are skipped, the ones already running still finish.
+        """
+        if not job.done:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+
+        return job
+
+    async def _work(self):
+        while True:
+            job, index, req = await self._queue.get()
+
+            try:
+                if job.status == "cancelled":
+                    continue
+
+                job.status = "running"
+                start = time.perf_counter()
+
+                try:
+                    response = await self.revision_service.aprocess_revision(req)
+                    job.results[index] = self.revision_service.tag_result(req, response)
+                    job.completed += 1
+                except Exception as e:
+                    job.results[index] = {"id": req.id, "error": str(e)}
+                    job.failed += 1
+
+                self._item_seconds = 0.9 * self._item_seconds + 0.1 * (time.perf_counter() - start)
+
+                if job.completed + job.failed == job.total and job.status != "cancelled":
+                    job.status = "completed"
+                    job.finished_at = time.time()
+            finally:
+                self._queue.task_done()
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            del self.jobs[job_id]
+
+    def stats(self) -> dict:
+        return {
+            "queued_items": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "jobs": len(self.jobs),
+        }
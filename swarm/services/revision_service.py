@@ -1,25 +1,193 @@
 import os
-import csv
 import json
+import asyncio
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 from autogen.agentchat.group import ContextVariables
-from autogen.agentchat.group.multi_agent_chat import initiate_group_chat
+from autogen.agentchat.group.multi_agent_chat import a_initiate_group_chat, initiate_group_chat
 from autogen.agentchat.group.patterns import DefaultPattern
 
 from models.revision import RevisionRequest
-from agents.agents import semantic_reviewer, contextual_reviewer, suggester, rewriter, decider, user_proxy
+from services.result_cache import ResultCache
+from services.result_writer import ResultWriter
+from services.context_pruner import ContextPruner
+from services.tokens import TokenBudget
+from services.tracing import tracer
+from services.prefilter import Prefilter
+from services.single_flight import SingleFlight
+from services.metrics import (
+    metrics, record_usage, AGENT_TEAMS, CONTEXT_TOKENS_SAVED, CONVERSATION_ROUNDS, CONVERSATIONS_IN_FLIGHT,
+    LLM_CACHE_HIT_RATIO, LLM_CACHE_LOOKUPS, LLM_HTTP_CONNECTIONS, LLM_HTTP_REQUESTS, LLM_HTTP_REUSE_RATIO,
+    LLM_HTTP_TLS_HANDSHAKES, RESULT_CACHE_HIT_RATIO, RESULT_CACHE_LOOKUPS,
+)
+from agents.agents import agent_pool, budget_agent_pool, config_list, revision_budget, team_agents
+from agents.usage import collect_usage, total_usage
+from agents.llm_cache import close_completion_caches, completion_cache_stats
+from agents.http_client import close_http_client, http_client_stats
+
+SWARM_REVISIONS = metrics.histogram(
+    "swarm_revisions", "Revisions of the answer made in each swarm conversation.", buckets=(0, 1, 2, 3, 4, 5, 8))
+SWARM_EARLY_STOPS = metrics.counter(
+    "swarm_early_stops_total", "Swarm conversations whose REWRITE loop was stopped by the revision budget.", ("reason",))
 
-context_variables: ContextVariables = ContextVariables(data={})
 
 class RevisionService:
-    def __init__(self, results_file: str = "results.csv"):
-        self.results_file = results_file
+    # First agent of each review pass, by review mode
+    REVIEW_AGENTS = {"sequential": "Semantic_Reviewer", "parallel": "Parallel_Reviewer", "combined": "Combined_Reviewer"}
+    REVIEW_MODES = tuple(REVIEW_AGENTS)
+
+    def __init__(self, results_file: str | None = None, max_concurrency: int | None = None, review_mode: str | None = None):
+        # Records are written in batches by a background thread, outside the request latency
+        self.result_writer = ResultWriter.from_env(results_file)
+        # "sequential" hands off from the Semantic to the Contextual Reviewer,
+        # "parallel" runs both reviews at the same time through the Parallel_Reviewer,
+        # "combined" makes both reviews in a single call of the Combined_Reviewer
+        self.review_mode = review_mode or os.getenv("SWARM_REVIEW_MODE", "sequential")
+        if self.review_mode not in self.REVIEW_MODES:
+            raise ValueError(f"Unknown review mode '{self.review_mode}', expected one of {self.REVIEW_MODES}")
+
+        # Number of items of a batch that are processed at the same time
+        self.max_concurrency = max_concurrency or int(os.getenv("REVISION_MAX_CONCURRENCY", "4"))
+        self.context_pruner = ContextPruner.from_env()
+        # Prompts over the budget are trimmed, rejected or routed to the budget model before the conversation starts
+        self.token_budget = TokenBudget.from_env()
+        if self.token_budget.max_tokens and self.token_budget.policy == "route" and budget_agent_pool is None:
+            raise ValueError("PROMPT_BUDGET_POLICY=route needs the cheaper model in BUDGET_MODEL")
+        # Optional classifier that returns clearly good answers without running the agents
+        self.prefilter = Prefilter.from_env()
+        # Results of the review modes are cached separately
+        self.result_cache = ResultCache.from_env(namespace=f"swarm:{self.review_mode}")
+        # Identical requests in flight at the same time, keyed like the result cache, run only once
+        self.in_flight = SingleFlight.from_env()
+        metrics.on_collect(self.collect_metrics)
+        tracer.service_name = os.getenv("OTEL_SERVICE_NAME", "swarm")
 
     def process_revision(self, request: RevisionRequest) -> str:
-        global context_variables
+        """
+        Processes a single revision request, reusing the result of an identical earlier or in-flight request.
+        Returns the final answer and the scores.
+        """
+        key = self.result_cache.make_key(request)
+        found, response = self.result_cache.get(key)
+
+        if not found:
+            def run():
+                response = self.run_revision(request)
+                self.result_cache.set(key, response)
+                return response
+
+            # Identical requests that arrive while this one runs share its conversation
+            response = self.in_flight.do(key, run)
+
+        return response
+
+    async def aprocess_revision(self, request: RevisionRequest) -> str:
+        """
+        Processes a single revision request without blocking the event loop,
+        reusing the result of an identical earlier or in-flight request.
+        """
+        key = self.result_cache.make_key(request)
+        found, response = self.result_cache.get(key)
+
+        if not found:
+            async def run():
+                response = await self.arun_revision(request)
+                self.result_cache.set(key, response)
+                return response
+
+            # Identical requests that arrive while this one runs share its conversation
+            response = await self.in_flight.ado(key, run)
+
+        return response
+
+    def run_revision(self, request: RevisionRequest) -> str:
+        """
+        Runs the conversation for a single revision request.
+        Returns the final answer and the scores.
+        """
+        probability = self.prefilter.keep_probability(request)
+        if self.prefilter.skips(probability):
+            return self.keep_original(request)
+
+        context_variables, messages, stats = self.build_conversation(request)
+        stats["prefilter_probability"] = probability
+
+        with CONVERSATIONS_IN_FLIGHT.track_in_progress(), self.agent_pool_for(stats).acquire() as team:
+            with tracer.trace(request.id, team_agents(team)) as trace:
+                if trace is not None:
+                    # The tools find the trace of their conversation through its context variables
+                    context_variables["trace_id"] = trace.trace_id
+
+                result, final_context, last_agent = initiate_group_chat(
+                    pattern=self.build_pattern(team, context_variables),
+                    messages=messages,
+                    max_rounds=30,
+                )
 
+            stats["trace_id"] = trace.trace_id if trace is not None else None
+            # The usage of the agents is cleared once the team is released
+            stats["rounds"] = len(result.chat_history)
+            stats["usage"] = collect_usage(team_agents(team))
+
+        return self.finish_revision(request, final_context, stats)
+
+    async def arun_revision(self, request: RevisionRequest) -> str:
+        """
+        Runs the conversation for a single revision request without blocking the event loop.
+        Returns the final answer and the scores.
+        """
+        probability = self.prefilter.keep_probability(request)
+        if self.prefilter.skips(probability):
+            return self.keep_original(request)
+
+        context_variables, messages, stats = self.build_conversation(request)
+        stats["prefilter_probability"] = probability
+
+        with CONVERSATIONS_IN_FLIGHT.track_in_progress(), self.agent_pool_for(stats).acquire() as team:
+            with tracer.trace(request.id, team_agents(team)) as trace:
+                if trace is not None:
+                    # The tools find the trace of their conversation through its context variables
+                    context_variables["trace_id"] = trace.trace_id
+
+                result, final_context, last_agent = await a_initiate_group_chat(
+                    pattern=self.build_pattern(team, context_variables),
+                    messages=messages,
+                    max_rounds=30,
+                )
+
+            stats["trace_id"] = trace.trace_id if trace is not None else None
+            # The usage of the agents is cleared once the team is released
+            stats["rounds"] = len(result.chat_history)
+            stats["usage"] = collect_usage(team_agents(team))
+
+        return self.finish_revision(request, final_context, stats)
+
+    @staticmethod
+    def keep_original(request: RevisionRequest) -> dict:
+        """
+        Returns the original answer of a request the prefilter is confident about, without reviewing it.
+        No result record is saved, as there is no review.
+        """
+        return {
+            "final_answer": request.answer,
+            "previous_score": None,
+            "new_score": "-",
+        }
+
+    @staticmethod
+    def agent_pool_for(stats: dict):
+        """
+        Returns the pool of the budget model for the requests routed to it, the default pool otherwise.
+        """
+        return budget_agent_pool if stats["budget_action"] == "route" else agent_pool
+
+    def build_conversation(self, request: RevisionRequest):
+        """
+        Builds the context variables and the initial messages of the conversation for a request.
+        """
         language = "portuguese" if request.locale == "pt" else "spanish"
         intent = request.intent.get("name")
 
@@ -33,12 +201,16 @@ class RevisionService:
             "original_answer": request.answer,
         }
 
-        formatted_question = json.dumps(question_data, indent=2, ensure_ascii=False)
+        # Only the context fields relevant to the intent go into the prompt, as compact JSON within the token budget
+        model = config_list[0]["model"]
+        pruned_data = self.context_pruner.prepare(question_data)
+        formatted_question, stats = self.token_budget.fit(pruned_data, self.context_pruner.serialize, model)
+        stats["context_tokens_saved"] = self.context_pruner.tokens_saved(question_data, formatted_question, model)
 
-        context_variables.clear()
-        context_variables.update({
+        # Every conversation has its own context variables, shared only by its own agents
+        context_variables = ContextVariables(data={
             "question": request.question,
-            "context": request.context,
+            "context": pruned_data["context"],
             "category": request.category,
             "metadata": request.metadata,
             "language": language,
@@ -60,30 +232,50 @@ class RevisionService:
             "decision": None,
             "decision_justification": None,
             "number_of_revisions": 0,
+            "revision_deadline": revision_budget.deadline_at(),
+            "stop_reason": None,
+            "review_agent": self.REVIEW_AGENTS[self.review_mode],
         })
 
-        swarm_pattern = DefaultPattern(
-            agents=[semantic_reviewer, contextual_reviewer, suggester, rewriter, decider],
-            initial_agent=semantic_reviewer,
+        messages = [
+            {
+                "role": "user",
+                "content": (
+                    "The agents need to work together to review the answer to the question. \n"
+                    "If they don't think that the answer is good enough, they should suggest a better one or decide to not answer. \n"
+                    "This is the data they have to work with: \n"
+                    f"{formatted_question} "
+                )
+            }
+        ]
+
+        return context_variables, messages, stats
+
+    def build_pattern(self, team, context_variables: ContextVariables) -> DefaultPattern:
+        """
+        Builds the swarm pattern that runs a conversation with the agents of a team.
+        """
+        if self.review_mode == "parallel":
+            reviewers = [team.parallel_reviewer]
+        elif self.review_mode == "combined":
+            reviewers = [team.combined_reviewer]
+        else:
+            reviewers = [team.semantic_reviewer, team.contextual_reviewer]
+
+        return DefaultPattern(
+            agents=[*reviewers, team.suggester, team.rewriter, team.decider],
+            initial_agent=reviewers[0],
             context_variables=context_variables,
-            user_agent=user_proxy,
+            user_agent=team.user_proxy,
         )
 
-        result, final_context, last_agent = initiate_group_chat(
-            pattern=swarm_pattern,
-            messages=[
-                {
-                    "role": "user",
-                    "content": (
-                        "The agents need to work together to review the answer to the question. \n"
-                        "If they don't think that the answer is good enough, they should suggest a better one or decide to not answer. \n"
-                        "This is the data they have to work with: \n"
-                        f"{formatted_question} "
-                    )
-                }
-            ],
-            max_rounds=30,
-        )
+    def finish_revision(self, request: RevisionRequest, final_context: ContextVariables, stats: dict):
+        """
+        Applies the decision rules to the final context of a conversation and saves the results.
+        Returns the final answer and the scores.
+        """
+        language = "portuguese" if request.locale == "pt" else "spanish"
+        intent = request.intent.get("name")
 
         final_answer = final_context.get("final_answer")
         previous_score = final_context.get("original_score")
@@ -93,15 +285,19 @@ class RevisionService:
         decision = final_context.get("decision")
         decision_justification = final_context.get("decision_justification")
         number_of_revisions = final_context.get("number_of_revisions")
+        stop_reason = final_context.get("stop_reason")
+
+        # Tokens and cost of the LLM calls of all the agents, excluding cached completions
+        usage = total_usage(stats["usage"])
 
-        if ((new_score is not None) and (new_score <= 7)) or (decision is "REWRITE") or (decision is "DO_NOT_ANSWER"):
+        if ((new_score is not None) and (new_score <= 7)) or (decision == "REWRITE") or (decision == "DO_NOT_ANSWER"):
             final_answer = "DO_NOT_ANSWER"
 
         if (previous_score is not None) and (previous_score > 7):
             final_answer = request.answer
 
         new_score = new_score if new_score is not None else "-"
-        decision = "DO_NOT_ANSWER" if decision is "REWRITE" else decision
+        decision = "DO_NOT_ANSWER" if decision == "REWRITE" else decision
         final_answer = final_answer if final_answer != "DO_NOT_ANSWER" else "-"
 
         # Salva os resultados
@@ -118,10 +314,28 @@ class RevisionService:
             "Decision": decision,
             "Justification": decision_justification,
             "Number of Revisions": number_of_revisions,
+            "Stop Reason": stop_reason or "-",
             "Language": language,
             "Intent": intent,
             "Category": request.category,
+            "Context Tokens Saved": stats["context_tokens_saved"],
+            "Prompt Tokens Estimate": stats["prompt_tokens_estimate"],
+            "Budget Action": stats["budget_action"] or "-",
+            "Prompt Tokens": usage["prompt_tokens"],
+            "Completion Tokens": usage["completion_tokens"],
+            "Total Cost": round(usage["cost"], 6),
+            "Token Usage": json.dumps(stats["usage"]),
+            "Trace Id": stats["trace_id"] or "-",
+            "Prefilter Probability": round(stats["prefilter_probability"], 4) if stats["prefilter_probability"] is not None else "-",
         }
+
+        record_usage(stats["usage"])
+        CONTEXT_TOKENS_SAVED.inc(max(0, stats["context_tokens_saved"]))
+        self.prefilter.record_outcome(stats["prefilter_probability"], previous_score)
+        CONVERSATION_ROUNDS.observe(stats["rounds"])
+        SWARM_REVISIONS.observe(number_of_revisions or 0)
+        if stop_reason is not None:
+            SWARM_EARLY_STOPS.inc(reason=stop_reason)
         self.save_result(new_record)
 
         return {
@@ -130,36 +344,128 @@ class RevisionService:
             "new_score": new_score,
         }
     
-    def process_revisions(self, requests: List[RevisionRequest]) -> List[str]:
+    def process_revisions(self, requests: List[RevisionRequest], max_concurrency: int | None = None) -> List:
         """
-        Processes a list of revision requests.
-        Returns a list of final revised answers.
+        Processes a list of revision requests, running up to max_concurrency of them at the same time.
+        Returns the results in the same order as the requests. A request that fails is returned as
+        {"id": ..., "error": ...} instead of failing the whole batch.
         """
-        responses = []
-        for req in requests:
-            revised = self.process_revision(req)
-            responses.append(revised)
+        if not requests:
+            return []
+
+        limit = max(1, min(max_concurrency or self.max_concurrency, len(requests)))
+
+        with ThreadPoolExecutor(max_workers=limit, thread_name_prefix="revision") as executor:
+            futures = [executor.submit(self.process_revision, req) for req in requests]
+
+            responses = []
+            for req, future in zip(requests, futures):
+                try:
+                    responses.append(future.result())
+                except Exception as e:
+                    responses.append({"id": req.id, "error": str(e)})
 
         return responses
 
-    def save_result(self, record):
+    async def aprocess_revisions(self, requests: List[RevisionRequest], max_concurrency: int | None = None) -> List:
+        """
+        Async version of process_revisions, with the same ordering and error semantics.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrency))
+
+        async def run(req: RevisionRequest):
+            async with semaphore:
+                try:
+                    return await self.aprocess_revision(req)
+                except Exception as e:
+                    return {"id": req.id, "error": str(e)}
+
+        return list(await asyncio.gather(*(run(req) for req in requests)))
+
+    async def astream_revisions(self, requests: List[RevisionRequest], max_concurrency: int | None = None):
+        """
+        Processes a list of revision requests like aprocess_revisions, but yields each result as soon
+        as it is ready, tagged with the request id, and finishes with a summary record.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrency))
+        start = time.perf_counter()
+
+        async def run(req: RevisionRequest):
+            async with semaphore:
+                try:
+                    return self.tag_result(req, await self.aprocess_revision(req))
+                except Exception as e:
+                    return {"id": req.id, "error": str(e)}
+
+        tasks = [asyncio.create_task(run(req)) for req in requests]
+        failed = 0
+
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                record = await next_result
+                failed += "error" in record
+                yield record
+        finally:
+            # The client may disconnect in the middle of the stream
+            for task in tasks:
+                task.cancel()
+
+        yield {
+            "summary": {
+                "total": len(requests),
+                "succeeded": len(requests) - failed,
+                "failed": failed,
+                "elapsed_seconds": round(time.perf_counter() - start, 3),
+            }
+        }
+
+    @staticmethod
+    def tag_result(request: RevisionRequest, response) -> dict:
         """
-        Reads existing records (if any) and adds a new record,
-        saving everything to the CSV file.
+        Tags the result of a request with its id, for results that are delivered out of order.
         """
-        # Check if the file exists and if it is empty
-        file_exists = os.path.exists(self.results_file)
-        is_empty = not file_exists or os.stat(self.results_file).st_size == 0
+        return {"id": request.id, **response}
 
-        # Open the file in append mode
-        with open(self.results_file, "a", newline="", encoding="utf-8") as f:
-            # Use the keys of the record as CSV field names
-            fieldnames = list(record.keys())
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+    def collect_metrics(self):
+        """
+        Copies the stats of the caches, agent pools and LLM HTTP client into the metrics, when they are scraped.
+        """
+        cache_stats = self.result_cache.stats()
+        RESULT_CACHE_LOOKUPS.set(cache_stats["memory_hits"], outcome="memory_hit")
+        RESULT_CACHE_LOOKUPS.set(cache_stats["disk_hits"], outcome="disk_hit")
+        RESULT_CACHE_LOOKUPS.set(cache_stats["misses"], outcome="miss")
+        RESULT_CACHE_HIT_RATIO.set(cache_stats["hit_rate"])
+
+        for namespace, stats in completion_cache_stats().items():
+            LLM_CACHE_LOOKUPS.set(stats["hits"], namespace=namespace, outcome="hit")
+            LLM_CACHE_LOOKUPS.set(stats["misses"], namespace=namespace, outcome="miss")
+            LLM_CACHE_HIT_RATIO.set(stats["hit_rate"], namespace=namespace)
+
+        http_stats = http_client_stats()
+        if http_stats:
+            LLM_HTTP_REQUESTS.set(http_stats["new_connections"], connection="new")
+            LLM_HTTP_REQUESTS.set(http_stats["reused_connections"], connection="reused")
+            LLM_HTTP_CONNECTIONS.set(http_stats["open_connections"])
+            LLM_HTTP_TLS_HANDSHAKES.set(http_stats["tls_handshakes"])
+            LLM_HTTP_REUSE_RATIO.set(http_stats["reuse_ratio"])
+
+        for name, pool in (("default", agent_pool), ("budget", budget_agent_pool)):
+            if pool is not None:
+                pool_stats = pool.stats()
+                AGENT_TEAMS.set(pool_stats["in_use"], pool=name, state="in_use")
+                AGENT_TEAMS.set(pool_stats["idle"], pool=name, state="idle")
 
-            # If the file does not exist or is empty, write the header row
-            if is_empty:
-                writer.writeheader()
+    def close(self):
+        """
+        Releases the resources held by the service when the application shuts down.
+        """
+        self.result_writer.close()
+        self.result_cache.close()
+        close_completion_caches()
+        close_http_client()
 
-            # Write the new record to the CSV file
-            writer.writerow(record)
+    def save_result(self, record):
+        """
+        Queues a record to be appended to the results file by the background writer.
+        """
+        self.result_writer.write(record)
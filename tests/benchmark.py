@@ -0,0 +1,243 @@
+"""
+Benchmarks the orchestration overhead of the three services against the fake LLM server.
+
+Each service runs in its own process (their packages share names), drives its RevisionService
+through the async path with a fixed concurrency and reports throughput, p50/p99 latency,
+memory growth, conversation rounds and LLM calls per request. The result and completion caches
+are disabled so every request runs its whole conversation.
+
+Usage (from the repository root):
+    python tests/benchmark.py --requests 200 --concurrency 50 --latency lognormal:0.3,0.4
+    python tests/benchmark.py --service swarm --review-mode parallel --output swarm.json
+    python tests/benchmark.py --baseline swarm.json --tolerance 0.15   # exits with 1 on a regression
+
+The benchmark exits with 1 when any request fails, and reports the first distinct errors.
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_llm_server import FakeLLMServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ["user_reviewer", "group_chat", "swarm"]
+# Distinct errors kept in a report
+MAX_ERRORS = 5
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def rss_mb() -> float:
+    """
+    Resident memory of the process, from /proc on Linux and the peak RSS elsewhere.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def metric_total(text: str, name: str) -> float:
+    """
+    Adds up every series of a metric in the Prometheus text format.
+    """
+    return sum(float(value) for value in re.findall(rf"^{name}(?:\{{[^}}]*\}})? (\S+)$", text, re.MULTILINE))
+
+
+def run_worker(args):
+    """
+    Runs inside the service directory: benchmarks its RevisionService and prints the report as JSON.
+    """
+    sys.path.insert(0, os.getcwd())
+    from models.revision import RevisionRequest
+    from services.revision_service import RevisionService
+    from services.metrics import metrics
+
+    with open(args.corpus, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    # Every request gets its own question so the scenarios of the fake LLM are spread out
+    requests = [
+        RevisionRequest(**{**records[i % len(records)], "id": i, "question": f"{records[i % len(records)]['question']} #{i}"})
+        for i in range(args.requests)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        options = {"review_mode": args.review_mode} if args.service == "swarm" else {}
+        service = RevisionService(results_file=os.path.join(tmp, "results.jsonl"), **options)
+
+        async def main():
+            # Same executor as the services' lifespan hook, which runs the blocking LLM calls
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(max_workers=int(os.getenv("LLM_IO_THREADS", "64")), thread_name_prefix="llm-io"))
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies, errors = [], Counter()
+
+            async def timed(req):
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        await service.aprocess_revision(req)
+                    except Exception as e:
+                        errors[f"{type(e).__name__}: {e}"[:300]] += 1
+                    latencies.append(time.perf_counter() - start)
+
+            # A short warm-up builds the agent pool before memory and time are measured
+            await asyncio.gather(*(timed(req) for req in requests[:args.warmup]))
+            latencies.clear()
+            errors.clear()
+            before = rss_mb()
+            start = time.perf_counter()
+            await asyncio.gather(*(timed(req) for req in requests[args.warmup:]))
+
+            return latencies, errors, time.perf_counter() - start, before
+
+        latencies, errors, elapsed, rss_before = asyncio.run(main())
+        rss_after = rss_mb()
+        text = metrics.render()
+        service.close()
+
+    conversations = metric_total(text, "revision_conversation_rounds_count")
+
+    report = {
+        "service": args.service + (f":{args.review_mode}" if args.service == "swarm" else ""),
+        "requests": len(latencies),
+        "failures": sum(errors.values()),
+        "errors": [{"error": error, "count": count} for error, count in errors.most_common(MAX_ERRORS)],
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_s": round(percentile(latencies, 0.50), 3),
+        "p99_s": round(percentile(latencies, 0.99), 3),
+        "rss_growth_mb": round(rss_after - rss_before, 1),
+        "rss_mb": round(rss_after, 1),
+        "rounds_per_request": round(metric_total(text, "revision_conversation_rounds_sum") / conversations, 2) if conversations else None,
+        "llm_calls_per_request": round(metric_total(text, "llm_call_duration_seconds_count") / conversations, 2) if conversations else None,
+    }
+
+    print(json.dumps(report))
+
+
+def run_service(service, args, base_url):
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": base_url,
+        "OLLAMA_BASE_URL": base_url,
+        # The fake LLM stands in for Ollama too, but serves any number of calls at the same time
+        "OLLAMA_MAX_CONCURRENCY": "1000",
+        "OPENAI_API_KEY": "fake",
+        "RESULT_CACHE_SIZE": "0",
+        "RESULT_CACHE_DIR": "",
+        "LLM_CACHE": "off",
+    }
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", "--service", service,
+        "--corpus", os.path.abspath(args.corpus), "--requests", str(args.requests),
+        "--concurrency", str(args.concurrency), "--warmup", str(args.warmup), "--review-mode", args.review_mode,
+    ]
+    completed = subprocess.run(command, cwd=os.path.join(ROOT, service), env=env, capture_output=True, text=True)
+
+    if completed.returncode != 0:
+        raise RuntimeError(f"The {service} benchmark failed:\n{completed.stderr[-4000:]}")
+
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def regressions(reports, baseline, tolerance):
+    """
+    Lists the services with failed requests, and those whose throughput dropped or whose p99 rose
+    by more than the tolerance.
+    """
+    previous = {report["service"]: report for report in baseline}
+    found = failures(reports)
+
+    for report in reports:
+        before = previous.get(report["service"])
+
+        if before is None:
+            continue
+        if report["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            found.append(f"{report['service']}: throughput {before['throughput_rps']} -> {report['throughput_rps']} rps")
+        if report["p99_s"] > before["p99_s"] * (1 + tolerance):
+            found.append(f"{report['service']}: p99 {before['p99_s']} -> {report['p99_s']} s")
+
+    return found
+
+
+def failures(reports):
+    """
+    Lists the services with failed requests: their numbers don't measure the whole conversation.
+    """
+    return [
+        f"{report['service']}: {report['failures']} failed requests, first error: {report['errors'][0]['error'].splitlines()[0]}"
+        for report in reports
+        if report["failures"]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", choices=SERVICES, action="append", help="Service to benchmark (repeatable, all by default).")
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "tests", "data", "sample_requests.jsonl"))
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--review-mode", default="sequential", choices=["sequential", "parallel", "combined"], help="Review mode of swarm.")
+    parser.add_argument("--latency", default="fixed:0.05", help="Latency distribution of the fake LLM.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the reports to this JSON file.")
+    parser.add_argument("--baseline", help="Reports of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.service = args.service[0]
+        return run_worker(args)
+
+    server = FakeLLMServer(latency=args.latency, seed=args.seed).start()
+
+    try:
+        reports = [run_service(service, args, server.base_url) for service in args.service or SERVICES]
+    finally:
+        server.stop()
+
+    print(json.dumps(reports, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(reports, json.load(f), args.tolerance)
+
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+
+        sys.exit(1 if found else 0)
+
+    found = failures(reports)
+
+    for line in found:
+        print(f"FAILED {line}", file=sys.stderr)
+
+    sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Compares the latency and throughput of the synchronous and asynchronous request paths of a service.
+
+The sync path reproduces the old `def` handlers: every request holds a worker thread of a
+40-thread pool (the size of Starlette's default threadpool) for the whole conversation.
+The async path runs every request as a task on the event loop, as the `async def` handlers do.
+
+Usage (from the repository root):
+    python tests/compare_sync_async.py --service group_chat --requests 100 --concurrency 100
+
+Point the agents at any OpenAI-compatible endpoint (for example OPENAI_BASE_URL) to avoid
+spending tokens on the real models.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARLETTE_THREADPOOL_SIZE = 40
+
+
+def load_requests(path, count, request_model):
+    """
+    Loads `count` requests from a JSONL corpus, cycling through it if it is shorter.
+    """
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    return [request_model(**{**records[i % len(records)], "id": i}) for i in range(count)]
+
+
+def summarize(name, latencies, elapsed, peak_threads):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    return {
+        "mode": name,
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_s": round(statistics.median(latencies), 3),
+        "p95_s": round(p95, 3),
+        "max_s": round(latencies[-1], 3),
+        "peak_threads": peak_threads,
+    }
+
+
+class ThreadSampler:
+    """
+    Samples the number of live threads while a run is in progress.
+    """
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.05):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_sync(service, requests):
+    def timed(req):
+        start = time.perf_counter()
+        service.process_revision(req)
+        return time.perf_counter() - start
+
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=STARLETTE_THREADPOOL_SIZE) as executor:
+            latencies = list(executor.map(timed, requests))
+        elapsed = time.perf_counter() - start
+
+    return summarize("sync", latencies, elapsed, sampler.peak)
+
+
+def run_async(service, requests, concurrency, io_threads):
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=io_threads))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(req):
+            async with semaphore:
+                start = time.perf_counter()
+                await service.aprocess_revision(req)
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(timed(req) for req in requests))
+        return latencies, time.perf_counter() - start
+
+    with ThreadSampler() as sampler:
+        latencies, elapsed = asyncio.run(main())
+
+    return summarize("async", latencies, elapsed, sampler.peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", choices=["user_reviewer", "group_chat", "swarm"], required=True)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "tests", "data", "sample_requests.jsonl"))
+    parser.add_argument("--requests", type=int, default=100, help="Number of requests sent in each mode.")
+    parser.add_argument("--concurrency", type=int, default=100, help="Concurrent requests in the async mode.")
+    parser.add_argument("--io-threads", type=int, default=int(os.getenv("LLM_IO_THREADS", "64")))
+    args = parser.parse_args()
+
+    # Both modes must run every conversation, not replay the results cached by the other one
+    os.environ["RESULT_CACHE_SIZE"] = "0"
+    os.environ["RESULT_CACHE_DIR"] = ""
+    os.environ["LLM_CACHE"] = "off"
+
+    # The services import their packages relative to their own directory
+    sys.path.insert(0, os.path.join(ROOT, args.service))
+    from models.revision import RevisionRequest
+    from services.revision_service import RevisionService
+
+    requests = load_requests(args.corpus, args.requests, RevisionRequest)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = RevisionService(results_file=os.path.join(tmp, "results.csv"))
+
+        results = [
+            run_sync(service, requests),
+            run_async(service, requests, args.concurrency, args.io_threads),
+        ]
+        service.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Fixtures shared by the tests.
+
+The three services import their packages (agents, services, models) relative to their own
+directory, so a test loads one service at a time: service_modules puts its directory first on
+sys.path and forgets the packages of the service loaded before.
+"""
+import os
+import sys
+import json
+import importlib
+
+import pytest
+
+from fake_llm_server import FakeLLMServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_PACKAGES = ("agents", "services", "models", "main")
+CORPUS = os.path.join(ROOT, "tests", "data", "sample_requests.jsonl")
+
+
+def forget_service_modules():
+    for name in list(sys.modules):
+        if name.split(".")[0] in SERVICE_PACKAGES:
+            del sys.modules[name]
+
+
+@pytest.fixture
+def service_modules(monkeypatch):
+    """
+    Returns a function that loads a module of a service, e.g. load("swarm", "agents.revision_budget").
+    """
+    loaded = []
+
+    def load(service: str, module: str):
+        if loaded and loaded[-1] != service:
+            raise ValueError("A test can only load the modules of one service")
+
+        if not loaded:
+            forget_service_modules()
+            monkeypatch.syspath_prepend(os.path.join(ROOT, service))
+            loaded.append(service)
+
+        return importlib.import_module(module)
+
+    yield load
+
+    forget_service_modules()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """
+    Starts the fake LLM server, where every answer is rewritten once, and points the agents of
+    the services at it, without the result and completion caches.
+    """
+    server = FakeLLMServer(pass_ratio=0.0, loop_ratio=0.0).start()
+
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setenv("OLLAMA_BASE_URL", server.base_url)
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setenv("OLLAMA_MAX_CONCURRENCY", "1000")
+    monkeypatch.setenv("RESULT_CACHE_SIZE", "0")
+    monkeypatch.setenv("RESULT_CACHE_DIR", "")
+    monkeypatch.setenv("LLM_CACHE", "off")
+
+    yield server
+
+    server.stop()
+
+
+def sample_requests(request_model, count: int | None = None) -> list:
+    """
+    Builds the requests of the sample corpus, each with its own id and question.
+    """
+    with open(CORPUS, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    count = len(records) if count is None else count
+
+    return [
+        request_model(**{**records[i % len(records)], "id": i, "question": f"{records[i % len(records)]['question']} #{i}"})
+        for i in range(count)
+    ]
+
+
+def read_results(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,394 @@
+"""
+Deterministic OpenAI-compatible chat completions server for benchmarks and local runs.
+
+It answers every agent of the three services with scripted, well-formed replies:
+  - the Reviewer gets <semantic_score>, <contextual_score>, <total_score> and <suggestions> tags;
+  - the Batch_Reviewer (user_reviewer) gets the same tags in a <review id="N"> block per item;
+  - the User (user_reviewer) and the Rewriter (group_chat) get a <revised_answer>;
+  - the Evaluator gets <new_score> and <final_answer>;
+  - the same fields come as a JSON object when the request asks for structured outputs (response_format);
+  - the swarm agents get a call to the register_* tool they are offered, including REWRITE loops.
+
+Each request follows a scenario picked from a hash of its first message, so the same corpus
+always produces the same conversations: the answer passes the first review (--pass-ratio),
+or it is rewritten once, or (swarm) the Decider asks for a second rewrite (--loop-ratio).
+Every completion waits for a delay drawn from the latency distribution:
+    fixed:0.5 | uniform:0.2,1.5 | normal:0.8,0.2 | lognormal:0.8,0.5 (median, sigma)
+
+Usage (from the repository root):
+    python tests/fake_llm_server.py --port 9000 --latency lognormal:0.8,0.5
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=fake uvicorn main:app   # user_reviewer, group_chat
+    OLLAMA_BASE_URL=http://localhost:9000/v1 uvicorn main:app                       # swarm
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TAG_PATTERN = re.compile(r"<(\w+)>(.*?)</\1>", re.DOTALL)
+ITEM_PATTERN = re.compile(r"<item id=\"(\d+)\">\n?(.*?)\n?</item>", re.DOTALL)
+
+
+class LatencyModel:
+    """
+    Draws the delay of each completion from a seeded distribution.
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, spec: str = "fixed:0", seed: int = 0):
+        kind, _, params = spec.partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}', expected one of {self.KINDS}")
+
+        self.kind = kind
+        self.params = [float(param) for param in params.split(",") if param]
+        self.spec = spec
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                delay = self.params[0] if self.params else 0.0
+            elif self.kind == "uniform":
+                delay = self._random.uniform(*self.params[:2])
+            elif self.kind == "normal":
+                delay = self._random.gauss(*self.params[:2])
+            else:
+                delay = self._random.lognormvariate(math.log(self.params[0]), self.params[1])
+
+        return max(0.0, delay)
+
+
+class Script:
+    """
+    Builds the scripted reply of each agent from the request it receives.
+    """
+
+    def __init__(self, pass_ratio: float = 0.3, loop_ratio: float = 0.2):
+        self.pass_ratio = pass_ratio
+        self.loop_ratio = loop_ratio
+
+    def reply(self, body: dict) -> dict:
+        messages = body.get("messages", [])
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        conversation = [m for m in messages if m.get("role") != "system"]
+        request = self.request_data(conversation)
+        scenario = self.scenario(conversation)
+        revised = self.count_revisions(conversation) > 0
+
+        tools = [tool["function"]["name"] for tool in body.get("tools", []) if tool.get("type") == "function"]
+        register = next((name for name in tools if name.startswith("register_")), None)
+
+        if register is not None:
+            return self.tool_call(register, self.tool_arguments(register, request, scenario, conversation))
+
+        if "review the quality of the answers provided for several questions" in system:
+            return self.message(self.batch_review(conversation, body.get("response_format")))
+        elif "review the quality of an answer" in system:
+            content = self.review(scenario, revised)
+        elif "rewrite answers" in system or "You must send a set of questions" in system:
+            content = f"<revised_answer>{self.revised_answer(request)}</revised_answer>"
+        elif "evaluate an answer given" in system:
+            content = f"<new_score>9</new_score>\n<final_answer>{self.revised_answer(request)}</final_answer>"
+        else:
+            return self.message("OK")
+
+        # Structured outputs (RESPONSE_FORMAT=json) get the same fields as a JSON object
+        if body.get("response_format"):
+            content = self.as_json(content, body["response_format"])
+
+        return self.message(content)
+
+    def scenario(self, conversation) -> str:
+        """
+        Picks "pass", "rewrite" or "loop" from the first message, so it is stable for a request.
+        """
+        first = conversation[0].get("content") or "" if conversation else ""
+        draw = int(hashlib.sha256(first.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+        if draw < self.pass_ratio:
+            return "pass"
+        if draw < self.pass_ratio + self.loop_ratio:
+            return "loop"
+        return "rewrite"
+
+    @staticmethod
+    def request_data(conversation) -> dict:
+        """
+        Reads the JSON of the request out of the first message.
+        """
+        content = conversation[0].get("content") or "" if conversation else ""
+        start = content.find("{")
+
+        try:
+            data, _ = json.JSONDecoder().raw_decode(content[start:]) if start >= 0 else ({}, 0)
+        except json.JSONDecodeError:
+            data = {}
+
+        return data if isinstance(data, dict) else {}
+
+    @staticmethod
+    def count_revisions(conversation) -> int:
+        count = 0
+
+        for message in conversation:
+            if "<revised_answer>" in (message.get("content") or ""):
+                count += 1
+
+            for tool_call in message.get("tool_calls") or []:
+                count += tool_call.get("function", {}).get("name") == "register_revised_answer"
+
+        return count
+
+    @staticmethod
+    def count_calls(conversation, name: str) -> int:
+        return sum(
+            tool_call.get("function", {}).get("name") == name
+            for message in conversation
+            for tool_call in message.get("tool_calls") or []
+        )
+
+    @staticmethod
+    def revised_answer(request: dict) -> str:
+        answer = request.get("answer") or request.get("original_answer") or "Olá! Obrigado pela pergunta."
+        return f"{answer} (revisada)"
+
+    @staticmethod
+    def scores(scenario: str, revised: bool):
+        return (5, 4) if scenario == "pass" or revised else (3, 2)
+
+    def review(self, scenario: str, revised: bool) -> str:
+        semantic, contextual = self.scores(scenario, revised)
+        content = (
+            f"<semantic_score>{semantic}</semantic_score>\n"
+            f"<contextual_score>{contextual}</contextual_score>\n"
+            f"<total_score>{semantic + contextual}</total_score>"
+        )
+
+        if semantic + contextual <= 7:
+            content += "\n<suggestions>Answer the question directly and use the delivery time in the context.</suggestions>"
+
+        return content
+
+    def batch_review(self, conversation, response_format) -> str:
+        """
+        Reviews each item of a batch like the Reviewer would in the item's own conversation.
+        """
+        content = conversation[0].get("content") or "" if conversation else ""
+        reviews = []
+
+        for number, item in ITEM_PATTERN.findall(content):
+            # Same scenario as the first message of the item's own conversation
+            scenario = self.scenario([{"content": f"Please evaluate the following answer:\n{item}"}])
+            reviews.append((int(number), self.review(scenario, revised=False)))
+
+        if response_format:
+            return json.dumps({
+                "reviews": [
+                    {"id": number, **json.loads(self.as_json(review, {}))} for number, review in reviews
+                ]
+            })
+
+        return "\n".join(f"<review id=\"{number}\">\n{review}\n</review>" for number, review in reviews)
+
+    @staticmethod
+    def as_json(content: str, response_format: dict) -> str:
+        """
+        Turns a tagged reply into a JSON object with the fields of the requested schema.
+        """
+        tags = dict(TAG_PATTERN.findall(content))
+        properties = response_format.get("json_schema", {}).get("schema", {}).get("properties") or tags
+        fields = {}
+
+        for name in properties:
+            value = tags.get(name)
+            fields[name] = int(value) if value is not None and value.isdigit() else value
+
+        return json.dumps(fields, ensure_ascii=False)
+
+    def tool_arguments(self, name: str, request: dict, scenario: str, conversation) -> dict:
+        revised = self.count_revisions(conversation) > 0
+        semantic, contextual = self.scores(scenario, revised)
+
+        if name == "register_semantic_score":
+            return {"semantic_score": semantic, "justification": "The answer addresses the question."}
+        if name == "register_contextual_score":
+            return {"contextual_score": contextual, "justification": "The answer matches the context."}
+        if name == "register_review_scores":
+            return {
+                "semantic_score": semantic,
+                "justification_semantic": "The answer addresses the question.",
+                "contextual_score": contextual,
+                "justification_contextual": "The answer matches the context.",
+            }
+        if name == "register_suggestions":
+            return {"suggestions": "Answer the question directly and use the delivery time in the context."}
+        if name == "register_revised_answer":
+            return {"revised_answer": self.revised_answer(request)}
+        if name == "register_decision":
+            loop = scenario == "loop" and self.count_calls(conversation, "register_decision") == 0
+            return {
+                "decision": "REWRITE" if loop else "ANSWER_REVISED",
+                "justification": "The revised answer still misses details." if loop else "The revised answer is better.",
+            }
+
+        return {}
+
+    @staticmethod
+    def message(content: str) -> dict:
+        return {"role": "assistant", "content": content}
+
+    @staticmethod
+    def tool_call(name: str, arguments: dict) -> dict:
+        serialized = json.dumps(arguments, ensure_ascii=False)
+
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{hashlib.sha256((name + serialized).encode('utf-8')).hexdigest()[:24]}",
+                "type": "function",
+                "function": {"name": name, "arguments": serialized},
+            }],
+        }
+
+
+def estimate_tokens(value) -> int:
+    return max(1, len(json.dumps(value, ensure_ascii=False)) // 4)
+
+
+class FakeLLMServer:
+    """
+    Serves the scripted completions on /v1/chat/completions from a background thread.
+    A share of the calls (error_rate) answers 429 with a Retry-After header, like a rate-limited API.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: str = "fixed:0", seed: int = 0,
+                 pass_ratio: float = 0.3, loop_ratio: float = 0.2, error_rate: float = 0.0):
+        self.latency = LatencyModel(latency, seed)
+        self.script = Script(pass_ratio, loop_ratio)
+        self.error_rate = error_rate
+        self._errors = random.Random(seed + 1)
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def complete(self, body: dict):
+        """
+        Returns the status and the payload of a chat completion request.
+        """
+        with self._lock:
+            self.calls += 1
+            rate_limited = self._errors.random() < self.error_rate
+
+        time.sleep(self.latency.sample())
+
+        if rate_limited:
+            return 429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit_exceeded"}}
+
+        message = self.script.reply(body)
+        prompt_tokens = estimate_tokens(body.get("messages", []))
+        completion_tokens = estimate_tokens(message)
+
+        return 200, {
+            "id": f"chatcmpl-{hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                status, payload = server.complete(body)
+
+                self._send(status, payload, {"Retry-After": "1"} if status == 429 else None)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    return self._send(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def _send(self, status: int, payload: dict, headers: dict | None = None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="fixed:0", help="Latency distribution of each completion.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pass-ratio", type=float, default=0.3, help="Share of requests that pass the first review.")
+    parser.add_argument("--loop-ratio", type=float, default=0.2, help="Share of swarm requests with a REWRITE loop.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 429.")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, args.latency, args.seed, args.pass_ratio, args.loop_ratio, args.error_rate)
+    print(f"Fake LLM listening on {server.base_url} (latency {args.latency})", flush=True)
+
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+HTTP load generator for a running service: replays a corpus of RevisionRequest payloads
+against /revise or /revise-questions and reports throughput, error rate and latency percentiles.
+
+Modes:
+  - closed loop (--concurrency N): N clients, each sending its next request when the last one returns;
+  - open loop (--rate R): requests arrive at R per second (Poisson, or --constant), whether or not
+    the earlier ones have returned. Latency is measured from the scheduled arrival, so time spent
+    waiting for a free connection counts, as it would for a real client;
+  - --ramp 1,4,16,64: runs a closed loop step per level and marks the saturation point, the first
+    level where throughput grows less than 10% while p99 keeps rising.
+
+The corpus is a JSONL file, a JSON array, or a directory of JSON array chunks.
+With --spawn, the service is started with uvicorn against the fake LLM, so no network is needed.
+
+Usage (from the repository root):
+    python tests/load_test.py --spawn group_chat --concurrency 32 --duration 30 --llm-latency lognormal:0.5,0.4
+    python tests/load_test.py --url http://localhost:8000 --rate 20 --duration 60
+    python tests/load_test.py --spawn swarm --endpoint revise-questions --batch-size 10 --ramp 1,2,4,8
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+
+import httpx
+
+from fake_llm_server import FakeLLMServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_corpus(path: str) -> list:
+    """
+    Loads the payloads of a JSONL file, a JSON array or a directory of JSON array chunks.
+    """
+    if os.path.isdir(path):
+        return [record for name in sorted(os.listdir(path)) if name.endswith((".json", ".jsonl"))
+                for record in load_corpus(os.path.join(path, name))]
+
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class Payloads:
+    """
+    Cycles through the corpus. Each payload gets a new id, and a numbered question so the
+    result cache doesn't answer the repeats.
+    """
+
+    def __init__(self, corpus: list, batch_size: int = 1, unique: bool = True):
+        self.corpus = corpus
+        self.batch_size = batch_size
+        self.unique = unique
+        self.count = 0
+
+    def _one(self) -> dict:
+        record = dict(self.corpus[self.count % len(self.corpus)])
+        record["id"] = self.count
+
+        if self.unique:
+            record["question"] = f"{record['question']} #{self.count}"
+
+        self.count += 1
+        return record
+
+    def next(self, endpoint: str):
+        if endpoint == "revise":
+            return self._one()
+
+        return [self._one() for _ in range(self.batch_size)]
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.items = 0
+
+    def add(self, latency: float, status, items: int, ok: bool):
+        self.latencies.append(latency)
+        self.statuses[str(status)] += 1
+        self.errors += not ok
+        self.items += items if ok else 0
+
+    def report(self, elapsed: float, **extra) -> dict:
+        latencies = sorted(self.latencies)
+        sent = len(latencies)
+
+        def percentile(fraction):
+            return round(latencies[min(sent - 1, int(sent * fraction))], 3) if sent else None
+
+        return {
+            **extra,
+            "requests": sent,
+            "errors": self.errors,
+            "error_rate": round(self.errors / sent, 4) if sent else 0.0,
+            "statuses": dict(self.statuses),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round((sent - self.errors) / elapsed, 2) if elapsed else None,
+            "items_per_s": round(self.items / elapsed, 2) if elapsed else None,
+            "p50_s": percentile(0.50),
+            "p90_s": percentile(0.90),
+            "p99_s": percentile(0.99),
+            "max_s": round(latencies[-1], 3) if sent else None,
+        }
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, payload, results: Results, start: float):
+    """
+    Sends one request and records its latency from `start`, which is the scheduled arrival in open loop.
+    """
+    items = len(payload) if isinstance(payload, list) else 1
+
+    try:
+        response = await client.post(f"/{endpoint}", json=payload)
+        ok = response.status_code < 400
+
+        # A batch answers 200 even when some of its items failed
+        if ok and isinstance(payload, list):
+            failed = sum("error" in item for item in response.json().get("responses", []) if isinstance(item, dict))
+            items -= failed
+
+        results.add(time.perf_counter() - start, response.status_code, items, ok)
+    except httpx.HTTPError as e:
+        results.add(time.perf_counter() - start, type(e).__name__, 0, False)
+
+
+async def closed_loop(client, payloads: Payloads, endpoint: str, concurrency: int, duration: float, total: int | None):
+    results = Results()
+    deadline = time.perf_counter() + duration
+    started = 0
+
+    async def worker():
+        nonlocal started
+
+        while time.perf_counter() < deadline and (total is None or started < total):
+            started += 1
+            await send(client, endpoint, payloads.next(endpoint), results, time.perf_counter())
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return results.report(time.perf_counter() - begin, mode="closed", concurrency=concurrency)
+
+
+async def open_loop(client, payloads: Payloads, endpoint: str, rate: float, duration: float, constant: bool, seed: int):
+    results = Results()
+    arrivals = random.Random(seed)
+    tasks = []
+    begin = time.perf_counter()
+    scheduled = begin
+
+    while scheduled < begin + duration:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        tasks.append(asyncio.create_task(send(client, endpoint, payloads.next(endpoint), results, scheduled)))
+        scheduled += 1 / rate if constant else arrivals.expovariate(rate)
+
+    await asyncio.gather(*tasks)
+
+    return results.report(time.perf_counter() - begin, mode="open", rate=rate)
+
+
+def saturation_point(steps: list):
+    """
+    Returns the first level whose throughput grew less than 10% over the previous one while its p99 rose.
+    """
+    for previous, step in zip(steps, steps[1:]):
+        if step["throughput_rps"] < previous["throughput_rps"] * 1.1 and step["p99_s"] > previous["p99_s"]:
+            return step["concurrency"]
+
+    return None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_service(service: str, llm_base_url: str, workers: int):
+    """
+    Starts a service with uvicorn, pointed at the fake LLM, and waits until it answers.
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": llm_base_url,
+        "OLLAMA_BASE_URL": llm_base_url,
+        # The fake LLM stands in for Ollama too, but serves any number of calls at the same time
+        "OLLAMA_MAX_CONCURRENCY": "1000",
+        "OPENAI_API_KEY": "fake",
+        "LLM_CACHE": "off",
+        "RESULTS_FILE": os.path.join(tempfile.mkdtemp(prefix="load-test-"), "results.csv"),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, service), env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError(f"{service} exited with code {process.returncode}")
+        try:
+            httpx.get(f"{url}/metrics", timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError(f"{service} did not start on port {port}")
+
+
+async def run(args, url: str):
+    payloads = Payloads(load_corpus(args.corpus), args.batch_size, unique=not args.repeat)
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        if args.ramp:
+            steps = []
+
+            for level in [int(level) for level in args.ramp.split(",")]:
+                steps.append(await closed_loop(client, payloads, args.endpoint, level, args.duration, None))
+                print(json.dumps(steps[-1]), file=sys.stderr)
+
+            return {"steps": steps, "saturation_concurrency": saturation_point(steps)}
+
+        if args.rate:
+            return await open_loop(client, payloads, args.endpoint, args.rate, args.duration, args.constant, args.seed)
+
+        return await closed_loop(client, payloads, args.endpoint, args.concurrency, args.duration, args.requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running service.")
+    target.add_argument("--spawn", choices=["user_reviewer", "group_chat", "swarm"], help="Start this service against the fake LLM.")
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "tests", "data", "sample_requests.jsonl"))
+    parser.add_argument("--endpoint", choices=["revise", "revise-questions"], default="revise")
+    parser.add_argument("--batch-size", type=int, default=10, help="Items per /revise-questions request.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients of the closed loop.")
+    parser.add_argument("--rate", type=float, help="Arrivals per second (open loop).")
+    parser.add_argument("--constant", action="store_true", help="Evenly spaced arrivals instead of Poisson.")
+    parser.add_argument("--ramp", help="Comma-separated concurrency levels of a saturation ramp.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of each run (or ramp step).")
+    parser.add_argument("--requests", type=int, help="Stop the closed loop after this many requests.")
+    parser.add_argument("--repeat", action="store_true", help="Send the corpus as is, so repeats hit the result cache.")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the spawned service.")
+    parser.add_argument("--llm-latency", default="lognormal:0.5,0.4", help="Latency distribution of the fake LLM.")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Share of fake LLM calls answered with 429.")
+    args = parser.parse_args()
+
+    server = process = None
+    url = args.url
+
+    try:
+        if args.spawn:
+            server = FakeLLMServer(latency=args.llm_latency, seed=args.seed, error_rate=args.llm_error_rate).start()
+            process, url = spawn_service(args.spawn, server.base_url, args.workers)
+
+        report = asyncio.run(run(args, url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if server is not None:
+            server.stop()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
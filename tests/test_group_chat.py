@@ -0,0 +1,42 @@
+import os
+import asyncio
+
+from conftest import read_results, sample_requests
+
+
+def build_service(service_modules, tmp_path):
+    RevisionService = service_modules("group_chat", "services.revision_service").RevisionService
+    RevisionRequest = service_modules("group_chat", "models.revision").RevisionRequest
+
+    return RevisionService(results_file=os.path.join(tmp_path, "results.jsonl")), RevisionRequest
+
+
+def test_async_conversation_reviews_the_answer(service_modules, fake_llm, tmp_path):
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    result = asyncio.run(service.aprocess_revision(request))
+    service.close()
+
+    # Reviewer, Rewriter and Evaluator each reply once
+    assert fake_llm.calls >= 3
+    assert result["previous_score"] == 5
+    assert result["new_score"] == 9
+    assert result["final_answer"] == f"{request.answer} (revisada)"
+
+    [record] = read_results(os.path.join(tmp_path, "results.jsonl"))
+    assert record["Original Score"] == 5
+    assert record["Prompt Tokens"] > 0
+
+
+def test_sync_and_async_conversations_agree(service_modules, fake_llm, tmp_path):
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    requests = sample_requests(RevisionRequest, 3)
+
+    sync_results = [service.process_revision(request) for request in requests]
+    sync_calls = fake_llm.calls
+    async_results = [asyncio.run(service.aprocess_revision(request)) for request in requests]
+    service.close()
+
+    assert async_results == sync_results
+    assert fake_llm.calls == 2 * sync_calls
@@ -0,0 +1,65 @@
+import asyncio
+
+from conftest import sample_requests
+
+
+class StubRevisionService:
+    max_concurrency = 2
+
+    async def aprocess_revision(self, request):
+        if request.answer == "fail":
+            raise ValueError("failed")
+
+        return request.answer
+
+    @staticmethod
+    def tag_result(request, response):
+        return {"id": request.id, "response": response}
+
+
+def run_jobs(service_modules, batches):
+    JobService = service_modules("user_reviewer", "services.job_service").JobService
+    RevisionRequest = service_modules("user_reviewer", "models.revision").RevisionRequest
+
+    async def main():
+        job_service = JobService(StubRevisionService(), workers=2, max_queue=10)
+        await job_service.start()
+
+        jobs = [
+            job_service.submit([
+                request.model_copy(update={"answer": answer})
+                for request, answer in zip(sample_requests(RevisionRequest, len(batch)), batch)
+            ])
+            for batch in batches
+        ]
+
+        for _ in range(100):
+            if all(job.done for job in jobs):
+                break
+            await asyncio.sleep(0.01)
+
+        await job_service.stop()
+
+        return job_service, jobs
+
+    return asyncio.run(main())
+
+
+def test_empty_job_is_completed_right_away(service_modules):
+    job_service, [job] = run_jobs(service_modules, [[]])
+
+    assert job.status == "completed"
+    assert job.finished_at is not None
+    assert job_service.results(job) == []
+
+
+def test_job_collects_results_and_errors_in_order(service_modules):
+    job_service, [job] = run_jobs(service_modules, [["a", "fail", "c"]])
+
+    assert job.to_dict()["status"] == "completed"
+    assert (job.completed, job.failed) == (2, 1)
+    assert job_service.results(job) == [
+        {"id": 0, "response": "a"},
+        {"id": 1, "error": "failed"},
+        {"id": 2, "response": "c"},
+    ]
@@ -0,0 +1,90 @@
+import pytest
+
+
+@pytest.fixture
+def parsing(service_modules):
+    return service_modules("user_reviewer", "agents.parsing")
+
+
+@pytest.mark.parametrize("value, expected", [
+    (8, 8), ("8", 8), (" 8 ", 8), ("8/10", 8), ("8.0", 8), ("7,5", 7), ("**8**", 8),
+    ("none", None), (None, None), (True, None),
+])
+def test_coerce_score(parsing, value, expected):
+    assert parsing.coerce_score(value) == expected
+
+
+def test_tags_are_read_in_one_pass(parsing):
+    fields = parsing.parse_reply(
+        "<semantic_score>3</semantic_score>\n<contextual_score>2/5</contextual_score>\n"
+        "<total_score>5</total_score>\n<suggestions>\n Use the context. \n</suggestions>"
+    )
+
+    assert fields == {"semantic_score": 3, "contextual_score": 2, "total_score": 5, "suggestions": "Use the context."}
+
+
+def test_first_occurrence_of_a_tag_wins(parsing):
+    assert parsing.parse_reply("<total_score>5</total_score> <total_score>9</total_score>") == {"total_score": 5}
+
+
+def test_json_replies_are_read_with_or_without_a_fence(parsing):
+    reply = '{"semantic_score": 4, "contextual_score": 5, "total_score": "9", "suggestions": null}'
+
+    assert parsing.parse_reply(reply) == {"semantic_score": 4, "contextual_score": 5, "total_score": 9}
+    assert parsing.parse_reply(f"```json\n{reply}\n```") == parsing.parse_reply(reply)
+    assert parsing.parse_reply({"content": reply}) == parsing.parse_reply(reply)
+
+
+def test_unreadable_replies(parsing):
+    assert parsing.parse_reply({"content": None}) == {}
+    assert parsing.parse_reply("{not json") == {}
+    assert parsing.parse_reply("<total_score>high</total_score>") == {}
+
+
+def test_score_above(parsing):
+    assert parsing.score_above({"content": "<total_score>8</total_score>"}, "total_score")
+    assert not parsing.score_above({"content": "<total_score>7</total_score>"}, "total_score")
+    assert not parsing.score_above({"content": "no score"}, "total_score")
+
+
+def test_reply_scores(parsing):
+    assert parsing.reply_scores("<total_score>6</total_score>") == [6]
+    assert parsing.reply_scores("<new_score>9</new_score><final_answer>ok</final_answer>") == [9]
+    # Valid replies without a score
+    assert parsing.reply_scores("<revised_answer>ok</revised_answer>") == []
+    assert parsing.reply_scores(parsing.CANNOT_ANSWER) == []
+    assert parsing.reply_scores("I think it is fine") is None
+
+
+def test_response_format(parsing, monkeypatch):
+    llm_config = {"config_list": []}
+
+    monkeypatch.setenv("RESPONSE_FORMAT", "tags")
+    assert parsing.structured_llm_config(llm_config, parsing.ReviewScores) is llm_config
+    assert parsing.format_instructions(parsing.ReviewScores) == ""
+
+    monkeypatch.setenv("RESPONSE_FORMAT", "json")
+    assert parsing.structured_llm_config(llm_config, parsing.ReviewScores)["response_format"] is parsing.ReviewScores
+    assert "total_score" in parsing.format_instructions(parsing.ReviewScores)
+
+    monkeypatch.setenv("RESPONSE_FORMAT", "xml")
+    with pytest.raises(ValueError):
+        parsing.response_format()
+
+
+def test_batch_reviews_are_read_by_item(service_modules):
+    batch_review = service_modules("user_reviewer", "agents.batch_review")
+
+    message = batch_review.format_batch(['{"question": "a"}', '{"question": "b"}'])
+    assert '<item id="1">\n{"question": "a"}\n</item>' in message
+    assert '<item id="2">' in message
+
+    reply = (
+        '<review id="1"><total_score>9</total_score></review>\n'
+        '<review id=2><total_score>5</total_score><suggestions>Fix it.</suggestions></review>'
+    )
+    assert batch_review.parse_batch_reply(reply) == {1: {"total_score": 9}, 2: {"total_score": 5, "suggestions": "Fix it."}}
+
+    json_reply = '{"reviews": [{"id": 2, "semantic_score": 2, "contextual_score": 3, "total_score": 5, "suggestions": null}]}'
+    assert batch_review.parse_batch_reply({"content": json_reply}) == {2: {"semantic_score": 2, "contextual_score": 3, "total_score": 5}}
+    assert batch_review.parse_batch_reply("no reviews") == {}
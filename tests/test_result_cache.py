@@ -0,0 +1,85 @@
+import pytest
+
+from conftest import sample_requests
+
+
+@pytest.fixture
+def modules(service_modules):
+    return (
+        service_modules("user_reviewer", "services.result_cache").ResultCache,
+        service_modules("user_reviewer", "models.revision").RevisionRequest,
+    )
+
+
+def test_key_depends_on_the_fields_that_determine_the_result(modules):
+    ResultCache, RevisionRequest = modules
+    cache = ResultCache(namespace="user_reviewer")
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    # The id and the feedback don't change the result of a revision
+    assert cache.make_key(request) == cache.make_key(request.model_copy(update={"id": 99, "feedback": "x"}))
+    assert cache.make_key(request) != cache.make_key(request.model_copy(update={"answer": "other"}))
+    assert cache.make_key(request) != ResultCache(namespace="swarm").make_key(request)
+
+
+def test_hits_return_copies(modules):
+    ResultCache, _ = modules
+    cache = ResultCache()
+    cache.set("key", {"final_answer": "ok"})
+
+    found, value = cache.get("key")
+    value["final_answer"] = "changed"
+
+    assert found
+    assert cache.get("key") == (True, {"final_answer": "ok"})
+    assert cache.get("missing") == (False, None)
+    assert cache.stats()["memory_hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(modules):
+    ResultCache, _ = modules
+    cache = ResultCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entry_is_a_miss(modules, service_modules, monkeypatch):
+    ResultCache, _ = modules
+    result_cache = service_modules("user_reviewer", "services.result_cache")
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+
+    cache = ResultCache(ttl=10)
+    cache.set("key", "ok")
+    now[0] += 11
+
+    assert cache.get("key") == (False, None)
+
+
+def test_disk_tier_is_shared_between_instances(modules, tmp_path):
+    ResultCache, _ = modules
+    writer = ResultCache(directory=str(tmp_path))
+    writer.set("key", "ok")
+    writer.close()
+
+    reader = ResultCache(directory=str(tmp_path))
+
+    assert reader.get("key") == (True, "ok")
+    assert reader.stats()["disk_hits"] == 1
+    reader.close()
+
+
+def test_size_zero_disables_the_memory_tier(modules):
+    ResultCache, _ = modules
+    cache = ResultCache(max_entries=0)
+    cache.set("key", "ok")
+
+    assert not cache.enabled
+    assert cache.get("key") == (False, None)
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def RevisionBudget(service_modules):
+    return service_modules("swarm", "agents.revision_budget").RevisionBudget
+
+
+def test_rewrite_loop_stops_after_max_revisions(RevisionBudget):
+    budget = RevisionBudget(max_revisions=2, min_improvement=0)
+
+    assert budget.stop_rewriting({"number_of_revisions": 1}) is None
+    assert budget.stop_rewriting({"number_of_revisions": 2}) == "max_revisions"
+
+
+def test_rewrite_loop_stops_without_improvement(RevisionBudget):
+    budget = RevisionBudget(max_revisions=0, min_improvement=1)
+
+    assert budget.stop_rewriting({"original_score": 5, "new_score": 5}) == "no_improvement"
+    assert budget.stop_rewriting({"original_score": 5, "new_score": 6}) is None
+    # Nothing to compare before the first review of a rewrite
+    assert budget.stop_rewriting({"original_score": 5}) is None
+
+
+def test_rewrite_loop_stops_after_the_deadline(RevisionBudget):
+    budget = RevisionBudget(max_revisions=0, min_improvement=0, deadline=10)
+    context_variables = {"revision_deadline": budget.deadline_at()}
+
+    assert budget.stop_rewriting(context_variables) is None
+
+    context_variables["revision_deadline"] = time.monotonic() - 1
+    assert budget.stop_rewriting(context_variables) == "deadline"
+    assert budget.stop_reviewing(context_variables, "any answer") == "deadline"
+
+
+def test_no_deadline_by_default(RevisionBudget):
+    assert RevisionBudget(deadline=0).deadline_at() is None
+
+
+def test_identical_rewrite_is_not_reviewed_again(RevisionBudget):
+    budget = RevisionBudget(similarity=0.9)
+    previous = "Chega em até 5 dias úteis, pela transportadora."
+
+    context_variables = {"original_answer": previous, "number_of_revisions": 2}
+    assert budget.stop_reviewing(context_variables, previous + "!") == "identical_rewrite"
+    assert budget.stop_reviewing(context_variables, "O prazo é de uma semana.") is None
+
+    # The first rewrite isn't compared with the original answer
+    context_variables["number_of_revisions"] = 1
+    assert budget.stop_reviewing(context_variables, previous) is None
+
+
+def test_limits_come_from_the_environment(RevisionBudget, monkeypatch):
+    monkeypatch.setenv("SWARM_MAX_REVISIONS", "3")
+    monkeypatch.setenv("SWARM_MIN_SCORE_IMPROVEMENT", "0")
+    monkeypatch.setenv("SWARM_REVISION_DEADLINE", "30")
+    monkeypatch.setenv("SWARM_REWRITE_SIMILARITY", "0")
+
+    budget = RevisionBudget.from_env()
+
+    assert (budget.max_revisions, budget.min_improvement, budget.deadline, budget.similarity) == (3, 0, 30.0, 0.0)
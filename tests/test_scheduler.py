@@ -0,0 +1,162 @@
+import httpx
+import openai
+import pytest
+
+
+@pytest.fixture
+def scheduler(service_modules, monkeypatch):
+    module = service_modules("user_reviewer", "agents.scheduler")
+    sleeps = []
+    # The retries and the buckets wait with time.sleep: record the delays instead
+    monkeypatch.setattr(module.time, "sleep", sleeps.append)
+    module.sleeps = sleeps
+
+    return module
+
+
+def status_error(status: int, retry_after: str | None = None):
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "http://llm/v1/chat/completions"))
+
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+class Response:
+    def __init__(self, total_tokens: int = 10):
+        self.usage = type("Usage", (), {"total_tokens": total_tokens})()
+
+
+def flaky_create(errors):
+    """
+    Returns a create function that raises the errors, one per call, and then succeeds.
+    """
+    calls = []
+
+    def create(params):
+        calls.append(params)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return Response()
+
+    create.calls = calls
+
+    return create
+
+
+PARAMS = {"model": "gpt-4o", "messages": [{"role": "user", "content": "Hello"}]}
+
+
+def test_throttled_call_is_retried_after_retry_after(scheduler):
+    backend = scheduler.BackendScheduler("llm", max_concurrency=8, max_retries=3, base_delay=0.01, max_delay=30)
+    create = flaky_create([status_error(429, "2")])
+
+    assert isinstance(backend.call(create, PARAMS), Response)
+    assert len(create.calls) == 2
+    # Never sooner than Retry-After
+    assert scheduler.sleeps == [2.0]
+    # The throttled call halved the concurrency limit, and the successful retry raised it by 1/limit
+    assert backend.concurrency.limit == 4 + 1 / 4
+
+
+def test_server_errors_are_retried_with_backoff(scheduler):
+    backend = scheduler.BackendScheduler("llm", max_retries=2, base_delay=1, max_delay=30)
+    create = flaky_create([status_error(503), status_error(502)])
+
+    backend.call(create, PARAMS)
+
+    assert len(create.calls) == 3
+    # Full jitter: between 0 and base_delay * 2 ** attempt
+    assert 0 <= scheduler.sleeps[0] <= 1
+    assert 0 <= scheduler.sleeps[1] <= 2
+
+
+def test_client_errors_are_not_retried(scheduler):
+    backend = scheduler.BackendScheduler("llm", max_retries=3)
+    create = flaky_create([status_error(400)])
+
+    with pytest.raises(openai.APIStatusError):
+        backend.call(create, PARAMS)
+
+    assert len(create.calls) == 1
+
+
+def test_error_is_raised_after_the_last_retry(scheduler):
+    backend = scheduler.BackendScheduler("llm", max_retries=2, base_delay=0)
+    create = flaky_create([status_error(429)] * 3)
+
+    with pytest.raises(openai.APIStatusError):
+        backend.call(create, PARAMS)
+
+    assert len(create.calls) == 3
+    # The concurrency slots are given back
+    assert backend.concurrency.in_flight == 0
+
+
+def test_token_bucket_waits_for_the_tokens(scheduler, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+
+    def sleep(seconds):
+        scheduler.sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(scheduler.time, "sleep", sleep)
+    bucket = scheduler.TokenBucket(60)  # one per second, bursts of 60
+
+    bucket.acquire(60)
+    assert scheduler.sleeps == []
+
+    bucket.acquire(2)
+    assert scheduler.sleeps == [pytest.approx(2.0)]
+
+    # Usage above the estimate is taken from the bucket afterwards
+    bucket.adjust(5)
+    bucket.acquire(1)
+    assert scheduler.sleeps[-1] == pytest.approx(6.0)
+
+
+def test_disabled_bucket_never_waits(scheduler):
+    scheduler.TokenBucket(0).acquire(10 ** 6)
+
+    assert scheduler.sleeps == []
+
+
+def test_adaptive_concurrency(scheduler):
+    concurrency = scheduler.AdaptiveConcurrency(4, minimum=1, maximum=8, latency_target=1.0, cooldown=60)
+
+    for _ in range(4):
+        concurrency.on_success(0.1)
+    # About one more call per round of successful calls
+    assert 4.9 < concurrency.limit < 5
+
+    concurrency.on_throttle()
+    concurrency.on_throttle()
+    # A burst of throttled calls halves the limit once per cooldown
+    assert 2.4 < concurrency.limit < 2.5
+
+    # A slow call counts as a sign of overload, but the cooldown still applies
+    concurrency.on_success(5.0)
+    assert 2.4 < concurrency.limit < 2.5
+
+
+def test_backends(scheduler):
+    assert scheduler.is_ollama({"api_key": "ollama"})
+    assert scheduler.is_ollama({"base_url": "http://localhost:11434/v1"})
+    assert not scheduler.is_ollama({"api_key": "sk-..."})
+    assert scheduler.backend_name({}) == "api.openai.com"
+    assert scheduler.backend_name({"base_url": "http://localhost:9000/v1"}) == "localhost:9000"
+    assert scheduler.scheduler_for({"base_url": "http://a/v1"}) is scheduler.scheduler_for({"base_url": "http://a/v1", "model": "x"})
+
+
+def test_schedule_agent_turns_off_the_client_retries(scheduler, monkeypatch):
+    import autogen
+
+    monkeypatch.setenv("LLM_SCHEDULER", "on")
+    agent = autogen.AssistantAgent(
+        "Reviewer", llm_config={"config_list": [{"model": "gpt-4o", "api_key": "fake", "base_url": "http://b/v1"}]})
+    [model_client] = agent.client._clients
+
+    scheduler.schedule_agent(agent)
+
+    assert model_client._oai_client.max_retries == 0
+    assert model_client.create.__name__ == "scheduled_create"
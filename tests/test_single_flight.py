@@ -0,0 +1,126 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def SingleFlight(service_modules):
+    return service_modules("user_reviewer", "services.single_flight").SingleFlight
+
+
+def test_concurrent_callers_share_one_run(SingleFlight):
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"answer": "ok"}
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", work)))
+    leader.start()
+    started.wait(5)
+
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    # Give the followers time to join the call in flight
+    time.sleep(0.05)
+    release.set()
+
+    for thread in (leader, *followers):
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [{"answer": "ok"}] * 4
+    # Followers get copies, as with the result cache
+    assert len({id(result) for result in results}) == 4
+
+
+def test_error_is_raised_for_every_caller(SingleFlight):
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def work():
+        release.wait(5)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flight.do("key", work)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["boom"] * 3
+    # The key is forgotten once the call is over
+    assert flight.do("key", lambda: "again") == "again"
+
+
+def test_disabled_runs_every_call(SingleFlight):
+    flight = SingleFlight(enabled=False)
+    calls = []
+
+    for _ in range(2):
+        flight.do("key", lambda: calls.append(1))
+
+    assert len(calls) == 2
+
+
+def test_async_callers_share_one_task(SingleFlight):
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ["ok"]
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("key", work) for _ in range(4)))
+
+    assert asyncio.run(main()) == [["ok"]] * 4
+    assert len(calls) == 1
+
+
+def test_async_task_survives_until_every_caller_is_cancelled(SingleFlight):
+    flight = SingleFlight()
+    finished = []
+
+    async def work():
+        await asyncio.sleep(0.1)
+        finished.append(1)
+        return "ok"
+
+    async def main():
+        first = asyncio.ensure_future(flight.ado("key", work))
+        second = asyncio.ensure_future(flight.ado("key", work))
+        await asyncio.sleep(0.01)
+
+        # One caller left: the shared task keeps running for the other
+        first.cancel()
+        assert await second == "ok"
+
+        third = asyncio.ensure_future(flight.ado("other", work))
+        await asyncio.sleep(0.01)
+        # Its only caller left: the task is cancelled
+        third.cancel()
+        await asyncio.sleep(0.15)
+
+        return first.cancelled(), third.cancelled()
+
+    assert asyncio.run(main()) == (True, True)
+    assert len(finished) == 1
@@ -0,0 +1,140 @@
+import os
+import asyncio
+
+import pytest
+
+from conftest import read_results, sample_requests
+
+
+def build_service(service_modules, tmp_path, review_mode: str = "sequential"):
+    RevisionService = service_modules("swarm", "services.revision_service").RevisionService
+    RevisionRequest = service_modules("swarm", "models.revision").RevisionRequest
+
+    return RevisionService(results_file=os.path.join(tmp_path, "results.jsonl"), review_mode=review_mode), RevisionRequest
+
+
+@pytest.mark.parametrize("review_mode", ["sequential", "parallel"])
+def test_conversation_rewrites_the_answer(service_modules, fake_llm, tmp_path, review_mode):
+    service, RevisionRequest = build_service(service_modules, tmp_path, review_mode)
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    result = asyncio.run(service.aprocess_revision(request))
+    service.close()
+
+    assert result == {"final_answer": f"{request.answer} (revisada)", "previous_score": 5, "new_score": 9}
+
+    [record] = read_results(os.path.join(tmp_path, "results.jsonl"))
+    assert record["Decision"] == "ANSWER_REVISED"
+    assert record["Number of Revisions"] == 1
+
+
+def test_sync_parallel_review_rewrites_the_answer(service_modules, fake_llm, tmp_path):
+    service, RevisionRequest = build_service(service_modules, tmp_path, "parallel")
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    result = service.process_revision(request)
+    service.close()
+
+    assert result == {"final_answer": f"{request.answer} (revisada)", "previous_score": 5, "new_score": 9}
+
+    [record] = read_results(os.path.join(tmp_path, "results.jsonl"))
+    assert record["Decision"] == "ANSWER_REVISED"
+
+
+def test_combined_review_is_a_single_call(service_modules, fake_llm, tmp_path):
+    service, RevisionRequest = build_service(service_modules, tmp_path, "combined")
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    result = asyncio.run(service.aprocess_revision(request))
+    service.close()
+
+    assert result == {"final_answer": f"{request.answer} (revisada)", "previous_score": 5, "new_score": 9}
+    # Review, suggestions, rewrite, review of the rewrite and decision
+    assert fake_llm.calls == 5
+
+    usage = read_results(os.path.join(tmp_path, "results.jsonl"))[0]["Token Usage"]
+    assert "Combined_Reviewer" in usage
+    assert "Semantic_Reviewer" not in usage
+
+
+def test_llm_calls_of_the_pattern_agents_are_measured(service_modules, fake_llm, tmp_path):
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    metrics = service_modules("swarm", "services.metrics")
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    asyncio.run(service.aprocess_revision(request))
+    service.close()
+
+    calls = {
+        sample: value for sample, value in metrics.LLM_CALL_SECONDS.samples()
+        if sample.startswith("llm_call_duration_seconds_count")
+    }
+    assert sum(calls.values()) == fake_llm.calls
+    assert calls['llm_call_duration_seconds_count{agent="Semantic_Reviewer"}'] > 0
+    assert calls['llm_call_duration_seconds_count{agent="Decider"}'] > 0
+    assert "llm_call_duration_seconds_count" in metrics.metrics.render()
+    # The pruned context of the request saved prompt tokens
+    assert dict(metrics.CONTEXT_TOKENS_SAVED.samples())["context_tokens_saved_total"] > 0
+
+
+def test_trace_has_the_agent_turns_and_the_tool_calls(service_modules, fake_llm, tmp_path):
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    tracer = service_modules("swarm", "services.tracing").tracer
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    asyncio.run(service.aprocess_revision(request))
+    service.close()
+
+    [summary] = tracer.recent(request_id=request.id)
+    spans = tracer.find(summary["trace_id"]).to_dict()["spans"]
+    turns = [span for span in spans if span["kind"] == "agent_turn"]
+    tools = [span for span in spans if span["kind"] == "tool_call"]
+
+    assert spans[0]["kind"] == "revision"
+    assert len(turns) == fake_llm.calls
+    assert [span["name"] for span in turns[:2]] == ["Semantic_Reviewer", "Contextual_Reviewer"]
+    assert turns[0]["attributes"]["tool_calls"] == "register_semantic_score"
+    assert turns[0]["attributes"]["prompt_tokens"] > 0
+    assert "register_decision" in [span["name"] for span in tools]
+    assert all(span["parent_id"] == spans[0]["span_id"] for span in spans[1:])
+
+
+def test_llm_calls_of_the_pattern_agents_are_scheduled(service_modules, fake_llm, tmp_path):
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    metrics = service_modules("swarm", "services.metrics")
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    asyncio.run(service.aprocess_revision(request))
+    service.close()
+
+    waits = {
+        sample: value for sample, value in metrics.LLM_SCHEDULER_WAIT_SECONDS.samples()
+        if sample.startswith("llm_scheduler_wait_seconds_count")
+    }
+    # Every call went through the scheduler of the Ollama backend
+    assert list(waits.values()) == [fake_llm.calls]
+
+    # The team of the conversation, rebuilt clients included
+    with service_modules("swarm", "agents.agents").agent_pool.acquire() as team:
+        for agent in (team.semantic_reviewer, team.decider):
+            [model_client] = agent.client._clients
+            assert model_client.create.__name__ == "scheduled_create"
+            assert model_client._oai_client.max_retries == 0
+
+
+def test_borderline_cheap_reviews_escalate_to_the_main_model(service_modules, fake_llm, tmp_path, monkeypatch):
+    monkeypatch.setenv("CASCADE_MODEL", "qwen3:1.7b")
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    metrics = service_modules("swarm", "services.metrics")
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    result = asyncio.run(service.aprocess_revision(request))
+    service.close()
+
+    assert result["previous_score"] == 5
+    calls = dict(metrics.LLM_CASCADE_CALLS.samples())
+    # The first semantic score (3 of 5) is borderline: the main model reviews the answer again
+    assert calls['llm_cascade_calls_total{agent="Semantic_Reviewer",tier="cheap",outcome="borderline"}'] >= 1
+    assert calls['llm_cascade_calls_total{agent="Semantic_Reviewer",tier="main",outcome="accepted"}'] >= 1
+    # A clear score of the cheap model is kept
+    assert calls['llm_cascade_calls_total{agent="Contextual_Reviewer",tier="cheap",outcome="accepted"}'] >= 1
@@ -0,0 +1,85 @@
+import os
+import asyncio
+
+from conftest import read_results, sample_requests
+
+
+def build_service(service_modules, tmp_path):
+    RevisionService = service_modules("user_reviewer", "services.revision_service").RevisionService
+    RevisionRequest = service_modules("user_reviewer", "models.revision").RevisionRequest
+
+    return RevisionService(results_file=os.path.join(tmp_path, "results.jsonl")), RevisionRequest
+
+
+def test_async_conversation_revises_the_answer(service_modules, fake_llm, tmp_path):
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    request = sample_requests(RevisionRequest, 1)[0]
+
+    response = asyncio.run(service.aprocess_revision(request))
+    service.close()
+
+    # Review, rewrite and review of the rewrite
+    assert fake_llm.calls == 3
+    assert response == f"{request.answer} (revisada)"
+
+    [record] = read_results(os.path.join(tmp_path, "results.jsonl"))
+    assert record["Original Score"] == 5
+    assert record["Final Score"] == 9
+    assert record["Revised Answer"] == response
+    assert record["Suggestions"]
+
+
+def test_batched_review_only_sends_low_scores_to_a_conversation(service_modules, fake_llm, tmp_path, monkeypatch):
+    monkeypatch.setenv("REVIEW_BATCH_SIZE", "4")
+    monkeypatch.setenv("RESULT_CACHE_SIZE", "16")
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    # Items of the same locale and category, so they go in one batch
+    requests = [request for request in sample_requests(RevisionRequest, 24) if request.category == "shipping"][:4]
+    fake_llm.script.pass_ratio = 1.0
+
+    responses = asyncio.run(service.aprocess_revisions(requests))
+
+    # Every answer passes the batched review: one LLM call and no conversation
+    assert fake_llm.calls == 1
+    assert responses == [request.answer.strip() for request in requests]
+
+    # The same requests are now served from the result cache
+    fake_llm.script.pass_ratio = 0.0
+    assert asyncio.run(service.aprocess_revisions(requests)) == responses
+    assert fake_llm.calls == 1
+    service.close()
+
+    records = read_results(os.path.join(tmp_path, "results.jsonl"))
+    assert [record["Original Score"] for record in records] == [9] * 4
+    assert [record["Revised Answer"] for record in records] == ["-"] * 4
+
+
+def test_low_scores_of_the_batched_review_run_their_conversation(service_modules, fake_llm, tmp_path, monkeypatch):
+    monkeypatch.setenv("REVIEW_BATCH_SIZE", "2")
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    requests = [request for request in sample_requests(RevisionRequest, 24) if request.category == "shipping"][:2]
+
+    responses = asyncio.run(service.aprocess_revisions(requests))
+    service.close()
+
+    # One batched review, then the rewrite and the review of the rewrite for each item:
+    # their conversation starts from the batched review instead of reviewing the answer again
+    assert fake_llm.calls == 1 + 2 * 2
+    assert responses == [f"{request.answer} (revisada)" for request in requests]
+
+    records = read_results(os.path.join(tmp_path, "results.jsonl"))
+    assert [record["Original Score"] for record in records] == [5, 5]
+    assert [record["Final Score"] for record in records] == [9, 9]
+    assert all(record["Suggestions"] for record in records)
+
+
+def test_sync_conversation_starts_from_the_batched_review(service_modules, fake_llm, tmp_path, monkeypatch):
+    monkeypatch.setenv("REVIEW_BATCH_SIZE", "2")
+    service, RevisionRequest = build_service(service_modules, tmp_path)
+    requests = [request for request in sample_requests(RevisionRequest, 24) if request.category == "shipping"][:2]
+
+    responses = service.process_revisions(requests)
+    service.close()
+
+    assert fake_llm.calls == 1 + 2 * 2
+    assert responses == [f"{request.answer} (revisada)" for request in requests]
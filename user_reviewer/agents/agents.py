@@ -1,8 +1,19 @@
 import os
-import re
 import autogen
+from typing import NamedTuple
 from dotenv import load_dotenv
 
+from agents.async_replies import count_async_replies_once
+from agents.batch_review import BatchReviewScores
+from agents.cascade import ModelCascade
+from agents.http_client import shared_http_client
+from agents.llm_cache import completion_cache_for
+from agents.parsing import ReviewScores, RevisedAnswer, format_instructions, reply_scores, score_above, structured_llm_config
+from agents.pool import AgentPool
+from agents.scheduler import schedule_agent
+from services.metrics import instrument_agent
+from services.tracing import trace_agent
+
 load_dotenv()
 
 # LLM model configuration
@@ -10,57 +21,146 @@ config_list = [
     {
         "model": "gpt-4o",
         "api_key": os.getenv("OPENAI_API_KEY"),
+        # One pooled client for every agent, so the connections to the backend are kept alive and reused
+        "http_client": shared_http_client(),
     }
 ]
 llm_config = {"config_list": config_list, "temperature": 0.0}
 
-# Reviewer Agent: evaluates the answer and suggests improvements (does not provide the final answer).
-reviewer = autogen.AssistantAgent(
-    name="Reviewer",
-    llm_config=llm_config,
-    max_consecutive_auto_reply=2,
-    is_termination_msg=lambda msg: "It is not possible to provide a revised answer." in msg.get("content", ""),
-    system_message=(
-        "You are an AI assistant whose purpose is to review the quality of an answer provided "
-        "for a question asked to the user regarding a product. "
-        "The question may have different intentions, the closest match will be provided along with the question and the answer. "
-        "The questions and answers may be in Portuguese or Spanish, but your scores and suggestions must be in English. "
-        "You must evaluate two main aspects: whether the answer is semantically correct and whether the answer is contextually correct. "
-        "Along with the question and the answer, context will be provided that must be taken into account for the evaluation. "
-        "As it will also be provided the metadata, that contains some information and rules for the evaluation, you must take it into account. "
-        "You must provide a score from 0 to 5 for each aspect, and the final score will be the sum of the two scores. "
-        "The semantic score should be available in the message, between the tags <semantic_score> and </semantic_score>. "
-        "The contextual score should be available in the message, between the tags <contextual_score> and </contextual_score>. "
-        "The final score should be available in the message, between the tags <total_score> and </total_score>. "
-        "If the final score is 7 or less, you must present the points that are incorrect and suggest what should be done to improve the answer. "
-        "The sugestions must be provided in the message, between the tags <suggestions> and </suggestions>. "
-        "If the final score is higher than 7, you don't need to provide any suggestions. "
-        "You must not provide a revised answer, the user will make the necessary corrections and return the corrected answer for evaluation. "
+# Cheaper model for the requests whose prompt is over the token budget (PROMPT_BUDGET_POLICY=route)
+budget_model = os.getenv("BUDGET_MODEL")
+budget_llm_config = {"config_list": [{**config_list[0], "model": budget_model}], "temperature": 0.0} if budget_model else None
+
+# Roles whose turns go to the cheaper CASCADE_MODEL first, escalating to the main model on borderline or unreadable scores
+cascade = ModelCascade.from_env(default_roles=("Reviewer",))
+
+
+class ReviewTeam(NamedTuple):
+    reviewer: autogen.AssistantAgent
+    user_proxy: autogen.UserProxyAgent
+
+
+def build_agents(llm_config: dict = llm_config) -> ReviewTeam:
+    """
+    Builds a new set of agents for a single conversation.
+    """
+    # Completions are deterministic (temperature 0), so every agent shares one cache per model configuration
+    completion_cache = completion_cache_for(llm_config)
+
+    # Reviewer Agent: evaluates the answer and suggests improvements (does not provide the final answer).
+    reviewer = autogen.AssistantAgent(
+        name="Reviewer",
+        llm_config=structured_llm_config(cascade.llm_config_for("Reviewer", llm_config), ReviewScores),
+        max_consecutive_auto_reply=2,
+        is_termination_msg=lambda msg: "It is not possible to provide a revised answer." in (msg.get("content") or ""),
+        system_message=(
+            "You are an AI assistant whose purpose is to review the quality of an answer provided "
+            "for a question asked to the user regarding a product. "
+            "The question may have different intentions, the closest match will be provided along with the question and the answer. "
+            "The questions and answers may be in Portuguese or Spanish, but your scores and suggestions must be in English. "
+            "You must evaluate two main aspects: whether the answer is semantically correct and whether the answer is contextually correct. "
+            "Along with the question and the answer, context will be provided that must be taken into account for the evaluation. "
+            "As it will also be provided the metadata, that contains some information and rules for the evaluation, you must take it into account. "
+            "You must provide a score from 0 to 5 for each aspect, and the final score will be the sum of the two scores. "
+            "The semantic score should be available in the message, between the tags <semantic_score> and </semantic_score>. "
+            "The contextual score should be available in the message, between the tags <contextual_score> and </contextual_score>. "
+            "The final score should be available in the message, between the tags <total_score> and </total_score>. "
+            "If the final score is 7 or less, you must present the points that are incorrect and suggest what should be done to improve the answer. "
+            "The sugestions must be provided in the message, between the tags <suggestions> and </suggestions>. "
+            "If the final score is higher than 7, you don't need to provide any suggestions. "
+            "You must not provide a revised answer, the user will make the necessary corrections and return the corrected answer for evaluation. "
+            f"{format_instructions(ReviewScores)}"
+        )
     )
-)
 
-# User Agent: sends the question for evaluation and, if necessary, revises the answer according to the reviewer's suggestions.
-# The final answer (original or revised) must be provided by user_proxy.
-user_proxy = autogen.UserProxyAgent(
-    name="User",
-    llm_config=llm_config,
-    human_input_mode="NEVER",
-    max_consecutive_auto_reply=3,
-    is_termination_msg=lambda msg: bool(
-        (m := re.search(r"<total_score>(\d+)</total_score>", msg.get("content", "")))
-        and int(m.group(1)) > 7
-    ),
-    system_message=(
-        "You must send a set of questions and answers to be evaluated by an AI assistant. "
-        "The question may have different intentions, the closest match will be provided along with the question and the answer. "
-        "The questions and answers may be in Portuguese or Spanish; when rewriting the answer, you must consider the original language of the question. "
-        "If the final score provided by the reviewer is less than 6, the it will present the points that are incorrect and suggest what should be done to improve the answer. "
-        "You must make the suggested corrections and return the corrected answer to be evaluated again. "
-        "The revised answer must be provided in the message, between the tags <revised_answer> and </revised_answer>. "
-        "If you don't have enough information in the context to answer the question, you need return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
-        "If the answer contained some type of greeting or signature, you must keep it in the revised answer. "
-    ),
-    code_execution_config={
-        "use_docker": False,
-    }
+    # User Agent: sends the question for evaluation and, if necessary, revises the answer according to the reviewer's suggestions.
+    # The final answer (original or revised) must be provided by user_proxy.
+    user_proxy = autogen.UserProxyAgent(
+        name="User",
+        llm_config=structured_llm_config(cascade.llm_config_for("User", llm_config), RevisedAnswer),
+        human_input_mode="NEVER",
+        max_consecutive_auto_reply=3,
+        is_termination_msg=lambda msg: score_above(msg, "total_score", 7),
+        system_message=(
+            "You must send a set of questions and answers to be evaluated by an AI assistant. "
+            "The question may have different intentions, the closest match will be provided along with the question and the answer. "
+            "The questions and answers may be in Portuguese or Spanish; when rewriting the answer, you must consider the original language of the question. "
+            "If the final score provided by the reviewer is less than 6, the it will present the points that are incorrect and suggest what should be done to improve the answer. "
+            "You must make the suggested corrections and return the corrected answer to be evaluated again. "
+            "The revised answer must be provided in the message, between the tags <revised_answer> and </revised_answer>. "
+            "If you don't have enough information in the context to answer the question, you need return the following text: THIS QUESTION CANNOT BE ANSWERED!!. "
+            "If the answer contained some type of greeting or signature, you must keep it in the revised answer. "
+            f"{format_instructions(RevisedAnswer)}"
+        ),
+        code_execution_config={
+            "use_docker": False,
+        }
+    )
+
+    for agent in (reviewer, user_proxy):
+        agent.client_cache = completion_cache
+        cascade.attach(agent, reply_scores)
+        schedule_agent(agent)
+        instrument_agent(agent)
+        trace_agent(agent)
+        count_async_replies_once(agent)
+
+    return ReviewTeam(reviewer=reviewer, user_proxy=user_proxy)
+
+
+def build_batch_reviewer(llm_config: dict = llm_config) -> autogen.AssistantAgent:
+    """
+    Builds the agent that gives the first review of several items in one reply, with the same
+    criteria as the Reviewer. It doesn't take part in a conversation: it answers a single message.
+    """
+    batch_reviewer = autogen.AssistantAgent(
+        name="Batch_Reviewer",
+        llm_config=structured_llm_config(llm_config, BatchReviewScores),
+        system_message=(
+            "You are an AI assistant whose purpose is to review the quality of the answers provided "
+            "for several questions asked to the users regarding products. "
+            "Each item is provided between the tags <item id=\"N\"> and </item>, with its question, answer, context, metadata and the closest match of the intention of the question. "
+            "The items are independent: evaluate each one only with its own context and metadata. "
+            "The questions and answers may be in Portuguese or Spanish, but your scores and suggestions must be in English. "
+            "For each item, you must evaluate whether the answer is semantically correct and whether the answer is contextually correct, "
+            "taking into account the information and rules of its metadata. "
+            "You must provide a score from 0 to 5 for each aspect, and the final score will be the sum of the two scores. "
+            "The review of each item must be provided between the tags <review id=\"N\"> and </review>, with the same N as the item. "
+            "Within the review, the semantic score should be between the tags <semantic_score> and </semantic_score>, "
+            "the contextual score between the tags <contextual_score> and </contextual_score> "
+            "and the final score between the tags <total_score> and </total_score>. "
+            "If the final score is 7 or less, you must present the points that are incorrect and suggest what should be done to improve the answer, "
+            "between the tags <suggestions> and </suggestions>. "
+            "You must review every item, in order, and you must not provide revised answers. "
+            f"{format_instructions(BatchReviewScores)}"
+        )
+    )
+
+    batch_reviewer.client_cache = completion_cache_for(llm_config)
+    schedule_agent(batch_reviewer)
+    instrument_agent(batch_reviewer)
+    trace_agent(batch_reviewer)
+
+    return batch_reviewer
+
+
+def team_agents(team: ReviewTeam) -> list:
+    return list(team)
+
+
+def reset_agents(team: ReviewTeam):
+    """
+    Clears the chat history, reply counters and usage of a team so it can be reused.
+    """
+    for agent in team_agents(team):
+        agent.reset()
+
+
+agent_pool = AgentPool(build_agents, reset_agents, max_idle=int(os.getenv("AGENT_POOL_MAX_IDLE", "8")))
+budget_agent_pool = AgentPool(
+    lambda: build_agents(budget_llm_config), reset_agents, max_idle=int(os.getenv("AGENT_POOL_MAX_IDLE", "8"))
+) if budget_llm_config else None
+# Agents of the first review of a batch of items (REVIEW_BATCH_SIZE)
+batch_reviewer_pool = AgentPool(
+    build_batch_reviewer, lambda agent: agent.reset(), max_idle=int(os.getenv("AGENT_POOL_MAX_IDLE", "8"))
 )
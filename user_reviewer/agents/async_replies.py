@@ -0,0 +1,19 @@
+from autogen import ConversableAgent
+
+
+def count_async_replies_once(agent):
+    """
+    Makes the async replies of an agent count once against its max_consecutive_auto_reply, as in
+    the sync chats. autogen's a_generate_reply runs both the sync and the async termination checks
+    and each one counts the reply, so an agent that may reply N times only replies N/2 times in an
+    async chat, and never with N=1. Its async replies now skip the sync check, the way the sync
+    replies skip the async one.
+    """
+    a_generate_reply = agent.a_generate_reply
+
+    async def a_generate_reply_once(messages=None, sender=None, **kwargs):
+        exclude = (*kwargs.pop("exclude", ()), ConversableAgent.check_termination_and_human_reply)
+
+        return await a_generate_reply(messages=messages, sender=sender, exclude=exclude, **kwargs)
+
+    agent.a_generate_reply = a_generate_reply_once
@@ -0,0 +1,79 @@
+import re
+import json
+
+from pydantic import BaseModel
+
+from agents.parsing import JSON_FENCE_PATTERN, ReviewScores, parse_reply, response_format
+
+# One block per item of the batch, tagged with the number of the item
+REVIEW_PATTERN = re.compile(r"<review id=\"?(\d+)\"?>(.*?)</review>", re.DOTALL)
+
+
+class ItemReview(BaseModel):
+    id: int
+    semantic_score: int
+    contextual_score: int
+    total_score: int
+    suggestions: str | None
+
+
+class BatchReviewScores(BaseModel):
+    reviews: list[ItemReview]
+
+
+def format_batch(items: list) -> str:
+    """
+    Builds the message that asks for the first review of several items, numbered from 1.
+    Each item is the formatted JSON of a request, as in the message of a single conversation.
+    """
+    blocks = "\n".join(f"<item id=\"{number}\">\n{item}\n</item>" for number, item in enumerate(items, start=1))
+
+    return f"Please evaluate each of the following {len(items)} answers:\n{blocks}"
+
+
+def parse_batch_reply(message) -> dict:
+    """
+    Reads the reviews of a batch reply, a JSON object with a list of reviews or a message with
+    a <review id="N"> block per item. Returns the fields of each review by item number; items
+    without a review are left out.
+    """
+    content = message.get("content") if isinstance(message, dict) else message
+
+    if not isinstance(content, str) or not content:
+        return {}
+
+    text = content.strip()
+    fenced = JSON_FENCE_PATTERN.match(text)
+    text = fenced.group(1) if fenced else text
+
+    if text.startswith("{"):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            data = None
+
+        if isinstance(data, dict) and isinstance(data.get("reviews"), list):
+            return {
+                review["id"]: parse_reply(json.dumps(review))
+                for review in data["reviews"]
+                if isinstance(review, dict) and isinstance(review.get("id"), int)
+            }
+
+    reviews = {}
+
+    for match in REVIEW_PATTERN.finditer(content):
+        # The first review of an item wins
+        reviews.setdefault(int(match.group(1)), parse_reply(match.group(2)))
+
+    return reviews
+
+
+def format_item_review(review: dict) -> str:
+    """
+    Writes the review of one item of a batch as the Reviewer's reply in the item's own
+    conversation, in the response format of the agents, so the conversation can go on from it.
+    """
+    if response_format() == "json":
+        return json.dumps({field: review.get(field) for field in ReviewScores.model_fields}, ensure_ascii=False)
+
+    return "\n".join(f"<{field}>{review[field]}</{field}>" for field in ReviewScores.model_fields if field in review)
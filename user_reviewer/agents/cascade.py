@@ -0,0 +1,121 @@
+import os
+import logging
+
+from functools import partial
+
+from agents.client_wrappers import wrap_client
+from services.metrics import LLM_CASCADE_CALLS
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCascade:
+    """
+    Sends the turns of some agent roles to a cheaper model first and escalates to the main model
+    only when the cheap reply can't be trusted: its score is borderline or it can't be read.
+    The cheap model is the first entry of the agent's config_list and the main model the next ones,
+    and autogen's OpenAIWrapper moves to the next entry when the filter_func rejects a reply.
+    Roles outside the cascade, like the rewriters, always use the main model.
+    """
+
+    def __init__(self, model: str | None = None, base_url: str | None = None, api_key: str | None = None,
+                 roles=(), borderline: tuple = (6, 8)):
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.roles = set(roles)
+        self.borderline = borderline
+
+    @classmethod
+    def from_env(cls, default_roles):
+        """
+        Builds the cascade configured by CASCADE_MODEL, CASCADE_BASE_URL, CASCADE_API_KEY,
+        CASCADE_ROLES and CASCADE_ESCALATE_SCORES. Without CASCADE_MODEL every turn goes to the main model.
+        """
+        roles = os.getenv("CASCADE_ROLES")
+        low, _, high = os.getenv("CASCADE_ESCALATE_SCORES", "6-8").partition("-")
+
+        return cls(
+            model=os.getenv("CASCADE_MODEL") or None,
+            base_url=os.getenv("CASCADE_BASE_URL") or None,
+            api_key=os.getenv("CASCADE_API_KEY") or None,
+            roles=[role.strip() for role in roles.split(",") if role.strip()] if roles is not None else default_roles,
+            borderline=(int(low), int(high or low)),
+        )
+
+    def applies_to(self, role: str) -> bool:
+        return self.model is not None and role in self.roles
+
+    def llm_config_for(self, role: str, llm_config: dict) -> dict:
+        """
+        Returns the LLM configuration of an agent role, with the cheap model in front of the
+        main model when the role is part of the cascade.
+        """
+        if not self.applies_to(role):
+            return llm_config
+
+        main = llm_config["config_list"]
+        cheap = {**main[0], "model": self.model}
+
+        # A cheap model on another endpoint (for example a local Ollama) doesn't use the main credentials
+        if self.base_url is not None:
+            cheap["base_url"] = self.base_url
+            cheap["api_key"] = self.api_key or "none"
+        elif self.api_key is not None:
+            cheap["api_key"] = self.api_key
+
+        return {**llm_config, "config_list": [cheap, *main]}
+
+    def attach(self, agent, read_scores):
+        """
+        Makes the LLM calls of a cascaded agent check the cheap reply before accepting it.
+        read_scores returns the scores of a reply on the 0-10 scale, [] for a valid reply without
+        scores, or None when the reply can't be read.
+        """
+        if not self.applies_to(agent.name):
+            return
+
+        accept = partial(self.accept, agent.name, read_scores)
+
+        def cascade(client):
+            create = client.create
+
+            def cascaded_create(**config):
+                return create(**config, filter_func=accept)
+
+            client.create = cascaded_create
+
+        wrap_client(agent, cascade)
+
+    def accept(self, agent_name: str, read_scores, context=None, response=None) -> bool:
+        """
+        filter_func of the cascaded agents: accepts every reply of the main model, and the replies
+        of the cheap model whose scores are readable and outside the borderline range.
+        """
+        if not self.is_cheap(response):
+            LLM_CASCADE_CALLS.inc(agent=agent_name, tier="main", outcome="accepted")
+            return True
+
+        try:
+            message = response.choices[0].message
+            scores = read_scores(message.model_dump() if hasattr(message, "model_dump") else message)
+        except Exception:
+            logger.debug("Could not read the reply of %s", agent_name, exc_info=True)
+            scores = None
+
+        if scores is None:
+            outcome = "unparsed"
+        elif any(self.borderline[0] <= score <= self.borderline[1] for score in scores):
+            outcome = "borderline"
+        else:
+            outcome = "accepted"
+
+        LLM_CASCADE_CALLS.inc(agent=agent_name, tier="cheap", outcome=outcome)
+
+        return outcome == "accepted"
+
+    def is_cheap(self, response) -> bool:
+        # APIs report dated versions of the model, like gpt-4o-mini-2024-07-18
+        model = getattr(response, "model", None) or ""
+
+        return model == self.model or model.startswith(f"{self.model}-")
@@ -0,0 +1,64 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+
+class AgentPool:
+    """
+    Hands out isolated agent teams, one per conversation.
+    Teams are built on demand by the factory, reset after each use and kept
+    for reuse, up to max_idle teams. Surplus teams are released, so memory
+    stays bounded by the number of conversations running at the same time.
+    """
+
+    def __init__(self, factory, reset, max_idle: int = 8):
+        self._factory = factory
+        self._reset = reset
+        self._idle = queue.LifoQueue(maxsize=max(1, max_idle))
+        self._lock = threading.Lock()
+        self.created = 0
+        self.in_use = 0
+
+    @contextmanager
+    def acquire(self):
+        """
+        Yields a team that no other conversation is using.
+        """
+        team = self._take()
+
+        try:
+            yield team
+        finally:
+            self._give_back(team)
+
+    def _take(self):
+        try:
+            team = self._idle.get_nowait()
+        except queue.Empty:
+            team = self._factory()
+
+            with self._lock:
+                self.created += 1
+
+        with self._lock:
+            self.in_use += 1
+
+        return team
+
+    def _give_back(self, team):
+        with self._lock:
+            self.in_use -= 1
+
+        # A team that can't be reset cleanly is dropped instead of being reused
+        try:
+            self._reset(team)
+        except Exception:
+            return
+
+        try:
+            self._idle.put_nowait(team)
+        except queue.Full:
+            pass
+
+    def stats(self):
+        return {"created": self.created, "in_use": self.in_use, "idle": self._idle.qsize()}
@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+from urllib.parse import urlparse
+
+from openai import APIConnectionError, APIStatusError
+
+from agents.client_wrappers import wrap_client
+from services.tokens import count_tokens
+from services.metrics import LLM_CONCURRENCY_LIMIT, LLM_RETRIES, LLM_SCHEDULER_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+# Statuses worth retrying: rate limited, and the backend overloaded or restarting
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+# Completion tokens reserved for a call that doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+
+class TokenBucket:
+    """
+    Allows rate_per_minute units per minute, in bursts of up to one minute's worth.
+    A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate_per_minute: float = 0):
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.available = rate_per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1):
+        """
+        Blocks until amount units are available and takes them.
+        """
+        if not self.rate:
+            return
+
+        amount = min(amount, self.capacity)
+
+        while True:
+            with self._lock:
+                self._refill()
+
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+
+                wait = (amount - self.available) / self.rate
+
+            time.sleep(wait)
+
+    def adjust(self, amount: float):
+        """
+        Takes (or gives back, when negative) the difference between the estimate and the actual usage.
+        """
+        if not self.rate:
+            return
+
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available - amount)
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the calls in flight with an AIMD limit: each successful call raises it by 1/limit
+    (about one more call per round of calls), and a throttled call, or a call slower than the
+    latency target, halves it. Halvings are at least `cooldown` seconds apart, so a burst of
+    429s counts once.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64, latency_target: float = 0.0, cooldown: float = 5.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self, latency: float):
+        with self._condition:
+            if self.latency_target and latency > self.latency_target:
+                self._decrease()
+                return
+
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+
+        if now - self._last_decrease >= self.cooldown:
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class BackendScheduler:
+    """
+    Schedules the LLM calls sent to one backend (an endpoint): a token bucket for the requests
+    per minute and one for the tokens per minute (estimated with tiktoken before the call and
+    corrected with the usage of the response), an adaptive concurrency limit, and retries with
+    exponential backoff and full jitter, honouring Retry-After, for throttled or failed calls.
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, max_concurrency: int = 64, min_concurrency: int = 1,
+                 latency_target: float = 0.0, max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveConcurrency(max_concurrency, min_concurrency, max_concurrency, latency_target)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random.Random()
+
+        LLM_CONCURRENCY_LIMIT.set(int(self.concurrency.limit), backend=name)
+
+    @classmethod
+    def from_env(cls, config: dict):
+        """
+        Builds the scheduler of the backend of a config_list entry. A local Ollama serves few
+        requests at the same time and has no rate limits, so it has its own concurrency limit,
+        OLLAMA_MAX_CONCURRENCY; other backends use LLM_RPM, LLM_TPM and LLM_MAX_CONCURRENCY.
+        """
+        options = {
+            "min_concurrency": int(os.getenv("LLM_MIN_CONCURRENCY", "1")),
+            "latency_target": float(os.getenv("LLM_LATENCY_TARGET", "0")),
+            "max_retries": int(os.getenv("LLM_MAX_RETRIES", "4")),
+            "base_delay": float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+            "max_delay": float(os.getenv("LLM_RETRY_MAX_DELAY", "30")),
+        }
+
+        if is_ollama(config):
+            return cls(backend_name(config), max_concurrency=int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4")), **options)
+
+        return cls(
+            backend_name(config),
+            rpm=float(os.getenv("LLM_RPM", "0")),
+            tpm=float(os.getenv("LLM_TPM", "0")),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "64")),
+            **options,
+        )
+
+    @staticmethod
+    def estimate_tokens(params: dict) -> int:
+        prompt = json.dumps([params.get("messages", []), params.get("tools")], ensure_ascii=False, default=str)
+        completion = params.get("max_tokens") or params.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+
+        return count_tokens(prompt, params.get("model") or "gpt-4o") + completion
+
+    def call(self, create, params: dict):
+        """
+        Runs create(params) once the buckets and the concurrency limit allow it, retrying throttled
+        and failed calls up to max_retries times.
+        """
+        estimate = self.estimate_tokens(params)
+
+        for attempt in range(self.max_retries + 1):
+            queued = time.perf_counter()
+            self.requests.acquire(1)
+            self.tokens.acquire(estimate)
+            self.concurrency.acquire()
+            LLM_SCHEDULER_WAIT_SECONDS.observe(time.perf_counter() - queued, backend=self.name)
+
+            try:
+                start = time.perf_counter()
+                response = create(params)
+            except (APIStatusError, APIConnectionError) as e:
+                reason = self.retry_reason(e)
+
+                if reason is None or attempt == self.max_retries:
+                    raise
+
+                if reason == "throttled":
+                    self.concurrency.on_throttle()
+                    LLM_CONCURRENCY_LIMIT.set(int(self.concurrency.limit), backend=self.name)
+
+                LLM_RETRIES.inc(backend=self.name, reason=reason)
+                delay = self.backoff(attempt, e)
+                logger.info("LLM call to %s failed (%s), retrying in %.1fs", self.name, reason, delay)
+            else:
+                self.concurrency.on_success(time.perf_counter() - start)
+                LLM_CONCURRENCY_LIMIT.set(int(self.concurrency.limit), backend=self.name)
+
+                usage = getattr(response, "usage", None)
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    self.tokens.adjust(usage.total_tokens - estimate)
+
+                return response
+            finally:
+                self.concurrency.release()
+
+            # Outside the concurrency slot, so the other calls can use it while this one waits
+            time.sleep(delay)
+
+    @staticmethod
+    def retry_reason(error) -> str | None:
+        if isinstance(error, APIConnectionError):
+            return "connection"
+
+        status = getattr(error, "status_code", None)
+
+        if status in THROTTLE_STATUSES:
+            return "throttled"
+        if status in RETRY_STATUSES:
+            return "server_error"
+
+        return None
+
+    def backoff(self, attempt: int, error) -> float:
+        """
+        Full jitter over an exponential backoff, but never less than the Retry-After of the response.
+        """
+        delay = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        response = getattr(error, "response", None)
+
+        try:
+            retry_after = float(response.headers.get("retry-after")) if response is not None else 0.0
+        except (TypeError, ValueError):
+            retry_after = 0.0
+
+        return max(delay, min(retry_after, self.max_delay))
+
+
+def is_ollama(config: dict) -> bool:
+    return config.get("api_key") == "ollama" or urlparse(config.get("base_url") or "").port == 11434
+
+
+def backend_name(config: dict) -> str:
+    return urlparse(config.get("base_url") or OPENAI_BASE_URL).netloc
+
+
+def scheduler_enabled() -> bool:
+    return os.getenv("LLM_SCHEDULER", "on").lower() not in ("0", "off", "false")
+
+
+_schedulers: dict[str, BackendScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def scheduler_for(config: dict) -> BackendScheduler:
+    """
+    Returns the scheduler of the backend of a config_list entry, shared by every agent of the process.
+    """
+    name = backend_name(config)
+
+    with _schedulers_lock:
+        if name not in _schedulers:
+            _schedulers[name] = BackendScheduler.from_env(config)
+
+        return _schedulers[name]
+
+
+def schedule_agent(agent):
+    """
+    Sends the LLM calls of an agent through the scheduler of their backend. Each model client of
+    the agent's OpenAIWrapper (one per config_list entry) is wrapped, so the tiers of a cascade
+    are scheduled by their own backend. The OpenAI client of a wrapped model client doesn't retry
+    on its own, so a throttled call is retried by the scheduler only, after its backoff.
+    """
+    if not scheduler_enabled():
+        return
+
+    def schedule(client):
+        for model_client, config in zip(getattr(client, "_clients", []), getattr(client, "_config_list", [])):
+            scheduler = scheduler_for(config)
+            create = model_client.create
+
+            # autogen doesn't accept max_retries in a config_list entry, so it is set on the OpenAI client it built
+            oai_client = getattr(model_client, "_oai_client", None)
+            if oai_client is not None:
+                oai_client.max_retries = 0
+
+            def scheduled_create(params, create=create, scheduler=scheduler):
+                return scheduler.call(create, params)
+
+            model_client.create = scheduled_create
+
+    wrap_client(agent, schedule)
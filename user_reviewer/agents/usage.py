@@ -0,0 +1,32 @@
+def collect_usage(agents) -> dict:
+    """
+    Returns the prompt tokens, completion tokens and cost of the LLM calls made by each agent,
+    excluding the completions served from the cache. Agents that made no calls are left out.
+    """
+    usage = {}
+
+    for agent in agents:
+        summary = agent.get_actual_usage() if getattr(agent, "client", None) is not None else None
+
+        if not summary:
+            continue
+
+        entry = {"prompt_tokens": 0, "completion_tokens": 0, "cost": summary.get("total_cost", 0.0)}
+
+        for model, model_usage in summary.items():
+            if model == "total_cost":
+                continue
+
+            entry["prompt_tokens"] += model_usage.get("prompt_tokens", 0)
+            entry["completion_tokens"] += model_usage.get("completion_tokens", 0)
+
+        usage[agent.name] = entry
+
+    return usage
+
+
+def total_usage(usage: dict) -> dict:
+    """
+    Adds up the usage of all the agents of a conversation.
+    """
+    return {key: sum(entry[key] for entry in usage.values()) for key in ("prompt_tokens", "completion_tokens", "cost")}
@@ -1,10 +1,34 @@
-from fastapi import FastAPI, HTTPException
+import os
+import json
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import uvicorn
-from typing import List
+from typing import List, Literal
 
 # Import the model and service
 from models.revision import RevisionRequest
 from services.revision_service import RevisionService
+from services.job_service import JobService, QueueFullError
+from services.tokens import PromptBudgetExceeded
+from services.metrics import metrics, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT, JOB_QUEUE_ITEMS
+from services.tracing import tracer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # autogen runs the blocking OpenAI client of the async agents in the loop's default executor.
+    # The threads are only held during each LLM call, so a larger pool keeps many conversations moving.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=int(os.getenv("LLM_IO_THREADS", "64")), thread_name_prefix="llm-io"))
+    await job_service.start()
+    yield
+    await job_service.stop()
+    revision_service.close()
 
 
 app = FastAPI(
@@ -13,29 +37,130 @@ app = FastAPI(
         "Receives a question via POST containing the fields 'question', 'answer', and 'context', "
         "sends it to the initiate_chat method for evaluation, and returns only the final answer."
     ),
-    version="1.4.0"
+    version="1.4.0",
+    lifespan=lifespan,
 )
 
 # Create an instance of the revision service
 revision_service = RevisionService()
+job_service = JobService(revision_service)
+metrics.on_collect(lambda: JOB_QUEUE_ITEMS.set(job_service.stats()["queued_items"]))
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+
+    with HTTP_REQUESTS_IN_FLIGHT.track_in_progress():
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Label by route template so job ids don't create a series each
+            route = request.scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, path=path, status=status)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/revise")
-def revise_question(request: RevisionRequest):
+async def revise_question(request: RevisionRequest):
     try:
-        response = revision_service.process_revision(request)
+        response = await revision_service.aprocess_revision(request)
 
         return {"response": response}
+    except PromptBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/revise-questions")
-def revise_questions(requests: List[RevisionRequest]):
+async def revise_questions(
+    requests: List[RevisionRequest],
+    max_concurrency: int | None = Query(None, ge=1, description="Maximum number of items processed at the same time."),
+    stream: Literal["ndjson", "sse"] | None = Query(None, description="Stream each result as soon as it is ready."),
+):
+    if stream is not None:
+        records = revision_service.astream_revisions(requests, max_concurrency=max_concurrency)
+
+        return StreamingResponse(
+            format_stream(records, stream),
+            media_type="application/x-ndjson" if stream == "ndjson" else "text/event-stream",
+        )
+
     try:
-        responses = revision_service.process_revisions(requests)
+        responses = await revision_service.aprocess_revisions(requests, max_concurrency=max_concurrency)
         
         return {"responses": responses}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/jobs", status_code=202)
+async def submit_job(requests: List[RevisionRequest]):
+    try:
+        job = job_service.submit(requests)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return get_job_or_404(job_id).to_dict()
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    job = get_job_or_404(job_id)
+
+    return {
+        **job.to_dict(),
+        "offset": offset,
+        "limit": limit,
+        "results": job_service.results(job, offset=offset, limit=limit),
+    }
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    return job_service.cancel(get_job_or_404(job_id)).to_dict()
+
+@app.get("/debug/traces")
+async def list_traces(request_id: int | None = Query(None), limit: int = Query(20, ge=1, le=1000)):
+    return {"traces": tracer.recent(limit=limit, request_id=request_id)}
+
+@app.get("/debug/traces/{trace_id}")
+async def get_trace(trace_id: str, format: Literal["timeline", "otlp"] = "timeline"):
+    trace = tracer.find(trace_id)
+
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} not found")
+
+    return trace.to_otlp() if format == "otlp" else trace.to_dict()
+
+def get_job_or_404(job_id: str):
+    job = job_service.get(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    return job
+
+async def format_stream(records, stream: str):
+    """
+    Formats the streamed records as NDJSON lines or as Server-Sent Events.
+    """
+    async for record in records:
+        data = json.dumps(record, ensure_ascii=False)
+
+        if stream == "ndjson":
+            yield data + "\n"
+        else:
+            event = "summary" if "summary" in record else "result"
+            yield f"event: {event}\ndata: {data}\n\n"
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
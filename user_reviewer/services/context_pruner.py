@@ -0,0 +1,82 @@
+import os
+import json
+from fnmatch import fnmatch
+
+from services.tokens import count_tokens
+
+
+class ContextPruner:
+    """
+    Reduces the context of a request to the fields relevant to its intent before it goes into the prompt.
+    The field map lists, for each intent name, the context fields to keep (fnmatch patterns such as
+    "shipping*"). Requests whose intent isn't in the map use the "category:<name>" entry of their
+    category, then the "_default" entry; without any entry the whole context is kept.
+    Empty values are always dropped.
+    """
+
+    def __init__(self, field_map: dict | None = None, enabled: bool = True):
+        self.field_map = field_map or {}
+        self.enabled = enabled
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a pruner from the JSON file in CONTEXT_FIELD_MAP. CONTEXT_PRUNING=off disables it.
+        """
+        field_map = {}
+        path = os.getenv("CONTEXT_FIELD_MAP")
+
+        if path:
+            with open(path, encoding="utf-8") as f:
+                field_map = json.load(f)
+
+        return cls(field_map, enabled=os.getenv("CONTEXT_PRUNING", "on").lower() != "off")
+
+    def fields_for(self, intent: str | None, category: str | None):
+        for key in (intent, f"category:{category}", "_default"):
+            if key in self.field_map:
+                return self.field_map[key]
+
+        return None
+
+    def prune(self, context: dict, intent: str | None, category: str | None) -> dict:
+        if not self.enabled:
+            return context
+
+        patterns = self.fields_for(intent, category)
+
+        return {
+            field: value
+            for field, value in context.items()
+            if value not in (None, "", [], {})
+            and (patterns is None or any(fnmatch(field, pattern) for pattern in patterns))
+        }
+
+    def prepare(self, question_data: dict) -> dict:
+        """
+        Returns a copy of the question data with its context pruned.
+        """
+        if not self.enabled:
+            return question_data
+
+        context = self.prune(question_data["context"], question_data.get("intent"), question_data.get("category"))
+
+        return {**question_data, "context": context}
+
+    def serialize(self, question_data: dict) -> str:
+        """
+        Serializes the question data for the prompt, as compact JSON unless pruning is disabled.
+        """
+        if not self.enabled:
+            return json.dumps(question_data, indent=2, ensure_ascii=False)
+
+        return json.dumps(question_data, ensure_ascii=False, separators=(",", ":"))
+
+    def tokens_saved(self, question_data: dict, formatted: str, model: str = "gpt-4o") -> int:
+        """
+        Counts the prompt tokens saved by the formatted data against the full, indented question data.
+        """
+        if not self.enabled:
+            return 0
+
+        return count_tokens(json.dumps(question_data, indent=2, ensure_ascii=False), model) - count_tokens(formatted, model)
@@ -0,0 +1,280 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+from agents.client_wrappers import wrap_client
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+COUNT_BUCKETS = (1, 2, 3, 4, 6, 8, 10, 15, 20, 30)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: dict | None = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+
+        if not pairs:
+            return ""
+
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self):
+        with self._lock:
+            return [(f"{self.name}{self._format_labels(key)}", value) for key, value in sorted(self._values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{sample} {_format_value(value)}" for sample, value in self.samples())
+
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only go up")
+
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        """
+        Counts the blocks that are running at the same time.
+        """
+        self.inc(**labels)
+
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else _format_value(bound)
+                    samples.append((f"{self.name}_bucket{self._format_labels(key, {'le': le})}", cumulative))
+
+                samples.append((f"{self.name}_sum{self._format_labels(key)}", total))
+                samples.append((f"{self.name}_count{self._format_labels(key)}", cumulative))
+
+        return samples
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """
+    In-process registry of counters, gauges and histograms, rendered in the Prometheus text format.
+    Callbacks added with on_collect run before each render, to copy the stats kept by other
+    objects (caches, pools, queues) into gauges.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+
+            self._metrics[metric.name] = metric
+
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def on_collect(self, callback):
+        self._callbacks.append(callback)
+
+    def render(self) -> str:
+        for callback in self._callbacks:
+            callback()
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Latency of the HTTP requests.", ("method", "path", "status"))
+HTTP_REQUESTS_IN_FLIGHT = metrics.gauge(
+    "http_requests_in_flight", "HTTP requests being served.")
+CONVERSATIONS_IN_FLIGHT = metrics.gauge(
+    "revision_conversations_in_flight", "Agent conversations running at the same time.")
+CONVERSATION_ROUNDS = metrics.histogram(
+    "revision_conversation_rounds", "Messages exchanged in each conversation.", buckets=COUNT_BUCKETS)
+LLM_CALL_SECONDS = metrics.histogram(
+    "llm_call_duration_seconds", "Latency of the LLM calls of each agent, including cached completions.", ("agent",))
+LLM_CALL_ERRORS = metrics.counter(
+    "llm_call_errors_total", "LLM calls of each agent that raised an error.", ("agent",))
+LLM_TOKENS = metrics.counter(
+    "llm_tokens_total", "Tokens sent to and received from the LLM by each agent, excluding cached completions.", ("agent", "type"))
+LLM_COST = metrics.counter(
+    "llm_cost_dollars_total", "Cost of the LLM calls of each agent, excluding cached completions.", ("agent",))
+CONTEXT_TOKENS_SAVED = metrics.counter(
+    "context_tokens_saved_total", "Prompt tokens saved by the context pruning, against the full indented context.")
+RESULT_CACHE_LOOKUPS = metrics.gauge(
+    "result_cache_lookups", "Lookups in the result cache, by outcome.", ("outcome",))
+RESULT_CACHE_HIT_RATIO = metrics.gauge(
+    "result_cache_hit_ratio", "Share of result cache lookups that found a result.")
+LLM_CACHE_LOOKUPS = metrics.gauge(
+    "llm_cache_lookups", "Lookups in the LLM completion cache, by outcome.", ("namespace", "outcome"))
+LLM_CACHE_HIT_RATIO = metrics.gauge(
+    "llm_cache_hit_ratio", "Share of completion cache lookups that found a completion.", ("namespace",))
+AGENT_TEAMS = metrics.gauge(
+    "agent_pool_teams", "Agent teams of the pool, by state.", ("pool", "state"))
+JOB_QUEUE_ITEMS = metrics.gauge(
+    "job_queue_items", "Items waiting in the background job queue.")
+LLM_HTTP_REQUESTS = metrics.gauge(
+    "llm_http_requests", "HTTP requests sent to the LLM backend, by connection (new or reused).", ("connection",))
+LLM_HTTP_CONNECTIONS = metrics.gauge(
+    "llm_http_open_connections", "Connections open in the pool of the shared LLM HTTP client.")
+LLM_HTTP_TLS_HANDSHAKES = metrics.gauge(
+    "llm_http_tls_handshakes", "TLS handshakes made by the shared LLM HTTP client.")
+LLM_HTTP_REUSE_RATIO = metrics.gauge(
+    "llm_http_connection_reuse_ratio", "Share of the LLM HTTP requests sent on a connection that was already open.")
+LLM_CONCURRENCY_LIMIT = metrics.gauge(
+    "llm_concurrency_limit", "Adaptive limit of the LLM calls in flight, by backend.", ("backend",))
+LLM_SCHEDULER_WAIT_SECONDS = metrics.histogram(
+    "llm_scheduler_wait_seconds", "Time LLM calls waited for the rate limits and the concurrency limit, by backend.", ("backend",))
+LLM_RETRIES = metrics.counter(
+    "llm_retries_total", "LLM calls retried by the scheduler, by backend and reason.", ("backend", "reason"))
+LLM_CASCADE_CALLS = metrics.counter(
+    "llm_cascade_calls_total", "Replies of the cascaded agents, by model tier and outcome (accepted, borderline or unparsed).",
+    ("agent", "tier", "outcome"))
+REQUESTS_COALESCED = metrics.counter(
+    "revision_requests_coalesced_total", "Requests that joined an identical revision already in flight instead of running their own.")
+PREFILTER_DECISIONS = metrics.counter(
+    "prefilter_decisions_total", "Prefilter predictions, by mode and predicted outcome.", ("mode", "predicted"))
+PREFILTER_OUTCOMES = metrics.counter(
+    "prefilter_outcomes_total", "Prefilter predictions checked against the first review.", ("predicted", "actual"))
+
+
+def instrument_agent(agent):
+    """
+    Times every LLM call of an agent. autogen's async replies call the same client in a thread,
+    so this covers both paths.
+    """
+    def instrument(client):
+        create = client.create
+
+        def timed_create(**config):
+            start = time.perf_counter()
+
+            try:
+                return create(**config)
+            except Exception:
+                LLM_CALL_ERRORS.inc(agent=agent.name)
+                raise
+            finally:
+                LLM_CALL_SECONDS.observe(time.perf_counter() - start, agent=agent.name)
+
+        client.create = timed_create
+
+    wrap_client(agent, instrument)
+
+
+def record_usage(usage: dict):
+    """
+    Adds the usage collected from the agents of a conversation to the token and cost counters.
+    """
+    for agent, entry in usage.items():
+        LLM_TOKENS.inc(entry["prompt_tokens"], agent=agent, type="prompt")
+        LLM_TOKENS.inc(entry["completion_tokens"], agent=agent, type="completion")
+        LLM_COST.inc(entry["cost"], agent=agent)
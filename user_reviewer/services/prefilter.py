@@ -0,0 +1,185 @@
+import os
+import sys
+import logging
+import argparse
+
+from services.metrics import PREFILTER_DECISIONS, PREFILTER_OUTCOMES
+
+logger = logging.getLogger(__name__)
+
+# Answers whose first review is above this score are kept as they are by every service
+KEEP_SCORE = 7
+TEXT_COLUMNS = ["question", "answer"]
+CATEGORY_COLUMNS = ["intent", "category", "language"]
+
+
+class Prefilter:
+    """
+    Predicts, from the question, the answer, the intent, the category and the language, the
+    probability that the first review keeps the original answer (score above 7).
+    The model is trained on the rows of results.csv by `python -m services.prefilter train`.
+      - "off": the prefilter isn't used;
+      - "shadow": every request still goes through the agents, and the predictions are compared
+        with the first review in the metrics and in the "Prefilter Probability" column;
+      - "on": requests predicted above the threshold return the original answer right away.
+    """
+
+    MODES = ("off", "shadow", "on")
+
+    def __init__(self, model_path: str = "prefilter.joblib", threshold: float = 0.95, mode: str = "off"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown prefilter mode '{mode}', expected one of {self.MODES}")
+
+        self.model_path = model_path
+        self.threshold = threshold
+        self.mode = mode
+        self.model = None
+
+        if mode != "off":
+            if os.path.exists(model_path):
+                import joblib
+                self.model = joblib.load(model_path)
+            else:
+                logger.warning("Prefilter model %s not found, the prefilter is disabled", model_path)
+                self.mode = "off"
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a prefilter configured by PREFILTER, PREFILTER_MODEL and PREFILTER_THRESHOLD.
+        """
+        return cls(
+            model_path=os.getenv("PREFILTER_MODEL", "prefilter.joblib"),
+            threshold=float(os.getenv("PREFILTER_THRESHOLD", "0.95")),
+            mode=os.getenv("PREFILTER", "off").lower(),
+        )
+
+    @staticmethod
+    def features(request) -> dict:
+        return {
+            "question": request.question,
+            "answer": request.answer,
+            "intent": request.intent.get("name") or "",
+            "category": request.category or "",
+            "language": "portuguese" if request.locale == "pt" else "spanish",
+        }
+
+    def keep_probability(self, request) -> float | None:
+        """
+        Returns the probability that the original answer is kept, or None when the prefilter is off.
+        """
+        if self.mode == "off":
+            return None
+
+        import pandas as pd
+
+        probability = float(self.model.predict_proba(pd.DataFrame([self.features(request)]))[0][1])
+        predicted = "keep" if probability >= self.threshold else "review"
+        PREFILTER_DECISIONS.inc(mode=self.mode, predicted=predicted)
+
+        return probability
+
+    def skips(self, probability: float | None) -> bool:
+        return self.mode == "on" and probability is not None and probability >= self.threshold
+
+    def record_outcome(self, probability: float | None, original_score):
+        """
+        Compares a prediction with the score of the first review.
+        """
+        if probability is None or not isinstance(original_score, (int, float)):
+            return
+
+        PREFILTER_OUTCOMES.inc(
+            predicted="keep" if probability >= self.threshold else "review",
+            actual="keep" if original_score > KEEP_SCORE else "review",
+        )
+
+
+def load_results(path: str):
+    """
+    Reads the training rows from a results file (CSV or JSONL) written by any of the services.
+    """
+    import pandas as pd
+
+    frame = pd.read_json(path, lines=True) if path.endswith(".jsonl") else pd.read_csv(path)
+    frame = frame.rename(columns={
+        "Question": "question", "Original Answer": "answer", "Intent": "intent",
+        "Category": "category", "Language": "language", "Original Score": "score",
+    })
+    frame["score"] = pd.to_numeric(frame["score"], errors="coerce")
+    frame = frame.dropna(subset=["score", "question", "answer"])
+
+    for column in CATEGORY_COLUMNS:
+        frame[column] = frame[column].fillna("").astype(str)
+
+    return frame[TEXT_COLUMNS + CATEGORY_COLUMNS], (frame["score"] > KEEP_SCORE).astype(int)
+
+
+def build_model():
+    from sklearn.compose import ColumnTransformer
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    features = ColumnTransformer([
+        ("question", TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True), "question"),
+        ("answer", TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True), "answer"),
+        ("answer_chars", TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), min_df=2, sublinear_tf=True), "answer"),
+        ("categories", OneHotEncoder(handle_unknown="ignore"), CATEGORY_COLUMNS),
+    ])
+
+    return Pipeline([("features", features), ("classifier", LogisticRegression(max_iter=2000, C=2.0))])
+
+
+def train(results: list, model_path: str, test_size: float = 0.2, min_rows: int = 50):
+    """
+    Trains the prefilter on the results files and saves it to model_path.
+    Prints, for a holdout split, the share of requests that would skip the agents (coverage)
+    and how many of those the first review actually kept (precision), for several thresholds.
+    """
+    import joblib
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+
+    loaded = [load_results(path) for path in results]
+    features = pd.concat([frame for frame, _ in loaded], ignore_index=True)
+    labels = pd.concat([label for _, label in loaded], ignore_index=True)
+
+    if len(features) < min_rows or labels.nunique() < 2:
+        raise SystemExit(f"Not enough data to train: {len(features)} rows, {int(labels.sum())} kept answers")
+
+    train_features, test_features, train_labels, test_labels = train_test_split(
+        features, labels, test_size=test_size, stratify=labels, random_state=0)
+
+    model = build_model().fit(train_features, train_labels)
+    probabilities = model.predict_proba(test_features)[:, 1]
+
+    print(f"{len(features)} rows, {labels.mean():.1%} kept by the first review; holdout of {len(test_labels)} rows:")
+    print("threshold  coverage  precision")
+
+    for threshold in (0.8, 0.9, 0.95, 0.98, 0.99):
+        skipped = probabilities >= threshold
+        precision = test_labels[skipped].mean() if skipped.any() else float("nan")
+        print(f"{threshold:>9}  {skipped.mean():>8.1%}  {precision:>9.1%}")
+
+    # The saved model learns from every row
+    joblib.dump(build_model().fit(features, labels), model_path)
+    print(f"Saved {model_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m services.prefilter", description="Trains the answer prefilter.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train", help="Train the model on results files.")
+    train_parser.add_argument("results", nargs="*", default=[os.getenv("RESULTS_FILE", "results.csv")])
+    train_parser.add_argument("--model", default=os.getenv("PREFILTER_MODEL", "prefilter.joblib"))
+    train_parser.add_argument("--test-size", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        train(args.results, args.model, args.test_size)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
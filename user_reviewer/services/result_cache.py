@@ -0,0 +1,146 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from models.revision import RevisionRequest
+
+# Fields of a request that determine the result of a revision
+KEY_FIELDS = ("question", "answer", "context", "metadata", "locale", "intent", "category")
+
+
+class ResultCache:
+    """
+    Caches the results of finished revisions, keyed by a canonical hash of the request.
+    It has an in-memory LRU tier and an optional on-disk tier (diskcache), both with a TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 86400,
+        directory: str | None = None,
+        disk_size_limit: int = 2 ** 30,
+        namespace: str = "",
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+
+        if directory:
+            import diskcache
+
+            self._disk = diskcache.Cache(
+                directory, size_limit=disk_size_limit, eviction_policy="least-recently-used")
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, namespace: str = ""):
+        """
+        Builds a cache configured by the RESULT_CACHE_* environment variables.
+        """
+        return cls(
+            max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("RESULT_CACHE_TTL", "86400")),
+            directory=os.getenv("RESULT_CACHE_DIR") or None,
+            disk_size_limit=int(os.getenv("RESULT_CACHE_DISK_LIMIT", str(2 ** 30))),
+            namespace=namespace,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self._disk is not None
+
+    def make_key(self, request: RevisionRequest) -> str:
+        """
+        Hashes the fields of a request that determine its result. The JSON is canonical
+        (sorted keys, no whitespace), so equal requests get the same key.
+        """
+        fields = {field: getattr(request, field) for field in KEY_FIELDS}
+        canonical = json.dumps([self.namespace, fields], sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns (True, result) for a hit and (False, None) for a miss.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                expires_at, value = entry
+
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return True, copy.deepcopy(value)
+
+                del self._entries[key]
+
+        if self._disk is not None:
+            value = self._disk.get(key, default=None)
+
+            if value is not None:
+                self._remember(key, value)
+
+                with self._lock:
+                    self.disk_hits += 1
+
+                return True, copy.deepcopy(value)
+
+        with self._lock:
+            self.misses += 1
+
+        return False, None
+
+    def set(self, key: str, value):
+        value = copy.deepcopy(value)
+        self._remember(key, value)
+
+        if self._disk is not None:
+            self._disk.set(key, value, expire=self.ttl or None)
+
+    def _remember(self, key: str, value):
+        if self.max_entries <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+
+            return {
+                "entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
@@ -0,0 +1,137 @@
+import os
+import csv
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from itertools import groupby
+
+from filelock import FileLock
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class ResultWriter:
+    """
+    Appends result records to a CSV or JSONL file from a background thread.
+    Records are written in batches, when batch_size records are waiting or every
+    flush_interval seconds, under a file lock so several workers can share the file.
+    With per_worker, every process writes its own file instead (results.<pid>.csv).
+    """
+
+    def __init__(
+        self,
+        path: str = "results.csv",
+        file_format: str | None = None,
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        per_worker: bool = False,
+    ):
+        base, extension = os.path.splitext(path)
+        self.format = file_format or ("jsonl" if extension == ".jsonl" else "csv")
+        if self.format not in ("csv", "jsonl"):
+            raise ValueError(f"Unknown results format '{self.format}', expected 'csv' or 'jsonl'")
+
+        self.path = f"{base}.{os.getpid()}{extension}" if per_worker else path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._file_lock = FileLock(self.path + ".lock")
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+        # Records still waiting in the queue are written when the process exits
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, path: str | None = None):
+        """
+        Builds a writer configured by the RESULTS_* environment variables.
+        An explicit path takes precedence over RESULTS_FILE.
+        """
+        file_format = os.getenv("RESULTS_FORMAT") or None
+        default_path = "results.jsonl" if file_format == "jsonl" else "results.csv"
+
+        return cls(
+            path=path or os.getenv("RESULTS_FILE") or default_path,
+            file_format=file_format,
+            batch_size=int(os.getenv("RESULTS_BATCH_SIZE", "50")),
+            flush_interval=float(os.getenv("RESULTS_FLUSH_INTERVAL", "1.0")),
+            per_worker=os.getenv("RESULTS_PER_WORKER", "0") == "1",
+        )
+
+    def write(self, record: dict):
+        """
+        Queues a record to be written; it never blocks on the file.
+        """
+        self._queue.put(record)
+
+    def close(self):
+        """
+        Writes the records that are still queued and stops the background thread.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        records = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            try:
+                record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                record = None
+
+            if record is not None and record is not _STOP:
+                records.append(record)
+
+            if records and (record is _STOP or len(records) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(records)
+                records = []
+
+            if record is _STOP:
+                return
+
+            if not records:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, records):
+        try:
+            with self._file_lock:
+                if self.format == "jsonl":
+                    self._write_jsonl(records)
+                else:
+                    self._write_csv(records)
+        except Exception:
+            # Losing a batch of results must not stop the writer
+            logger.exception("Could not write %d results to %s", len(records), self.path)
+
+    def _write_jsonl(self, records):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def _write_csv(self, records):
+        is_empty = not os.path.exists(self.path) or os.stat(self.path).st_size == 0
+
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            # Use the keys of the records as CSV field names
+            for fieldnames, group in groupby(records, key=lambda record: tuple(record.keys())):
+                writer = csv.DictWriter(f, fieldnames=list(fieldnames))
+
+                # If the file was empty, write the header row
+                if is_empty:
+                    writer.writeheader()
+                    is_empty = False
+
+                writer.writerows(group)
@@ -1,21 +1,191 @@
 import os
-import csv
 import json
-import re
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from models.revision import RevisionRequest
-from agents.agents import reviewer, user_proxy  # Import the necessary agents
+from services.result_cache import ResultCache
+from services.result_writer import ResultWriter
+from services.context_pruner import ContextPruner
+from services.tokens import PromptBudgetExceeded, TokenBudget
+from services.tracing import tracer
+from services.prefilter import Prefilter
+from services.single_flight import SingleFlight
+from services.metrics import (
+    metrics, record_usage, AGENT_TEAMS, CONTEXT_TOKENS_SAVED, CONVERSATION_ROUNDS, CONVERSATIONS_IN_FLIGHT,
+    LLM_CACHE_HIT_RATIO, LLM_CACHE_LOOKUPS, LLM_HTTP_CONNECTIONS, LLM_HTTP_REQUESTS, LLM_HTTP_REUSE_RATIO,
+    LLM_HTTP_TLS_HANDSHAKES, RESULT_CACHE_HIT_RATIO, RESULT_CACHE_LOOKUPS,
+)
+from agents.agents import agent_pool, batch_reviewer_pool, budget_agent_pool, config_list, team_agents  # Each conversation gets its own agents
+from agents.batch_review import format_batch, format_item_review, parse_batch_reply
+from agents.usage import collect_usage, total_usage
+from agents.parsing import parse_reply
+from agents.llm_cache import close_completion_caches, completion_cache_stats
+from agents.http_client import close_http_client, http_client_stats
 
+logger = logging.getLogger(__name__)
+
+REVIEW_BATCH_ITEMS = metrics.counter(
+    "review_batch_items_total",
+    "Items of the batched first reviews, by outcome: passed (original answer kept), revise (their conversation starts from the review) or unparsed (reviewed again in their conversation).",
+    ("outcome",))
 
 class RevisionService:
-    def __init__(self, results_file: str = "results.csv"):
-        self.results_file = results_file
+    def __init__(self, results_file: str | None = None, max_concurrency: int | None = None):
+        # Records are written in batches by a background thread, outside the request latency
+        self.result_writer = ResultWriter.from_env(results_file)
+        # Number of items of a batch that are processed at the same time
+        self.max_concurrency = max_concurrency or int(os.getenv("REVISION_MAX_CONCURRENCY", "4"))
+        # Items of a batch sharing a locale and category that get their first review in a single LLM call (1 disables it)
+        self.review_batch_size = int(os.getenv("REVIEW_BATCH_SIZE", "1"))
+        self.context_pruner = ContextPruner.from_env()
+        # Prompts over the budget are trimmed, rejected or routed to the budget model before the conversation starts
+        self.token_budget = TokenBudget.from_env()
+        if self.token_budget.max_tokens and self.token_budget.policy == "route" and budget_agent_pool is None:
+            raise ValueError("PROMPT_BUDGET_POLICY=route needs the cheaper model in BUDGET_MODEL")
+        # Optional classifier that returns clearly good answers without running the agents
+        self.prefilter = Prefilter.from_env()
+        self.result_cache = ResultCache.from_env(namespace="user_reviewer")
+        # Identical requests in flight at the same time, keyed like the result cache, run only once
+        self.in_flight = SingleFlight.from_env()
+        metrics.on_collect(self.collect_metrics)
+        tracer.service_name = os.getenv("OTEL_SERVICE_NAME", "user_reviewer")
+
+    def process_revision(self, request: RevisionRequest, first_review: dict | None = None) -> str:
+        """
+        Processes a single revision request, reusing the result of an identical earlier or in-flight request.
+        first_review is the review the request already got in a batch, if any.
+        Returns the final revised answer.
+        """
+        key = self.result_cache.make_key(request)
+        found, response = self.result_cache.get(key)
+
+        if not found:
+            def run():
+                response = self.run_revision(request, first_review)
+                self.result_cache.set(key, response)
+                return response
+
+            # Identical requests that arrive while this one runs share its conversation
+            response = self.in_flight.do(key, run)
+
+        return response
+
+    async def aprocess_revision(self, request: RevisionRequest, first_review: dict | None = None) -> str:
+        """
+        Processes a single revision request without blocking the event loop,
+        reusing the result of an identical earlier or in-flight request.
+        """
+        key = self.result_cache.make_key(request)
+        found, response = self.result_cache.get(key)
+
+        if not found:
+            async def run():
+                response = await self.arun_revision(request, first_review)
+                self.result_cache.set(key, response)
+                return response
+
+            # Identical requests that arrive while this one runs share its conversation
+            response = await self.in_flight.ado(key, run)
+
+        return response
+
+    def run_revision(self, request: RevisionRequest, first_review: dict | None = None) -> str:
+        """
+        Runs the conversation for a single revision request. With the first review of the request,
+        made in a batch, the conversation starts from it instead of asking the Reviewer again.
+        Returns the final revised answer.
+        """
+        probability = self.prefilter.keep_probability(request)
+        if self.prefilter.skips(probability):
+            return self.keep_original(request)
+
+        message, stats = self.build_message(request)
+        stats["prefilter_probability"] = probability
+
+        # Start the chat for evaluation/revision
+        with CONVERSATIONS_IN_FLIGHT.track_in_progress(), self.agent_pool_for(stats).acquire() as team:
+            with tracer.trace(request.id, team_agents(team)) as trace:
+                if first_review is None:
+                    result = team.user_proxy.initiate_chat(team.reviewer, message=message, cache=team.reviewer.client_cache)
+                else:
+                    # The review is the Reviewer's first reply, so the User goes straight to the rewrite
+                    team.user_proxy.send(message, team.reviewer, request_reply=False)
+                    result = team.reviewer.initiate_chat(
+                        team.user_proxy, message=format_item_review(first_review), clear_history=False,
+                        max_turns=team.reviewer.max_consecutive_auto_reply(), cache=team.reviewer.client_cache,
+                    )
+
+            stats["trace_id"] = trace.trace_id if trace is not None else None
+            # The usage of the agents is cleared once the team is released
+            stats["rounds"] = len(result.chat_history)
+            stats["usage"] = collect_usage(team_agents(team))
 
-    def process_revision(self, request: RevisionRequest) -> str:
+        return self.finish_revision(request, result, stats)
+
+    async def arun_revision(self, request: RevisionRequest, first_review: dict | None = None) -> str:
         """
-        Processes a single revision request.
+        Runs the conversation for a single revision request without blocking the event loop.
         Returns the final revised answer.
         """
+        probability = self.prefilter.keep_probability(request)
+        if self.prefilter.skips(probability):
+            return self.keep_original(request)
+
+        message, stats = self.build_message(request)
+        stats["prefilter_probability"] = probability
+
+        # Start the chat for evaluation/revision
+        with CONVERSATIONS_IN_FLIGHT.track_in_progress(), self.agent_pool_for(stats).acquire() as team:
+            with tracer.trace(request.id, team_agents(team)) as trace:
+                if first_review is None:
+                    result = await team.user_proxy.a_initiate_chat(team.reviewer, message=message, cache=team.reviewer.client_cache)
+                else:
+                    # The review is the Reviewer's first reply, so the User goes straight to the rewrite
+                    await team.user_proxy.a_send(message, team.reviewer, request_reply=False)
+                    result = await team.reviewer.a_initiate_chat(
+                        team.user_proxy, message=format_item_review(first_review), clear_history=False,
+                        max_turns=team.reviewer.max_consecutive_auto_reply(), cache=team.reviewer.client_cache,
+                    )
+
+            stats["trace_id"] = trace.trace_id if trace is not None else None
+            # The usage of the agents is cleared once the team is released
+            stats["rounds"] = len(result.chat_history)
+            stats["usage"] = collect_usage(team_agents(team))
+
+        return self.finish_revision(request, result, stats)
+
+    @staticmethod
+    def keep_original(request: RevisionRequest) -> str:
+        """
+        Returns the original answer of a request the prefilter is confident about, without reviewing it.
+        No result record is saved, as there is no review.
+        """
+        return request.answer.strip()
+
+    @staticmethod
+    def agent_pool_for(stats: dict):
+        """
+        Returns the pool of the budget model for the requests routed to it, the default pool otherwise.
+        """
+        return budget_agent_pool if stats["budget_action"] == "route" else agent_pool
+
+    def build_message(self, request: RevisionRequest):
+        """
+        Builds the message that starts the conversation for a request.
+        Returns the message and statistics about its prompt.
+        """
+        formatted_question, stats = self.format_request(request)
+
+        return f"Please evaluate the following answer:\n{formatted_question}", stats
+
+    def format_request(self, request: RevisionRequest):
+        """
+        Formats the data of a request for a prompt.
+        Returns the formatted JSON and statistics about it.
+        """
         # Extract the language and intent from the request
         language = "portuguese" if request.locale == "pt" else "spanish"
         intent = request.intent.get("name")
@@ -31,30 +201,49 @@ class RevisionService:
             "intent": intent,
         }
 
-        formatted_question = json.dumps(
-            question_data, indent=2, ensure_ascii=False)
-        message = f"Please evaluate the following answer:\n{formatted_question}"
+        # Only the context fields relevant to the intent go into the prompt, as compact JSON within the token budget
+        model = config_list[0]["model"]
+        pruned_data = self.context_pruner.prepare(question_data)
+        formatted_question, stats = self.token_budget.fit(pruned_data, self.context_pruner.serialize, model)
+        stats["context_tokens_saved"] = self.context_pruner.tokens_saved(question_data, formatted_question, model)
 
-        # Start the chat for evaluation/revision
-        result = user_proxy.initiate_chat(reviewer, message=message)
+        return formatted_question, stats
 
+    def finish_revision(self, request: RevisionRequest, result, stats: dict) -> str:
+        """
+        Extracts the results of a finished conversation and saves them.
+        Returns the final revised answer.
+        """
         # Extract relevant information from the chat history
         final_answer, previous_score, new_score, suggestions = self.extract_chat_results(
             result, request.answer)
 
-        # Extract total cost, if available
-        total_cost = result.cost.get(
-            'usage_excluding_cached_inference', {}).get('total_cost')
-        cost_str = f"${total_cost}" if total_cost is not None else "Cost information not available"
-
         # Define the 'revised_answer' field based on the rules
         revised_answer = self.determine_revised_answer(
             request.answer, final_answer)
 
         new_score = new_score if new_score is not None else "-"
 
-        # Build the record to save the results
-        new_record = {
+        record_usage(stats["usage"])
+        CONTEXT_TOKENS_SAVED.inc(max(0, stats["context_tokens_saved"]))
+        self.prefilter.record_outcome(stats["prefilter_probability"], previous_score)
+        CONVERSATION_ROUNDS.observe(stats["rounds"])
+
+        self.save_result(self.make_record(request, stats, previous_score, suggestions, revised_answer, new_score))
+
+        return final_answer.strip()
+
+    @staticmethod
+    def make_record(request: RevisionRequest, stats: dict, previous_score, suggestions, revised_answer, new_score) -> dict:
+        """
+        Builds the results record of a request.
+        """
+        language = "portuguese" if request.locale == "pt" else "spanish"
+
+        # Tokens and cost of the LLM calls of all the agents, excluding cached completions
+        usage = total_usage(stats["usage"])
+
+        return {
             "Question": request.question,
             "Original Answer": request.answer,
             "Original Score": previous_score,
@@ -62,52 +251,290 @@ class RevisionService:
             "Suggestions": suggestions,
             "Revised Answer": revised_answer,
             "Final Score": new_score,
-            "Total Cost": cost_str,
             "Language": language,
             "Intent": request.intent.get("name"),
             "Category": request.category,
+            "Context Tokens Saved": stats["context_tokens_saved"],
+            "Prompt Tokens Estimate": stats["prompt_tokens_estimate"],
+            "Budget Action": stats["budget_action"] or "-",
+            "Prompt Tokens": usage["prompt_tokens"],
+            "Completion Tokens": usage["completion_tokens"],
+            "Total Cost": round(usage["cost"], 6),
+            "Token Usage": json.dumps(stats["usage"]),
+            "Trace Id": stats["trace_id"] or "-",
+            "Prefilter Probability": round(stats["prefilter_probability"], 4) if stats["prefilter_probability"] is not None else "-",
         }
 
-        self.save_result(new_record)
+    def process_revisions(self, requests: List[RevisionRequest], max_concurrency: int | None = None) -> List:
+        """
+        Processes a list of revision requests, running up to max_concurrency of them at the same time.
+        Returns the results in the same order as the requests. A request that fails is returned as
+        {"id": ..., "error": ...} instead of failing the whole batch.
+        """
+        if not requests:
+            return []
 
-        return final_answer.strip()
+        limit = max(1, min(max_concurrency or self.max_concurrency, len(requests)))
+        settled, batches = self.plan_review_batches(requests)
+
+        with ThreadPoolExecutor(max_workers=limit, thread_name_prefix="revision") as executor:
+            # The batched reviews are queued first: the requests wait for them and never the other way round
+            reviews = {}
+            for batch in batches:
+                future = executor.submit(self.review_batch, requests, batch)
+                reviews.update((index, future) for index, _, _ in batch)
+
+            def run(index: int, req: RevisionRequest):
+                if index in settled:
+                    return settled[index]
+
+                passed, reviewed = reviews[index].result() if index in reviews else ({}, {})
+                return passed[index] if index in passed else self.process_revision(req, reviewed.get(index))
+
+            futures = [executor.submit(run, index, req) for index, req in enumerate(requests)]
+
+            responses = []
+            for req, future in zip(requests, futures):
+                try:
+                    responses.append(future.result())
+                except Exception as e:
+                    responses.append({"id": req.id, "error": str(e)})
+
+        return responses
 
-    def process_revisions(self, requests: List[RevisionRequest]) -> List[str]:
+    async def aprocess_revisions(self, requests: List[RevisionRequest], max_concurrency: int | None = None) -> List:
         """
-        Processes a list of revision requests.
-        Returns a list of final revised answers.
+        Async version of process_revisions, with the same ordering and error semantics.
         """
-        responses = []
-        for req in requests:
-            revised = self.process_revision(req)
-            responses.append(revised)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrency))
+        revise = self.start_review_batches(requests, semaphore)
 
-        return responses
+        async def run(index: int, req: RevisionRequest):
+            try:
+                return await revise(index, req)
+            except Exception as e:
+                return {"id": req.id, "error": str(e)}
+
+        return list(await asyncio.gather(*(run(index, req) for index, req in enumerate(requests))))
+
+    async def astream_revisions(self, requests: List[RevisionRequest], max_concurrency: int | None = None):
+        """
+        Processes a list of revision requests like aprocess_revisions, but yields each result as soon
+        as it is ready, tagged with the request id, and finishes with a summary record.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrency))
+        start = time.perf_counter()
+        revise = self.start_review_batches(requests, semaphore)
+
+        async def run(index: int, req: RevisionRequest):
+            try:
+                return self.tag_result(req, await revise(index, req))
+            except Exception as e:
+                return {"id": req.id, "error": str(e)}
+
+        tasks = [asyncio.create_task(run(index, req)) for index, req in enumerate(requests)]
+        failed = 0
+
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                record = await next_result
+                failed += "error" in record
+                yield record
+        finally:
+            # The client may disconnect in the middle of the stream
+            for task in tasks:
+                task.cancel()
+
+        yield {
+            "summary": {
+                "total": len(requests),
+                "succeeded": len(requests) - failed,
+                "failed": failed,
+                "elapsed_seconds": round(time.perf_counter() - start, 3),
+            }
+        }
+
+    def start_review_batches(self, requests: List[RevisionRequest], semaphore: asyncio.Semaphore):
+        """
+        Starts the batched first reviews of a list of requests, each one taking a slot of the semaphore.
+        Returns the coroutine function that processes the request at an index: it returns the original
+        answer when it passed its batched review, and runs the request's own conversation otherwise,
+        starting from its batched review when it has one.
+        """
+        settled, batches = self.plan_review_batches(requests)
+        reviews = {}
+
+        async def review(batch):
+            async with semaphore:
+                return await self.areview_batch(requests, batch)
+
+        for batch in batches:
+            task = asyncio.ensure_future(review(batch))
+            reviews.update((index, task) for index, _, _ in batch)
+
+        async def revise(index: int, req: RevisionRequest):
+            if index in settled:
+                return settled[index]
+
+            # Waited for outside the semaphore, which the review needs. The shield keeps the review
+            # of the other requests of the batch running when this one is cancelled.
+            passed, reviewed = await asyncio.shield(reviews[index]) if index in reviews else ({}, {})
+            if index in passed:
+                return passed[index]
+
+            async with semaphore:
+                return await self.aprocess_revision(req, reviewed.get(index))
+
+        return revise
+
+    def plan_review_batches(self, requests: List[RevisionRequest]):
+        """
+        Plans the batched first review of a list of requests. The requests whose result is cached
+        are settled right away; the others are grouped by locale and category, in batches of up to
+        review_batch_size requests. Requests over the token budget or routed to the budget model,
+        and batches of a single request, go straight to their own conversation.
+        Returns the cached responses by request index, and the batches as lists of
+        (request index, formatted request, prompt stats).
+        """
+        if self.review_batch_size <= 1 or len(requests) < 2:
+            return {}, []
+
+        settled, groups = {}, {}
+
+        for index, request in enumerate(requests):
+            found, response = self.result_cache.get(self.result_cache.make_key(request))
+
+            if found:
+                settled[index] = response
+                continue
+
+            try:
+                formatted_question, stats = self.format_request(request)
+            except PromptBudgetExceeded:
+                # Raised again by the conversation of the request, which reports the error
+                continue
+
+            if stats["budget_action"] != "route":
+                groups.setdefault((request.locale, request.category), []).append((index, formatted_question, stats))
+
+        batches = [
+            group[start:start + self.review_batch_size]
+            for group in groups.values()
+            for start in range(0, len(group), self.review_batch_size)
+        ]
+
+        return settled, [batch for batch in batches if len(batch) > 1]
+
+    def review_batch(self, requests: List[RevisionRequest], batch: list) -> dict:
+        """
+        Runs the first review of a batch of requests in a single LLM call.
+        Returns the responses of the requests whose answer passed and the reviews of the requests
+        to revise, by request index (see finish_batch_review). Every request of a batch whose call
+        failed goes on to its own conversation, from the start.
+        """
+        message = format_batch([formatted_question for _, formatted_question, _ in batch])
+
+        try:
+            with batch_reviewer_pool.acquire() as reviewer:
+                with tracer.trace(self.batch_id(requests, batch), [reviewer]) as trace:
+                    reply = reviewer.generate_reply(messages=[{"role": "user", "content": message}])
+
+                # The usage of the agent is cleared once it is released
+                usage = collect_usage([reviewer])
+        except Exception:
+            logger.exception("The batched review of %d requests failed, they will be reviewed one by one", len(batch))
+            return {}, {}
+
+        return self.finish_batch_review(requests, batch, reply, usage, trace.trace_id if trace is not None else None)
+
+    async def areview_batch(self, requests: List[RevisionRequest], batch: list) -> dict:
+        """
+        Async version of review_batch.
+        """
+        message = format_batch([formatted_question for _, formatted_question, _ in batch])
+
+        try:
+            with batch_reviewer_pool.acquire() as reviewer:
+                with tracer.trace(self.batch_id(requests, batch), [reviewer]) as trace:
+                    reply = await reviewer.a_generate_reply(messages=[{"role": "user", "content": message}])
+
+                # The usage of the agent is cleared once it is released
+                usage = collect_usage([reviewer])
+        except Exception:
+            logger.exception("The batched review of %d requests failed, they will be reviewed one by one", len(batch))
+            return {}, {}
+
+        return self.finish_batch_review(requests, batch, reply, usage, trace.trace_id if trace is not None else None)
+
+    @staticmethod
+    def batch_id(requests: List[RevisionRequest], batch: list) -> str:
+        return ",".join(str(requests[index].id) for index, _, _ in batch)
+
+    def finish_batch_review(self, requests: List[RevisionRequest], batch: list, reply, usage: dict, trace_id) -> dict:
+        """
+        Saves the results of the requests of a batch whose answer passed the first review: as in
+        their own conversation, the original answer is kept. Each one is charged an equal share
+        of the usage of the call.
+        Returns their responses by request index, and the reviews of the requests to revise, which
+        their own conversation starts from. Requests whose review can't be read get neither.
+        """
+        reviews = parse_batch_reply(reply)
+        share = {
+            agent: {
+                "prompt_tokens": round(entry["prompt_tokens"] / len(batch)),
+                "completion_tokens": round(entry["completion_tokens"] / len(batch)),
+                "cost": entry["cost"] / len(batch),
+            }
+            for agent, entry in usage.items()
+        }
+        passed, reviewed = {}, {}
+
+        record_usage(usage)
+
+        for number, (index, _, stats) in enumerate(batch, start=1):
+            request = requests[index]
+            review = reviews.get(number, {})
+            score = review.get("total_score")
+
+            if score is None:
+                REVIEW_BATCH_ITEMS.inc(outcome="unparsed")
+                continue
+
+            if score <= 7:
+                REVIEW_BATCH_ITEMS.inc(outcome="revise")
+                reviewed[index] = review
+                continue
+
+            REVIEW_BATCH_ITEMS.inc(outcome="passed")
+            stats.update(usage=share, trace_id=trace_id, prefilter_probability=None)
+            CONTEXT_TOKENS_SAVED.inc(max(0, stats["context_tokens_saved"]))
+            self.save_result(self.make_record(request, stats, score, review.get("suggestions"), "-", "-"))
+
+            passed[index] = request.answer.strip()
+            self.result_cache.set(self.result_cache.make_key(request), passed[index])
+
+        return passed, reviewed
 
     @staticmethod
     def extract_chat_results(result, original_answer):
         """
-        Extracts final answer, scores, and suggestions from chat using regex.
+        Extracts final answer, scores, and suggestions from the replies of the chat, written with tags or as JSON.
         Returns: final_answer, previous_score, new_score, suggestions.
         """
         chat = getattr(result, "chat_history", []) or []
-        content = "\n".join(msg.get("content", "") for msg in chat if msg.get("name") in ("Reviewer", "User"))
+        replies = [parse_reply(msg) for msg in chat if msg.get("name") in ("Reviewer", "User")]
 
         # Final answer extraction
-        revised_match = re.search(r"<revised_answer>(.*?)</revised_answer>", content, re.DOTALL)
-        final_answer = revised_match.group(1).strip() if revised_match else original_answer
+        revised_answer = next((reply["revised_answer"] for reply in replies if "revised_answer" in reply), None)
+        final_answer = revised_answer if revised_answer is not None else original_answer
 
-        # Scores extraction
-        prev_match = re.search(r"<total_score>(\d+)</total_score>", content)
-        scores = [int(prev_match.group(1))] if prev_match else []
-        # If two scores (original and updated) appear, capture both
-        all_scores = re.findall(r"<total_score>(\d+)</total_score>", content)
-        previous_score = int(all_scores[0]) if len(all_scores) > 0 else None
-        new_score = int(all_scores[1]) if len(all_scores) > 1 else None
+        # Scores extraction: the first review and, if the answer was revised, the review of the revision
+        all_scores = [reply["total_score"] for reply in replies if "total_score" in reply]
+        previous_score = all_scores[0] if len(all_scores) > 0 else None
+        new_score = all_scores[1] if len(all_scores) > 1 else None
 
         # Suggestions extraction
-        sug_match = re.search(r"<suggestions>(.*?)</suggestions>", content, re.DOTALL)
-        suggestions = sug_match.group(1).strip() if sug_match else None
+        suggestions = next((reply["suggestions"] for reply in replies if "suggestions" in reply), None)
 
         return final_answer, previous_score, new_score, suggestions
 
@@ -126,24 +553,54 @@ class RevisionService:
 
         return revised
 
-    def save_result(self, record):
+
+    @staticmethod
+    def tag_result(request: RevisionRequest, response) -> dict:
+        """
+        Tags the result of a request with its id, for results that are delivered out of order.
+        """
+        return {"id": request.id, "response": response}
+
+    def collect_metrics(self):
         """
-        Reads existing records (if any) and adds a new record,
-        saving everything to the CSV file.
+        Copies the stats of the caches, agent pools and LLM HTTP client into the metrics, when they are scraped.
         """
-        # Check if the file exists and if it is empty
-        file_exists = os.path.exists(self.results_file)
-        is_empty = not file_exists or os.stat(self.results_file).st_size == 0
+        cache_stats = self.result_cache.stats()
+        RESULT_CACHE_LOOKUPS.set(cache_stats["memory_hits"], outcome="memory_hit")
+        RESULT_CACHE_LOOKUPS.set(cache_stats["disk_hits"], outcome="disk_hit")
+        RESULT_CACHE_LOOKUPS.set(cache_stats["misses"], outcome="miss")
+        RESULT_CACHE_HIT_RATIO.set(cache_stats["hit_rate"])
+
+        for namespace, stats in completion_cache_stats().items():
+            LLM_CACHE_LOOKUPS.set(stats["hits"], namespace=namespace, outcome="hit")
+            LLM_CACHE_LOOKUPS.set(stats["misses"], namespace=namespace, outcome="miss")
+            LLM_CACHE_HIT_RATIO.set(stats["hit_rate"], namespace=namespace)
 
-        # Open the file in append mode
-        with open(self.results_file, "a", newline="", encoding="utf-8") as f:
-            # Use the keys of the record as CSV field names
-            fieldnames = list(record.keys())
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+        http_stats = http_client_stats()
+        if http_stats:
+            LLM_HTTP_REQUESTS.set(http_stats["new_connections"], connection="new")
+            LLM_HTTP_REQUESTS.set(http_stats["reused_connections"], connection="reused")
+            LLM_HTTP_CONNECTIONS.set(http_stats["open_connections"])
+            LLM_HTTP_TLS_HANDSHAKES.set(http_stats["tls_handshakes"])
+            LLM_HTTP_REUSE_RATIO.set(http_stats["reuse_ratio"])
 
-            # If the file does not exist or is empty, write the header row
-            if is_empty:
-                writer.writeheader()
+        for name, pool in (("default", agent_pool), ("budget", budget_agent_pool)):
+            if pool is not None:
+                pool_stats = pool.stats()
+                AGENT_TEAMS.set(pool_stats["in_use"], pool=name, state="in_use")
+                AGENT_TEAMS.set(pool_stats["idle"], pool=name, state="idle")
+
+    def close(self):
+        """
+        Releases the resources held by the service when the application shuts down.
+        """
+        self.result_writer.close()
+        self.result_cache.close()
+        close_completion_caches()
+        close_http_client()
 
-            # Write the new record to the CSV file
-            writer.writerow(record)
+    def save_result(self, record):
+        """
+        Queues a record to be appended to the results file by the background writer.
+        """
+        self.result_writer.write(record)
@@ -0,0 +1,114 @@
+import os
+import copy
+import asyncio
+import threading
+
+from services.metrics import REQUESTS_COALESCED
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical requests that are in flight at the same time: the first caller of a key
+    runs the work, and the callers that arrive before it finishes wait for it and get the same
+    result, or the same exception. Followers get a copy of the result, as with the result cache.
+    In the async path the work runs in its own task, which is cancelled only when every caller
+    waiting for it has been cancelled.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: dict[str, _Call] = {}
+        self._tasks: dict[str, tuple[asyncio.Task, list]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(enabled=os.getenv("REQUEST_COALESCING", "on").lower() not in ("0", "off", "false"))
+
+    def do(self, key: str, fn):
+        """
+        Returns fn(), run once for all the concurrent callers of the same key.
+        """
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            REQUESTS_COALESCED.inc()
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+    async def ado(self, key: str, coroutine_fn):
+        """
+        Returns await coroutine_fn(), run once for all the concurrent callers of the same key.
+        """
+        if not self.enabled:
+            return await coroutine_fn()
+
+        with self._lock:
+            flight = self._tasks.get(key)
+            leader = flight is None
+
+            if leader:
+                task = asyncio.ensure_future(coroutine_fn())
+                # Number of callers still waiting for the task
+                waiters = [0]
+                flight = self._tasks[key] = (task, waiters)
+                task.add_done_callback(lambda _: self._forget(key, task))
+
+            task, waiters = flight
+            waiters[0] += 1
+
+        if not leader:
+            REQUESTS_COALESCED.inc()
+
+        try:
+            # The shield keeps the task running when only this caller is cancelled
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            with self._lock:
+                waiters[0] -= 1
+                abandoned = waiters[0] == 0
+
+            if abandoned:
+                task.cancel()
+            raise
+
+        with self._lock:
+            waiters[0] -= 1
+
+        return result if leader else copy.deepcopy(result)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        with self._lock:
+            if self._tasks.get(key, (None,))[0] is task:
+                del self._tasks[key]
@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import uuid
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from agents.client_wrappers import wrap_client
+
+
+class Span:
+    """
+    A timed step of a conversation: an agent turn, a tool call or the whole revision.
+    """
+
+    def __init__(self, name: str, kind: str, parent_id: str | None = None, **attributes):
+        self.name = name
+        self.kind = kind
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self, origin_ns: int) -> dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "offset_s": round((self.start_ns - origin_ns) / 1e9, 4),
+            "duration_s": round(self.duration, 4),
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self, trace_id: str) -> dict:
+        return {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            # SPAN_KIND_INTERNAL for the steps, SPAN_KIND_SERVER for the revision itself
+            "kind": 2 if self.parent_id is None else 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(key, value) for key, value in {"kind": self.kind, **self.attributes}.items()],
+        }
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+
+    return {"key": key, "value": encoded}
+
+
+class Trace:
+    """
+    The spans of a single revision request. Spans can be added from several threads,
+    as the parallel reviews do.
+    """
+
+    def __init__(self, request_id, service_name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.service_name = service_name
+        self.root = Span("revision", "revision", request_id=request_id)
+        self.spans = [self.root]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attributes):
+        """
+        Times the block as a span of the revision. The block can add attributes to the yielded span.
+        """
+        span = Span(name, kind, parent_id=self.root.span_id, **attributes)
+
+        try:
+            yield span
+        except Exception as e:
+            span.attributes["error"] = repr(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+
+            with self._lock:
+                self.spans.append(span)
+
+    def finish(self):
+        self.root.end_ns = time.time_ns()
+
+    def summary(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "request_id": self.request_id,
+            "duration_s": round(self.root.duration, 4),
+            "spans": len(self.spans),
+        }
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_ns)
+
+        return {**self.summary(), "spans": [span.to_dict(self.root.start_ns) for span in spans]}
+
+    def to_otlp(self) -> dict:
+        """
+        Returns the trace as an OTLP/JSON ExportTraceServiceRequest.
+        """
+        with self._lock:
+            spans = [span.to_otlp(self.trace_id) for span in self.spans]
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "answer_reviewer"}, "spans": spans}],
+            }]
+        }
+
+
+class Tracer:
+    """
+    Records a trace for every revision request. The traces of the last buffer_size requests are
+    kept in memory for the debug endpoints; with a path, every finished trace is also appended
+    to that file as a line of OTLP/JSON.
+    """
+
+    def __init__(self, enabled: bool = True, buffer_size: int = 100, path: str | None = None, service_name: str = "answer_reviewer"):
+        self.enabled = enabled
+        self.buffer_size = buffer_size
+        self.path = path
+        self.service_name = service_name
+        self._active: dict[str, Trace] = {}
+        self._finished: OrderedDict[str, Trace] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a tracer configured by TRACING, TRACE_BUFFER_SIZE and TRACE_FILE.
+        """
+        return cls(
+            enabled=os.getenv("TRACING", "on").lower() != "off",
+            buffer_size=int(os.getenv("TRACE_BUFFER_SIZE", "100")),
+            path=os.getenv("TRACE_FILE") or None,
+        )
+
+    @contextmanager
+    def trace(self, request_id, agents):
+        """
+        Traces a conversation. The trace is bound to the agents of the conversation so their
+        LLM calls, which autogen may run in other threads, are recorded in it.
+        Yields None when tracing is disabled.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        trace = Trace(request_id, self.service_name)
+
+        with self._lock:
+            self._active[trace.trace_id] = trace
+
+        for agent in agents:
+            agent.active_trace = trace
+
+        try:
+            yield trace
+        finally:
+            for agent in agents:
+                agent.active_trace = None
+
+            trace.finish()
+            self._keep(trace)
+
+    def _keep(self, trace: Trace):
+        with self._lock:
+            self._active.pop(trace.trace_id, None)
+            self._finished[trace.trace_id] = trace
+
+            while len(self._finished) > self.buffer_size:
+                self._finished.popitem(last=False)
+
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_otlp(), ensure_ascii=False, default=str) + "\n")
+
+    def find(self, trace_id: str | None) -> Trace | None:
+        if trace_id is None:
+            return None
+
+        with self._lock:
+            return self._active.get(trace_id) or self._finished.get(trace_id)
+
+    def recent(self, limit: int = 20, request_id=None) -> list:
+        """
+        Returns the summaries of the last finished traces, newest first.
+        """
+        with self._lock:
+            traces = list(reversed(self._finished.values()))
+
+        if request_id is not None:
+            traces = [trace for trace in traces if str(trace.request_id) == str(request_id)]
+
+        return [trace.summary() for trace in traces[:limit]]
+
+
+tracer = Tracer.from_env()
+
+
+def trace_agent(agent):
+    """
+    Records every LLM call of an agent as an agent turn span of the trace bound to the agent,
+    with its token counts and the tools it asked for.
+    """
+    agent.active_trace = None
+
+    def trace_calls(client):
+        create = client.create
+
+        def traced_create(**config):
+            trace = agent.active_trace
+
+            if trace is None:
+                return create(**config)
+
+            with trace.span(agent.name, "agent_turn", agent=agent.name) as span:
+                response = create(**config)
+                usage = getattr(response, "usage", None)
+
+                if usage is not None:
+                    span.attributes["prompt_tokens"] = usage.prompt_tokens
+                    span.attributes["completion_tokens"] = usage.completion_tokens
+
+                span.attributes["model"] = getattr(response, "model", None) or ""
+                tool_calls = [
+                    tool_call.function.name
+                    for choice in getattr(response, "choices", []) or []
+                    for tool_call in getattr(choice.message, "tool_calls", None) or []
+                ]
+                if tool_calls:
+                    span.attributes["tool_calls"] = ",".join(tool_calls)
+
+                return response
+
+        client.create = traced_create
+
+    wrap_client(agent, trace_calls)
+
+
+def traced_tool(function):
+    """
+    Records the calls to a swarm tool as spans of the trace named by the "trace_id"
+    context variable, with the agent it hands off to.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        context_variables = kwargs.get("context_variables")
+        trace = tracer.find(context_variables.get("trace_id")) if context_variables is not None else None
+
+        if trace is None:
+            return function(*args, **kwargs)
+
+        with trace.span(function.__name__, "tool_call") as span:
+            result = function(*args, **kwargs)
+            target = getattr(result, "target", None)
+
+            if target is not None:
+                span.attributes["handoff"] = getattr(target, "agent_name", None) or type(target).__name__
+
+            return result
+
+    return wrapper